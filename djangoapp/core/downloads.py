@@ -0,0 +1,206 @@
+# core/downloads.py
+"""
+Entrega de arquivos protegidos (relatórios, XMLs) depois da checagem de permissão.
+
+A view continua fazendo a autorização (grupo, empresa); a transferência dos
+bytes pode ficar com o servidor web da frente, conforme DOWNLOAD_MODO:
+
+- 'django' (padrão): o próprio Django envia o arquivo, em partes;
+- 'nginx': resposta vazia com X-Accel-Redirect para uma location `internal`
+  que aponta para o MEDIA_ROOT (DOWNLOAD_ACCEL_PREFIXO);
+- 'sendfile': resposta vazia com X-Sendfile (Apache mod_xsendfile, lighttpd).
+
+Em todos os modos a resposta leva ETag e Last-Modified e atende
+If-None-Match / If-Modified-Since com 304. No modo 'django', Range e If-Range
+são tratados aqui (206 / 416); nos outros, pelo servidor web. O ETag segue o
+formato do nginx ("<mtime hex>-<tamanho hex>"): o mesmo arquivo tem o mesmo
+validador em qualquer modo e um download interrompido pode ser retomado.
+"""
+import mimetypes
+import os
+import re
+from io import BytesIO
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+_RE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_BLOCO = 64 * 1024
+
+# Range pedido começa depois do fim do arquivo
+_INSATISFAZIVEL = object()
+
+
+def _etag(ultima_modificacao: int, tamanho: int) -> str:
+    return f'"{ultima_modificacao:x}-{tamanho:x}"'
+
+
+def _intervalo(request, tamanho: int, etag: str, ultima_modificacao: int):
+    """
+    Interpreta o cabeçalho Range (um único intervalo de bytes).
+
+    Returns:
+        None para enviar o arquivo inteiro, (inicio, fim) inclusivo
+        ou _INSATISFAZIVEL
+    """
+    cabecalho = request.META.get('HTTP_RANGE', '').replace(' ', '')
+    if not cabecalho or request.method not in ('GET', 'HEAD'):
+        return None
+
+    # If-Range: só retoma se o arquivo ainda for o mesmo; senão vai inteiro
+    if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != ultima_modificacao:
+        return None
+
+    # Vários intervalos ou sintaxe inválida: o arquivo inteiro também é uma resposta válida
+    encontrado = _RE_RANGE.match(cabecalho)
+    if not encontrado:
+        return None
+    inicio, fim = encontrado.groups()
+
+    if not inicio:
+        # bytes=-N: os últimos N bytes
+        if not fim:
+            return None
+        sufixo = int(fim)
+        if sufixo == 0 or tamanho == 0:
+            return _INSATISFAZIVEL
+        return max(tamanho - sufixo, 0), tamanho - 1
+
+    inicio = int(inicio)
+    if fim and int(fim) < inicio:
+        return None
+    if inicio >= tamanho:
+        return _INSATISFAZIVEL
+    fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+    return inicio, fim
+
+
+def _ler_intervalo(abrir, inicio: int, fim: int):
+    with abrir() as arquivo:
+        arquivo.seek(inicio)
+        restante = fim - inicio + 1
+        while restante > 0:
+            bloco = arquivo.read(min(_BLOCO, restante))
+            if not bloco:
+                break
+            restante -= len(bloco)
+            yield bloco
+
+
+def _cabecalhos(response, nome_download: str, etag: str, ultima_modificacao: int):
+    response['Content-Disposition'] = content_disposition_header(True, nome_download)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(ultima_modificacao)
+    response['Accept-Ranges'] = 'bytes'
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+def _responder(request, abrir, tamanho, nome_download, content_type, etag, ultima_modificacao, caminho=None):
+    condicional = get_conditional_response(request, etag=etag, last_modified=ultima_modificacao)
+    if condicional is not None:
+        # 304 / 412
+        condicional['ETag'] = etag
+        condicional['Last-Modified'] = http_date(ultima_modificacao)
+        return condicional
+
+    modo = settings.DOWNLOAD_MODO
+    if caminho is not None and modo in ('nginx', 'sendfile'):
+        # O servidor web envia os bytes (e cuida do Range); aqui só os cabeçalhos
+        response = HttpResponse(content_type=content_type)
+        if modo == 'nginx':
+            relativo = os.path.relpath(caminho, settings.MEDIA_ROOT).replace(os.sep, '/')
+            response['X-Accel-Redirect'] = quote(f"{settings.DOWNLOAD_ACCEL_PREFIXO.rstrip('/')}/{relativo}")
+        else:
+            response['X-Sendfile'] = caminho
+        return _cabecalhos(response, nome_download, etag, ultima_modificacao)
+
+    intervalo = _intervalo(request, tamanho, etag, ultima_modificacao)
+    if intervalo is _INSATISFAZIVEL:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{tamanho}"
+        return response
+
+    if intervalo is None:
+        response = FileResponse(abrir(), content_type=content_type)
+    else:
+        inicio, fim = intervalo
+        response = StreamingHttpResponse(
+            _ler_intervalo(abrir, inicio, fim), status=206, content_type=content_type
+        )
+        response['Content-Range'] = f"bytes {inicio}-{fim}/{tamanho}"
+        response['Content-Length'] = fim - inicio + 1
+
+    return _cabecalhos(response, nome_download, etag, ultima_modificacao)
+
+
+def servir_arquivo(request, arquivo, nome_download: str = None, content_type: str = None):
+    """
+    Resposta de download de um arquivo em disco, já autorizado pela view.
+
+    Args:
+        request: HttpRequest
+        arquivo: FieldFile de um storage em sistema de arquivos
+        nome_download: Nome sugerido ao navegador (padrão: nome do arquivo)
+        content_type: Tipo do conteúdo (padrão: deduzido do nome)
+
+    Returns:
+        FileResponse / StreamingHttpResponse (206), resposta com X-Accel-Redirect
+        ou X-Sendfile, 304 ou 416
+
+    Raises:
+        Http404: Se o arquivo não existir no disco
+    """
+    caminho = arquivo.path
+    try:
+        estado = os.stat(caminho)
+    except FileNotFoundError:
+        raise Http404("Arquivo não encontrado.")
+
+    nome_download = nome_download or os.path.basename(arquivo.name)
+    content_type = content_type or mimetypes.guess_type(nome_download)[0] or 'application/octet-stream'
+    ultima_modificacao = int(estado.st_mtime)
+
+    return _responder(
+        request,
+        abrir=lambda: open(caminho, 'rb'),
+        tamanho=estado.st_size,
+        nome_download=nome_download,
+        content_type=content_type,
+        etag=_etag(ultima_modificacao, estado.st_size),
+        ultima_modificacao=ultima_modificacao,
+        caminho=caminho,
+    )
+
+
+def servir_conteudo(request, conteudo: bytes, nome_download: str, content_type: str, ultima_modificacao: int):
+    """
+    Resposta de download de um conteúdo já em memória (sempre enviado pelo Django).
+
+    Usado quando o arquivo em disco não é o que o usuário recebe, como os XMLs
+    compactados: o servidor web entregaria o .gz/.zst em vez do XML.
+
+    Args:
+        request: HttpRequest
+        conteudo: Bytes a enviar
+        nome_download: Nome sugerido ao navegador
+        content_type: Tipo do conteúdo
+        ultima_modificacao: Timestamp do arquivo de origem (Last-Modified e ETag)
+
+    Returns:
+        FileResponse / StreamingHttpResponse (206), 304 ou 416
+    """
+    ultima_modificacao = int(ultima_modificacao)
+    return _responder(
+        request,
+        abrir=lambda: BytesIO(conteudo),
+        tamanho=len(conteudo),
+        nome_download=nome_download,
+        content_type=content_type,
+        etag=_etag(ultima_modificacao, len(conteudo)),
+        ultima_modificacao=ultima_modificacao,
+    )
@@ -1,10 +1,12 @@
 from django.contrib import admin
-from .models import ContaPagar, Filial, Transacao, Fornecedor, TipoPagamento, RelatorioFaturamentoMensal, CertificadoDigital, NotaFiscal, ConfiguracaoNFe
+from .models import ContaPagar, Filial, Transacao, Fornecedor, TipoPagamento, RelatorioFaturamentoMensal, CertificadoDigital, NotaFiscal, ConfiguracaoNFe, ConsultaNFe, SincronizacaoNFe, NotaFiscalItem
 from accounts.models import Empresa
 import openpyxl
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
 from datetime import datetime
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.utils.html import format_html
 from .forms import ImportarContasPagarForm
 from django.contrib import messages
 from django.urls import path
@@ -228,15 +230,27 @@ class CertificadoDigitalAdmin(admin.ModelAdmin):
     esta_vencido.boolean = True
 
 
+class NotaFiscalItemInline(admin.TabularInline):
+    model = NotaFiscalItem
+    extra = 0
+    can_delete = False
+    fields = ['numero_item', 'codigo_produto', 'descricao', 'ncm', 'cfop', 'unidade', 'quantidade', 'valor_unitario', 'valor_total']
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(NotaFiscal)
 class NotaFiscalAdmin(admin.ModelAdmin):
     list_display = ['numero', 'data_emissao', 'emitente_nome', 'valor_total', 'status', 'filial', 'importado_em']
     list_filter = ['empresa', 'status', 'tipo_documento', 'filial', 'data_emissao']
     search_fields = ['numero', 'chave_acesso', 'emitente_nome', 'emitente_cnpj']
-    readonly_fields = ['importado_em', 'importado_por', 'atualizado_em', 'chave_formatada']
+    readonly_fields = ['importado_em', 'importado_por', 'atualizado_em', 'chave_formatada', 'xml_download']
     date_hierarchy = 'data_emissao'
     ordering = ['-data_emissao']
     actions = ['marcar_como_vinculado', 'marcar_como_descartado']
+    inlines = [NotaFiscalItemInline]
 
     fieldsets = (
         ('Identificação', {
@@ -252,7 +266,7 @@ class NotaFiscalAdmin(admin.ModelAdmin):
             'fields': ('valor_total', 'valor_desconto', 'valor_liquido')
         }),
         ('Controle', {
-            'fields': ('status', 'conta_pagar', 'nsu', 'arquivo_xml', 'observacoes')
+            'fields': ('status', 'conta_pagar', 'nsu', 'xml_download', 'observacoes')
         }),
         ('Auditoria', {
             'fields': ('importado_em', 'importado_por', 'atualizado_em'),
@@ -260,6 +274,30 @@ class NotaFiscalAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('<int:pk>/xml/', self.admin_site.admin_view(self.xml_view), name='financeiro_notafiscal_xml'),
+        ]
+        return custom_urls + urls
+
+    def xml_view(self, request, pk):
+        """Download do XML descompactado (o arquivo em disco fica compactado)"""
+        nota = get_object_or_404(NotaFiscal, pk=pk)
+        if not self.has_view_permission(request, nota) or not nota.arquivo_xml:
+            raise Http404
+
+        response = HttpResponse(nota.arquivo_xml.read(), content_type='application/xml')
+        response['Content-Disposition'] = f'attachment; filename="nfe_{nota.chave_acesso}.xml"'
+        return response
+
+    def xml_download(self, obj):
+        if not obj.pk or not obj.arquivo_xml:
+            return '-'
+        url = reverse('admin:financeiro_notafiscal_xml', args=[obj.pk])
+        return format_html('<a href="{}">nfe_{}.xml</a>', url, obj.chave_acesso)
+    xml_download.short_description = 'Arquivo XML'
+
     def marcar_como_vinculado(self, request, queryset):
         count = queryset.update(status='vinculado')
         self.message_user(request, f"{count} nota(s) marcada(s) como vinculada(s).", level=messages.SUCCESS)
@@ -313,6 +351,7 @@ class ConfiguracaoNFeAdmin(admin.ModelAdmin):
                 "busca_historica_ativa",
                 "busca_historica_status",
                 "busca_historica_progresso",
+                "busca_historica_nsu",
             )
         }),
         ("Estatísticas", {
@@ -338,3 +377,40 @@ class ConfiguracaoNFeAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return True
 
+
+
+@admin.register(ConsultaNFe)
+class ConsultaNFeAdmin(admin.ModelAdmin):
+    list_display = [
+        "id",
+        "certificado",
+        "status",
+        "documentos_recebidos",
+        "importados",
+        "duplicados",
+        "solicitado_por",
+        "criado_em",
+        "finalizado_em"
+    ]
+    list_filter = ["status", "certificado__empresa"]
+    search_fields = ["certificado__filial__nome", "certificado__filial__cnpj"]
+    readonly_fields = [f.name for f in ConsultaNFe._meta.fields]
+
+
+@admin.register(SincronizacaoNFe)
+class SincronizacaoNFeAdmin(admin.ModelAdmin):
+    list_display = [
+        "iniciado_em",
+        "certificado",
+        "tipo",
+        "status",
+        "tempo_total",
+        "chamadas_dist_nsu",
+        "chamadas_cons_chave",
+        "documentos_recebidos",
+        "importados",
+        "duplicados"
+    ]
+    list_filter = ["tipo", "status", "certificado__empresa"]
+    search_fields = ["certificado__filial__nome", "certificado__filial__cnpj"]
+    readonly_fields = [f.name for f in SincronizacaoNFe._meta.fields]
@@ -7,3 +7,4 @@ class FinanceiroConfig(AppConfig):
 
     def ready(self):
         import financeiro.signals  # Carrega os signals
+        import financeiro.busca  # Registra o lookup __busca
@@ -0,0 +1,31 @@
+"""
+Busca por trecho de texto sem diferenciar maiúsculas nem acentos.
+
+    Fornecedor.objects.filter(nome__busca='joao')   # encontra "JOÃO DA SILVA"
+
+No PostgreSQL o lookup gera f_unaccent(coluna) ILIKE f_unaccent('%termo%'),
+exatamente a expressão dos índices GIN de trigramas (pg_trgm) criados na
+migração 0020_busca_trigrama. f_unaccent é um invólucro IMMUTABLE de
+unaccent(), que é só STABLE e não pode ser usado em índices.
+
+O icontains padrão gera UPPER(coluna::text) LIKE UPPER(...), que não usa esses
+índices. Em outros bancos __busca se comporta como icontains (sem ignorar acentos).
+"""
+from django.db.models import CharField, TextField
+from django.db.models.lookups import IContains
+
+
+class BuscaSemAcento(IContains):
+    lookup_name = 'busca'
+
+    def as_sql(self, compiler, connection):
+        return IContains(self.lhs, self.rhs).as_sql(compiler, connection)
+
+    def as_postgresql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"f_unaccent({lhs}) ILIKE f_unaccent({rhs})", (*lhs_params, *rhs_params)
+
+
+CharField.register_lookup(BuscaSemAcento)
+TextField.register_lookup(BuscaSemAcento)
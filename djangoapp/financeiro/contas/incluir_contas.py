@@ -47,7 +47,7 @@ def generic_autocomplete(request, model_name):
     queryset = Model.objects.filter(empresa=empresa)
     
     if hasattr(Model, 'nome'):
-        queryset = queryset.filter(nome__icontains=q)
+        queryset = queryset.filter(nome__busca=q)
     else:
         return JsonResponse({'results': []})
 
@@ -4,20 +4,27 @@ Usa Fernet (criptografia simétrica) com chave derivada do SECRET_KEY do Django.
 """
 from cryptography.fernet import Fernet
 from django.conf import settings
+from functools import lru_cache
 import hashlib
 import base64
 
 
+@lru_cache(maxsize=4)
+def _cipher_para_chave(secret_key: str) -> Fernet:
+    """Deriva o cipher Fernet de uma SECRET_KEY (memorizado por processo)."""
+    # Deriva uma chave de 32 bytes do SECRET_KEY
+    key = hashlib.sha256(secret_key.encode()).digest()
+    # Converte para base64 URL-safe (formato exigido pelo Fernet)
+    key_b64 = base64.urlsafe_b64encode(key)
+    return Fernet(key_b64)
+
+
 def _get_cipher():
     """
     Cria cipher Fernet usando SECRET_KEY do Django.
     A chave precisa ter exatamente 32 bytes URL-safe base64-encoded.
     """
-    # Deriva uma chave de 32 bytes do SECRET_KEY
-    key = hashlib.sha256(settings.SECRET_KEY.encode()).digest()
-    # Converte para base64 URL-safe (formato exigido pelo Fernet)
-    key_b64 = base64.urlsafe_b64encode(key)
-    return Fernet(key_b64)
+    return _cipher_para_chave(settings.SECRET_KEY)
 
 
 def encrypt_password(password: str) -> bytes:
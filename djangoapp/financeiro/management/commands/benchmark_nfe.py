@@ -0,0 +1,492 @@
+# financeiro/management/commands/benchmark_nfe.py
+import random
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from urllib3.connection import HTTPSConnection
+
+
+@contextmanager
+def contar_handshakes():
+    """Conta quantas conexões TLS novas são abertas dentro do bloco."""
+    contador = {'total': 0}
+    connect_original = HTTPSConnection.connect
+
+    def connect(conn, *args, **kwargs):
+        contador['total'] += 1
+        return connect_original(conn, *args, **kwargs)
+
+    HTTPSConnection.connect = connect
+    try:
+        yield contador
+    finally:
+        HTTPSConnection.connect = connect_original
+
+
+def metadados_findtext(xml):
+    """Extração anterior (um findtext por campo, com e sem namespace), usada como base de comparação."""
+    ns = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
+
+    def buscar_texto(xpath_com_ns, xpath_sem_ns):
+        valor = xml.findtext(xpath_com_ns, namespaces=ns)
+        if valor is None:
+            valor = xml.findtext(xpath_sem_ns)
+        return valor
+
+    return {
+        'chave_acesso': buscar_texto('.//nfe:chNFe', './/{*}chNFe') or '',
+        'numero': buscar_texto('.//nfe:nNF', './/{*}nNF') or '',
+        'serie': buscar_texto('.//nfe:serie', './/{*}serie') or '',
+        'dhEmi': buscar_texto('.//nfe:dhEmi', './/{*}dhEmi'),
+        'emitente_cnpj': buscar_texto('.//nfe:emit/nfe:CNPJ', './/{*}emit/{*}CNPJ') or '',
+        'emitente_nome': buscar_texto('.//nfe:emit/nfe:xNome', './/{*}emit/{*}xNome') or '',
+        'valor_total': buscar_texto('.//nfe:total/nfe:ICMSTot/nfe:vNF', './/{*}total/{*}ICMSTot/{*}vNF'),
+        'valor_desconto': buscar_texto('.//nfe:total/nfe:ICMSTot/nfe:vDesc', './/{*}total/{*}ICMSTot/{*}vDesc'),
+    }
+
+
+def importar_por_linha(documentos, certificado):
+    """Importação anterior (exists() + save() por documento e por item), usada como base de comparação."""
+    from django.core.files.base import ContentFile
+    from financeiro.models import NotaFiscal, NotaFiscalItem
+    from financeiro.nfe.metadados import extrair_itens
+
+    importados = 0
+    duplicados = 0
+    with transaction.atomic():
+        for documento in documentos:
+            metadados = documento.extrair_metadados()
+            if NotaFiscal.objects.filter(chave_acesso=metadados['chave_acesso']).exists():
+                duplicados += 1
+                continue
+
+            nota = NotaFiscal(
+                empresa=certificado.empresa,
+                filial=certificado.filial,
+                chave_acesso=metadados['chave_acesso'],
+                numero=metadados['numero'],
+                serie=metadados['serie'],
+                data_emissao=metadados['data_emissao'],
+                emitente_cnpj=metadados['emitente_cnpj'],
+                emitente_nome=metadados['emitente_nome'],
+                valor_total=metadados['valor_total'],
+                valor_desconto=metadados['valor_desconto'],
+                valor_liquido=metadados['valor_liquido'],
+                nsu=metadados['nsu'],
+            )
+            nota.arquivo_xml.save(f"nfe_{metadados['chave_acesso']}.xml", ContentFile(documento.conteudo), save=False)
+            nota.save()
+            for item in extrair_itens(documento.xml):
+                NotaFiscalItem.da_nota(nota, item).save()
+            importados += 1
+    return importados, duplicados
+
+
+def zip_em_memoria(notas):
+    """Download em massa anterior (ZIP inteiro em BytesIO + read()), usado como base de comparação."""
+    zip_buffer = BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for nota in notas:
+            if nota.arquivo_xml:
+                zip_file.writestr(f"nfe_{nota.chave_acesso}.xml", nota.arquivo_xml.read())
+    zip_buffer.seek(0)
+    return zip_buffer.read()
+
+
+class Command(BaseCommand):
+    help = 'Executa benchmarks do fluxo de NF-e (SEFAZ, parsing e importação)'
+
+    CENARIOS = ['sessao', 'metadados', 'distribuicao', 'importacao', 'exportacao']
+
+    def add_arguments(self, parser):
+        parser.add_argument('cenario', choices=self.CENARIOS, help='Cenário a ser medido')
+        parser.add_argument('--certificado', type=int, help='ID do CertificadoDigital usado nas consultas')
+        parser.add_argument('--chamadas', type=int, default=100, help='Quantidade de chamadas SOAP (padrão: 100)')
+        parser.add_argument('--pfx', help='Arquivo PFX usado no lugar de --certificado (ex.: o do simulador)')
+        parser.add_argument('--senha', default='simulador', help='Senha do --pfx (padrão: simulador)')
+        parser.add_argument('--cnpj', default='12345678000199', help='CNPJ consultado com --pfx')
+        parser.add_argument('--documentos', type=int, default=10000, help='Quantidade de documentos (padrão: 10000)')
+        parser.add_argument('--itens', type=int, default=20, help='Itens (det) por procNFe (padrão: 20)')
+        parser.add_argument(
+            '--resumos', type=float, default=0.3,
+            help='Proporção de resNFe entre os documentos gerados (padrão: 0.3)'
+        )
+        parser.add_argument('--lote', type=int, default=50, help='Documentos por lote na importação (padrão: 50)')
+        parser.add_argument(
+            '--url',
+            help='URL alternativa do NFeDistribuicaoDFe. Evite a SEFAZ real: '
+                 'muitas chamadas seguidas geram o erro 656 (Consumo Indevido)'
+        )
+
+    def handle(self, *args, **options):
+        cenario = options['cenario']
+        getattr(self, f'benchmark_{cenario}')(options)
+
+    def _obter_certificado(self, options):
+        from financeiro.models import CertificadoDigital
+
+        if not options.get('certificado'):
+            raise CommandError('Informe o certificado com --certificado <id>')
+        try:
+            return CertificadoDigital.objects.select_related('filial').get(pk=options['certificado'])
+        except CertificadoDigital.DoesNotExist:
+            raise CommandError(f"Certificado {options['certificado']} não encontrado")
+
+    def benchmark_sessao(self, options):
+        """Compara requests_pkcs12.post por chamada com a sessão mTLS reaproveitada."""
+        import requests_pkcs12
+        from financeiro.crypto import decrypt_password
+        from financeiro.nfe.sefaz_client import SefazClient
+
+        certificado = self._obter_certificado(options)
+        chamadas = options['chamadas']
+        senha = decrypt_password(certificado.senha_encrypted)
+
+        client = SefazClient(
+            certificado_path=certificado.arquivo_pfx.path,
+            certificado_senha=senha,
+            cnpj=certificado.filial.cnpj,
+            uf_cod=certificado.uf_codigo
+        )
+        if options.get('url'):
+            client.url = options['url']
+
+        envelope = client._criar_envelope_soap(certificado.ultimo_nsu).encode('utf-8')
+        headers = {"Content-Type": "application/soap+xml; charset=utf-8"}
+
+        self.stdout.write(f'\n⏱️  {chamadas} chamada(s) contra {client.url}\n')
+
+        # 1. Uma conexão (e um parse do PFX) por chamada
+        with contar_handshakes() as handshakes_avulsos:
+            inicio = time.perf_counter()
+            for _ in range(chamadas):
+                requests_pkcs12.post(
+                    client.url,
+                    data=envelope,
+                    headers=headers,
+                    pkcs12_filename=client.certificado_path,
+                    pkcs12_password=client.certificado_senha,
+                    timeout=60
+                )
+            tempo_avulso = time.perf_counter() - inicio
+
+        # 2. Sessão keep-alive do SefazClient
+        with client, contar_handshakes() as handshakes_sessao:
+            inicio = time.perf_counter()
+            for _ in range(chamadas):
+                client._obter_sessao().post(client.url, data=envelope, timeout=60)
+            tempo_sessao = time.perf_counter() - inicio
+
+        economia_por_100 = (tempo_avulso - tempo_sessao) / chamadas * 100
+
+        self.stdout.write('📋 Resultado:')
+        self.stdout.write(
+            f'   • requests_pkcs12.post: {handshakes_avulsos["total"]} handshake(s), '
+            f'{tempo_avulso:.2f}s ({tempo_avulso / chamadas * 1000:.1f} ms/chamada)'
+        )
+        self.stdout.write(
+            f'   • Sessão reaproveitada: {handshakes_sessao["total"]} handshake(s), '
+            f'{tempo_sessao:.2f}s ({tempo_sessao / chamadas * 1000:.1f} ms/chamada)'
+        )
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Economia a cada 100 chamadas: {economia_por_100:.2f}s\n'))
+
+    def _gerar_conteudos(self, options):
+        """Gera procNFe/resNFe sintéticos (bytes), com emissão nos últimos 90 dias."""
+        from financeiro.nfe.amostras import gerar_proc_nfe, gerar_res_nfe
+
+        rnd = random.Random(42)
+        agora = datetime.now().astimezone()
+        documentos = []
+        for numero in range(1, options['documentos'] + 1):
+            emissao = agora - timedelta(days=rnd.randint(0, 90))
+            cnpj_emitente = f"{rnd.randint(10000000, 99999999)}0001{rnd.randint(10, 99)}"
+            if rnd.random() < options['resumos']:
+                conteudo = gerar_res_nfe(numero, cnpj_emitente, emissao=emissao)
+            else:
+                conteudo = gerar_proc_nfe(numero, cnpj_emitente, '12345678000199', emissao=emissao, itens=options['itens'])
+            documentos.append(conteudo)
+        return documentos
+
+    def _gerar_documentos(self, options):
+        """Gera procNFe/resNFe sintéticos já parseados."""
+        from lxml import etree
+
+        return [etree.fromstring(conteudo) for conteudo in self._gerar_conteudos(options)]
+
+    def benchmark_metadados(self, options):
+        """Compara a extração com findtext por campo com o extrator de passada única."""
+        from financeiro.nfe.metadados import extrair_metadados
+
+        self.stdout.write(
+            f"\n⏱️  Gerando {options['documentos']} documento(s) "
+            f"({options['resumos']:.0%} resNFe, {options['itens']} itens por procNFe)..."
+        )
+        documentos = self._gerar_documentos(options)
+
+        # Confere que as duas extrações concordam nos campos que a anterior preenchia
+        for xml in documentos:
+            anterior = metadados_findtext(xml)
+            atual = extrair_metadados(xml)
+            for campo in ('chave_acesso', 'numero', 'serie'):
+                if anterior[campo] != atual[campo]:
+                    raise CommandError(f"Divergência em {campo}: {anterior[campo]!r} != {atual[campo]!r}")
+            if anterior['emitente_cnpj'] and anterior['emitente_cnpj'] != atual['emitente_cnpj']:
+                raise CommandError(f"Divergência no emitente de {atual['chave_acesso']}")
+
+        inicio = time.perf_counter()
+        for xml in documentos:
+            metadados_findtext(xml)
+        tempo_findtext = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        for xml in documentos:
+            extrair_metadados(xml)
+        tempo_passada_unica = time.perf_counter() - inicio
+
+        total = len(documentos)
+        self.stdout.write('📋 Resultado:')
+        self.stdout.write(
+            f'   • findtext por campo: {tempo_findtext:.3f}s ({tempo_findtext / total * 1e6:.1f} µs/documento)'
+        )
+        self.stdout.write(
+            f'   • Passada única:      {tempo_passada_unica:.3f}s ({tempo_passada_unica / total * 1e6:.1f} µs/documento)'
+        )
+        self.stdout.write(self.style.SUCCESS(f'\n✅ {tempo_findtext / tempo_passada_unica:.1f}x mais rápido\n'))
+
+    def _obter_cliente(self, options):
+        """SefazClient do --pfx informado ou do CertificadoDigital de --certificado."""
+        from financeiro.nfe.sefaz_client import SefazClient
+
+        if options.get('pfx'):
+            client = SefazClient(
+                certificado_path=options['pfx'],
+                certificado_senha=options['senha'],
+                cnpj=options['cnpj'],
+                uf_cod='42'
+            )
+        else:
+            client = SefazClient.do_certificado(self._obter_certificado(options))
+
+        if options.get('url'):
+            client.url = options['url']
+        return client
+
+    def benchmark_distribuicao(self, options):
+        """
+        Mede o throughput da distribuição (distNSU + consChNFe dos resumos + metadados),
+        sem gravar no banco. Use com o simulador: python manage.py simular_sefaz
+        """
+        from financeiro.nfe.resolver import resolver_resumos
+
+        client = self._obter_cliente(options)
+        self.stdout.write(f'\n⏱️  Distribuição completa a partir do NSU zero contra {client.url}\n')
+
+        lotes = 0
+        documentos = 0
+        resumos = 0
+        with client:
+            distribuicao = client.distribuicao("000000000000000")
+            inicio = time.perf_counter()
+            for lote in distribuicao.lotes():
+                lotes += 1
+                recebidos = list(lote)
+                resumos += sum(1 for documento in recebidos if documento.eh_resumo)
+                for documento in resolver_resumos(client, recebidos):
+                    documento.extrair_metadados()
+                    documentos += 1
+            tempo = time.perf_counter() - inicio
+
+        if distribuicao.erro:
+            self.stdout.write(self.style.WARNING(f'   ⚠️ Interrompido: {distribuicao.erro}'))
+        elif distribuicao.consumo_indevido:
+            self.stdout.write(self.style.WARNING('   ⚠️ Interrompido por 656 (Consumo Indevido)'))
+
+        self.stdout.write('📋 Resultado:')
+        self.stdout.write(f'   • {lotes} lote(s), {documentos} documento(s) ({resumos} resumo(s) resolvido(s))')
+        self.stdout.write(f'   • NSU final: {distribuicao.ult_nsu} / {distribuicao.max_nsu}')
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✅ {tempo:.2f}s ({documentos / tempo if tempo else 0:.1f} documentos/s)\n'
+        ))
+
+    def benchmark_importacao(self, options):
+        """
+        Compara a importação por documento (exists() + save()) com o ImportadorNFe
+        (chave_acesso__in + bulk_create por lote), ambos gravando notas, itens e
+        XMLs. Usa empresa/filial/certificado temporários (removidos ao final) e
+        grava os XMLs em um diretório temporário. O ImportadorNFe roda fora de
+        transação para que a gravação dos XMLs após o commit entre na medição.
+        """
+        from accounts.models import Empresa
+        from financeiro.models import CertificadoDigital, Filial, NotaFiscal
+        from financeiro.nfe.armazenamento import XMLNotaFiscalStorage
+        from financeiro.nfe.importacao import ImportadorNFe
+        from financeiro.nfe.sefaz_client import DocumentoDFe
+
+        tamanho_lote = options['lote']
+        self.stdout.write(
+            f"\n⏱️  Gerando {options['documentos']} documento(s) "
+            f"({options['resumos']:.0%} resNFe, lotes de {tamanho_lote})..."
+        )
+        conteudos = self._gerar_conteudos(options)
+
+        def lotes():
+            for inicio in range(0, len(conteudos), tamanho_lote):
+                yield [
+                    DocumentoDFe(conteudo, nsu=f"{inicio + posicao + 1:015d}")
+                    for posicao, conteudo in enumerate(conteudos[inicio:inicio + tamanho_lote])
+                ]
+
+        campo_xml = NotaFiscal._meta.get_field('arquivo_xml')
+        storage_original = campo_xml.storage
+
+        with tempfile.TemporaryDirectory() as diretorio:
+            campo_xml.storage = XMLNotaFiscalStorage(location=diretorio)
+            empresa = Empresa.objects.create(nome='BENCHMARK NFE', cnpj='BENCHMARK-NFE')
+            try:
+                filial = Filial.objects.create(empresa=empresa, nome='BENCHMARK NFE', cnpj='00000000000191')
+                certificado = CertificadoDigital.objects.create(
+                    empresa=empresa,
+                    filial=filial,
+                    arquivo_pfx='benchmark.pfx',
+                    senha_encrypted=b'',
+                    uf_codigo='42',
+                    data_validade=(datetime.now() + timedelta(days=365)).date(),
+                )
+
+                # 1. Por documento (desfeito antes da próxima medição)
+                with transaction.atomic():
+                    inicio = time.perf_counter()
+                    importados_linha = 0
+                    for lote in lotes():
+                        importados_linha += importar_por_linha(lote, certificado)[0]
+                    tempo_linha = time.perf_counter() - inicio
+                    transaction.set_rollback(True)
+
+                # 2. ImportadorNFe
+                importador = ImportadorNFe(certificado)
+                inicio = time.perf_counter()
+                for lote in lotes():
+                    importador.importar_lote(lote)
+                tempo_lote = time.perf_counter() - inicio
+
+                # 3. Reimportação: todos os documentos já existem
+                reimportacao = ImportadorNFe(certificado)
+                inicio = time.perf_counter()
+                for lote in lotes():
+                    reimportacao.importar_lote(lote)
+                tempo_duplicados = time.perf_counter() - inicio
+            finally:
+                campo_xml.storage = storage_original
+                # Remove notas, itens e cadastros temporários
+                empresa.delete()
+
+        total = len(conteudos)
+        self.stdout.write('📋 Resultado:')
+        self.stdout.write(
+            f'   • Por documento: {importados_linha} importada(s) em {tempo_linha:.2f}s '
+            f'({total / tempo_linha:.0f} documentos/s)'
+        )
+        self.stdout.write(
+            f'   • ImportadorNFe: {importador.total.importados} importada(s), {importador.total.itens} item(ns) '
+            f'em {tempo_lote:.2f}s ({total / tempo_lote:.0f} documentos/s)'
+        )
+        self.stdout.write(
+            f'   • Reimportação:  {reimportacao.total.duplicados} duplicada(s) em {tempo_duplicados:.2f}s '
+            f'({total / tempo_duplicados:.0f} documentos/s)'
+        )
+        self.stdout.write(self.style.SUCCESS(f'\n✅ {tempo_linha / tempo_lote:.1f}x mais rápido\n'))
+
+    def benchmark_exportacao(self, options):
+        """
+        Compara o download em massa anterior (ZIP em BytesIO) com o ZIP transmitido
+        em partes (gerar_zip_xmls), medindo o pico de memória alocada (tracemalloc).
+        As notas e os XMLs são temporários (diretório temporário + empresa removida ao final).
+        """
+        from accounts.models import Empresa
+        from financeiro.models import Filial, NotaFiscal
+        from financeiro.nfe.amostras import gerar_proc_nfe
+        from financeiro.nfe.armazenamento import XMLNotaFiscalStorage
+        from financeiro.nfe.exportacao import gerar_zip_xmls
+        from django.core.files.base import ContentFile
+
+        total = options['documentos']
+        campo_xml = NotaFiscal._meta.get_field('arquivo_xml')
+        storage_original = campo_xml.storage
+
+        with tempfile.TemporaryDirectory() as diretorio:
+            campo_xml.storage = XMLNotaFiscalStorage(location=diretorio)
+            empresa = Empresa.objects.create(nome='BENCHMARK NFE', cnpj='BENCHMARK-NFE')
+            try:
+                filial = Filial.objects.create(empresa=empresa, nome='BENCHMARK NFE', cnpj='00000000000191')
+
+                self.stdout.write(f"\n⏱️  Gerando {total} nota(s) com XML ({options['itens']} itens cada)...")
+                rnd = random.Random(42)
+                agora = datetime.now().astimezone()
+                pendentes = []
+                for numero in range(1, total + 1):
+                    chave = f"{numero:044d}"
+                    nota = NotaFiscal(
+                        empresa=empresa, filial=filial, chave_acesso=chave, numero=str(numero), serie='1',
+                        data_emissao=agora - timedelta(minutes=numero), emitente_cnpj='11222333000181',
+                        emitente_nome='BENCHMARK', valor_total=0, valor_liquido=0,
+                    )
+                    conteudo = gerar_proc_nfe(
+                        numero, f"{rnd.randint(10000000, 99999999)}000191", '12345678000199',
+                        emissao=nota.data_emissao, itens=options['itens']
+                    )
+                    nota.arquivo_xml.save(f"nfe_{chave}.xml", ContentFile(conteudo), save=False)
+                    pendentes.append(nota)
+                    if len(pendentes) >= 1000:
+                        NotaFiscal.objects.bulk_create(pendentes)
+                        pendentes = []
+                NotaFiscal.objects.bulk_create(pendentes)
+
+                notas = NotaFiscal.objects.filter(empresa=empresa)
+
+                # 1. ZIP inteiro em memória
+                tracemalloc.start()
+                inicio = time.perf_counter()
+                tamanho_memoria = len(zip_em_memoria(notas.iterator()))
+                tempo_memoria = time.perf_counter() - inicio
+                pico_memoria = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                # 2. ZIP transmitido: registra a memória em uso ao longo do envio
+                tracemalloc.start()
+                inicio = time.perf_counter()
+                tamanho_streaming = 0
+                amostras = []
+                for posicao, parte in enumerate(gerar_zip_xmls(notas), start=1):
+                    tamanho_streaming += len(parte)
+                    if posicao % max(total // 5, 1) == 0:
+                        amostras.append(tracemalloc.get_traced_memory()[0])
+                tempo_streaming = time.perf_counter() - inicio
+                pico_streaming = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            finally:
+                campo_xml.storage = storage_original
+                empresa.delete()
+
+        mb = 1024 * 1024
+        self.stdout.write('📋 Resultado:')
+        self.stdout.write(
+            f'   • ZIP em memória: {tamanho_memoria / mb:.1f} MB em {tempo_memoria:.2f}s, '
+            f'pico de {pico_memoria / mb:.1f} MB'
+        )
+        self.stdout.write(
+            f'   • ZIP transmitido: {tamanho_streaming / mb:.1f} MB em {tempo_streaming:.2f}s, '
+            f'pico de {pico_streaming / mb:.1f} MB'
+        )
+        self.stdout.write(
+            '   • Memória durante o envio (a cada 20%): ' + ', '.join(f'{valor / mb:.1f} MB' for valor in amostras)
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✅ Pico de memória {pico_memoria / max(pico_streaming, 1):.0f}x menor\n'
+        ))
@@ -0,0 +1,118 @@
+# financeiro/management/commands/compactar_xmls_nfe.py
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = (
+        'Converte os XMLs de NotaFiscal gravados no formato antigo (notas_fiscais/%Y/%m/, sem compressão) '
+        'para o armazenamento compactado e distribuído pela chave de acesso'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--formato', choices=['gzip', 'zstd'],
+            help='Compressão dos novos arquivos (padrão: NFE_XML_COMPRESSAO)'
+        )
+        parser.add_argument('--lote', type=int, default=500, help='Notas por transação (padrão: 500)')
+        parser.add_argument('--limite', type=int, help='Converte no máximo N notas nesta execução')
+        parser.add_argument(
+            '--recompactar', action='store_true',
+            help='Também regrava arquivos já compactados em outro formato (ex.: gzip → zstd)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Apenas conta o que seria convertido')
+
+    def handle(self, *args, **options):
+        from financeiro.models import NotaFiscal
+        from financeiro.nfe.armazenamento import EXTENSOES, caminho_xml, formato_compressao, zstandard
+
+        formato = options['formato'] or formato_compressao()
+        if formato == 'zstd' and zstandard is None:
+            raise CommandError('O formato zstd exige o pacote zstandard (pip install zstandard)')
+
+        storage = NotaFiscal._meta.get_field('arquivo_xml').storage
+        notas = (
+            NotaFiscal.objects.exclude(arquivo_xml='')
+            .only('pk', 'chave_acesso', 'arquivo_xml')
+            .order_by('pk')
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'\n🗜️  Convertendo XMLs de notas fiscais para {formato}...\n'))
+
+        contagem = {'convertidas': 0, 'ja_convertidas': 0, 'sem_arquivo': 0}
+        bytes_antes = 0
+        bytes_depois = 0
+        diretorios_antigos = set()
+        lote = []
+
+        def gravar_lote():
+            # Os novos arquivos já estão no disco: aponta as notas para eles e só
+            # então remove os antigos. Se o comando parar no meio, basta rodar de novo.
+            with transaction.atomic():
+                NotaFiscal.objects.bulk_update([nota for nota, _ in lote], ['arquivo_xml'])
+            for _, antigo in lote:
+                storage.delete(antigo)
+                diretorios_antigos.add(os.path.dirname(storage.path(antigo)))
+            lote.clear()
+
+        for nota in notas.iterator(chunk_size=options['lote']):
+            if options['limite'] and contagem['convertidas'] >= options['limite']:
+                break
+
+            antigo = nota.arquivo_xml.name
+            novo = caminho_xml(nota.chave_acesso, formato)
+            ja_compactado = any(antigo.endswith(extensao) for extensao in EXTENSOES.values())
+            if antigo == novo or (ja_compactado and not options['recompactar']):
+                contagem['ja_convertidas'] += 1
+                continue
+
+            if not storage.exists(antigo):
+                self.stdout.write(self.style.WARNING(f'   ⚠️ Arquivo não encontrado: {antigo} (nota {nota.pk})'))
+                contagem['sem_arquivo'] += 1
+                continue
+
+            contagem['convertidas'] += 1
+            bytes_antes += storage.size(antigo)
+            if options['dry_run']:
+                continue
+
+            # Lê descompactado (o storage reconhece o formato) e grava no novo caminho
+            with storage.open(antigo) as arquivo:
+                conteudo = arquivo.read()
+            nota.arquivo_xml.name = storage.save(novo, ContentFile(conteudo))
+            bytes_depois += storage.size(nota.arquivo_xml.name)
+
+            lote.append((nota, antigo))
+            if len(lote) >= options['lote']:
+                gravar_lote()
+                self.stdout.write(f"   • {contagem['convertidas']} nota(s) convertida(s)...")
+
+        if lote:
+            gravar_lote()
+
+        # Remove os diretórios antigos (notas_fiscais/%Y/%m/) que ficaram vazios
+        for diretorio in sorted(diretorios_antigos, reverse=True):
+            for candidato in (diretorio, os.path.dirname(diretorio)):
+                if os.path.normpath(candidato) == os.path.normpath(settings.MEDIA_ROOT):
+                    break
+                try:
+                    os.rmdir(candidato)
+                except OSError:
+                    break
+
+        self.stdout.write('\n📋 Resultado:')
+        verbo = 'seriam convertidas' if options['dry_run'] else 'convertidas'
+        self.stdout.write(f"   • {contagem['convertidas']} nota(s) {verbo}")
+        self.stdout.write(f"   • {contagem['ja_convertidas']} já no formato novo")
+        if contagem['sem_arquivo']:
+            self.stdout.write(self.style.WARNING(f"   • {contagem['sem_arquivo']} sem arquivo no disco"))
+        if bytes_antes and not options['dry_run']:
+            self.stdout.write(
+                f'   • Espaço: {bytes_antes / 1024 / 1024:.1f} MB → {bytes_depois / 1024 / 1024:.1f} MB '
+                f'({bytes_depois / bytes_antes:.0%})'
+            )
+        self.stdout.write(self.style.SUCCESS('\n✅ Concluído!\n'))
@@ -0,0 +1,115 @@
+# financeiro/management/commands/extrair_itens_nfe.py
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+
+def _ler_itens(tarefa):
+    """
+    Lê e extrai os itens de um XML (executado nos processos do pool, sem acesso ao banco).
+
+    Args:
+        tarefa: (id da nota, nome do arquivo no storage)
+
+    Returns:
+        (id da nota, lista de itens ou None se o arquivo não puder ser lido)
+    """
+    from lxml import etree
+    from financeiro.nfe.armazenamento import xml_storage
+    from financeiro.nfe.metadados import extrair_itens
+
+    nota_id, nome = tarefa
+    try:
+        with xml_storage.open(nome) as arquivo:
+            return nota_id, extrair_itens(etree.fromstring(arquivo.read()))
+    except (OSError, etree.XMLSyntaxError) as e:
+        print(f"   ⚠️ Nota {nota_id}: {e}")
+        return nota_id, None
+
+
+class Command(BaseCommand):
+    help = 'Extrai para NotaFiscalItem os itens (det/prod) das notas já importadas, lendo os XMLs em paralelo'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processos', type=int, default=os.cpu_count() or 1,
+            help='Processos que leem os XMLs (padrão: número de CPUs)'
+        )
+        parser.add_argument('--lote', type=int, default=500, help='Notas por transação (padrão: 500)')
+        parser.add_argument('--limite', type=int, help='Processa no máximo N notas nesta execução')
+        parser.add_argument(
+            '--refazer', action='store_true',
+            help='Apaga e extrai novamente os itens de notas que já os possuem'
+        )
+
+    def handle(self, *args, **options):
+        from financeiro.models import NotaFiscal, NotaFiscalItem
+
+        notas = NotaFiscal.objects.exclude(arquivo_xml='')
+        if not options['refazer']:
+            notas = notas.filter(itens__isnull=True)
+        notas = notas.order_by('pk').values_list('pk', 'arquivo_xml', 'empresa_id', 'emitente_cnpj')
+        if options['limite']:
+            notas = notas[:options['limite']]
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n📦 Extraindo itens de NF-e com {options['processos']} processo(s)...\n"
+        ))
+
+        # Os processos do pool herdam o processo atual: nenhuma conexão aberta deve ir junto
+        connections.close_all()
+
+        inicio = time.perf_counter()
+        contagem = {'notas': 0, 'itens': 0, 'sem_itens': 0, 'falhas': 0}
+        lote = []
+
+        def gravar_lote(executor):
+            # Campos da nota copiados para o item
+            dados = {pk: (empresa_id, emitente_cnpj) for pk, _, empresa_id, emitente_cnpj in lote}
+            registros = []
+            processadas = []
+
+            tarefas = [(pk, nome) for pk, nome, _, _ in lote]
+            for nota_id, itens in executor.map(_ler_itens, tarefas, chunksize=20):
+                if itens is None:
+                    contagem['falhas'] += 1
+                    continue
+                processadas.append(nota_id)
+                if not itens:
+                    contagem['sem_itens'] += 1
+                empresa_id, emitente_cnpj = dados[nota_id]
+                registros.extend(
+                    NotaFiscalItem(nota_id=nota_id, empresa_id=empresa_id, emitente_cnpj=emitente_cnpj, **item)
+                    for item in itens
+                )
+
+            with transaction.atomic():
+                if options['refazer']:
+                    NotaFiscalItem.objects.filter(nota_id__in=processadas).delete()
+                NotaFiscalItem.objects.bulk_create(registros, batch_size=1000, ignore_conflicts=True)
+
+            contagem['notas'] += len(processadas)
+            contagem['itens'] += len(registros)
+            lote.clear()
+            self.stdout.write(f"   • {contagem['notas']} nota(s), {contagem['itens']} item(ns)...")
+
+        with ProcessPoolExecutor(max_workers=options['processos']) as executor:
+            for nota in notas.iterator(chunk_size=options['lote']):
+                lote.append(nota)
+                if len(lote) >= options['lote']:
+                    gravar_lote(executor)
+            if lote:
+                gravar_lote(executor)
+
+        segundos = time.perf_counter() - inicio
+        self.stdout.write('\n📋 Resultado:')
+        self.stdout.write(f"   • {contagem['notas']} nota(s) processada(s) em {segundos:.1f}s")
+        self.stdout.write(f"   • {contagem['itens']} item(ns) gravado(s)")
+        if contagem['sem_itens']:
+            self.stdout.write(f"   • {contagem['sem_itens']} nota(s) sem itens (resumos)")
+        if contagem['falhas']:
+            self.stdout.write(self.style.WARNING(f"   • {contagem['falhas']} arquivo(s) não lido(s)"))
+        self.stdout.write(self.style.SUCCESS('\n✅ Concluído!\n'))
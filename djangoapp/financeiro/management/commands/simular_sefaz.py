@@ -0,0 +1,71 @@
+# financeiro/management/commands/simular_sefaz.py
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Sobe um simulador local do NFeDistribuicaoDFe (SOAP 1.2 + mTLS) para testes de carga e regressão'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Endereço de escuta (padrão: 127.0.0.1)')
+        parser.add_argument('--porta', type=int, default=8443, help='Porta HTTPS (padrão: 8443)')
+        parser.add_argument(
+            '--diretorio',
+            default=os.path.join(settings.DATA_DIR, 'simulador_sefaz'),
+            help='Onde ficam a CA, o certificado do servidor e o PFX de teste'
+        )
+        parser.add_argument('--cnpj', default='12345678000199', help='CNPJ do PFX de cliente gerado')
+        parser.add_argument('--senha', default='simulador', help='Senha do PFX de cliente gerado')
+        parser.add_argument('--documentos', type=int, default=1000, help='NSUs disponíveis por CNPJ (padrão: 1000)')
+        parser.add_argument('--lote', type=int, default=50, help='Documentos por resposta distNSU (padrão: 50)')
+        parser.add_argument('--latencia', type=int, default=0, help='Latência adicionada por resposta, em ms')
+        parser.add_argument('--resumos', type=float, default=0.7, help='Proporção de resNFe (padrão: 0.7)')
+        parser.add_argument('--taxa-656', type=float, default=0.0, help='Probabilidade de responder 656 (0 a 1)')
+        parser.add_argument('--itens', type=int, default=20, help='Itens por procNFe (padrão: 20)')
+        parser.add_argument('--verbose-http', action='store_true', help='Registra cada requisição no console')
+
+    def handle(self, *args, **options):
+        from financeiro.nfe.simulador import ConfiguracaoSimulador, criar_servidor, gerar_certificados_teste
+
+        certificados = gerar_certificados_teste(options['diretorio'], options['cnpj'], options['senha'])
+
+        config = ConfiguracaoSimulador(
+            documentos=options['documentos'],
+            lote=options['lote'],
+            latencia=options['latencia'] / 1000,
+            proporcao_resumos=options['resumos'],
+            taxa_656=options['taxa_656'],
+            itens=options['itens'],
+        )
+        servidor = criar_servidor(options['host'], options['porta'], config, certificados, options['verbose_http'])
+
+        host = 'localhost' if options['host'] in ('127.0.0.1', '0.0.0.0') else options['host']
+        url = f"https://{host}:{options['porta']}/NFeDistribuicaoDFe/NFeDistribuicaoDFe.asmx"
+
+        self.stdout.write(self.style.SUCCESS('\n🧪 Simulador SEFAZ em execução\n'))
+        self.stdout.write(f'   • URL: {url}')
+        self.stdout.write(
+            f'   • {config.documentos} NSU(s) por CNPJ, lotes de {config.lote}, '
+            f'{config.proporcao_resumos:.0%} resNFe, latência {options["latencia"]} ms, 656: {config.taxa_656:.0%}'
+        )
+        self.stdout.write(f'   • PFX de teste: {certificados["cliente_pfx"]} (senha: {options["senha"]})')
+        self.stdout.write('\n📋 Para apontar a aplicação e as tasks para o simulador:')
+        self.stdout.write(f'   NFE_SEFAZ_URL={url}')
+        self.stdout.write(f'   NFE_SEFAZ_CA_BUNDLE={certificados["ca"]}')
+        self.stdout.write(
+            '   (para medir throughput, aumente também NFE_RATE_LIMIT_CAPACIDADE e NFE_RATE_LIMIT_POR_MINUTO)\n'
+        )
+
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            estado = servidor.RequestHandlerClass.estado
+            self.stdout.write(
+                f"\n📊 distNSU: {estado.requisicoes['distNSU']} | consChNFe: {estado.requisicoes['consChNFe']} "
+                f"| 656: {estado.requisicoes['656']}\n"
+            )
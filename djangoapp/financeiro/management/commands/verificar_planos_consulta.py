@@ -0,0 +1,272 @@
+# financeiro/management/commands/verificar_planos_consulta.py
+import re
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+# Nomes gerados: combinações destas palavras (com acentos, como nos XMLs e cadastros)
+PALAVRAS = [
+    'COMÉRCIO', 'INDÚSTRIA', 'DISTRIBUIDORA', 'ALIMENTOS', 'CONSTRUÇÃO', 'AÇÚCAR', 'JOÃO', 'JOSÉ',
+    'SÃO', 'PAULO', 'BRASÍLIA', 'MÁQUINAS', 'PEÇAS', 'SERVIÇOS', 'TRANSPORTES', 'LOGÍSTICA',
+    'ELÉTRICA', 'HIDRÁULICA', 'FARMÁCIA', 'POSTO', 'COMBUSTÍVEIS', 'PAPELARIA', 'INFORMÁTICA',
+    'CAFÉ', 'PANIFICAÇÃO', 'AGRÍCOLA', 'VEÍCULOS', 'TÊXTIL', 'CALÇADOS', 'MÓVEIS', 'GRÁFICA',
+]
+
+# Palavra rara (1 a cada 2000 nomes), buscada sem acento e em minúsculas
+PALAVRA_RARA = 'ZÉLIA'
+TERMO_RARO = 'zelia'
+
+
+class Command(BaseCommand):
+    help = (
+        'Confere com EXPLAIN ANALYZE se as consultas das listas, dashboard, tarefas e buscas usam '
+        'os índices esperados (PostgreSQL). Gera dados sintéticos numa transação desfeita ao final; '
+        'use um banco de homologação ou cópia, não o de produção'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--linhas', type=int, default=1_000_000,
+            help='Notas fiscais e contas a pagar geradas (fornecedores: 1/10 disso). Padrão: 1000000'
+        )
+        parser.add_argument(
+            '--empresas', type=int, default=10,
+            help='Empresas entre as quais as linhas são distribuídas; as consultas usam a primeira. Padrão: 10'
+        )
+        parser.add_argument('--planos', action='store_true', help='Mostra o plano de todas as consultas')
+
+    def handle(self, *args, **options):
+        from financeiro.models import NotaFiscal
+
+        if connection.vendor != 'postgresql':
+            raise CommandError('Os índices verificados só existem no PostgreSQL')
+
+        falhas = []
+        with transaction.atomic():
+            empresa = self._gerar_dados(options['linhas'], max(options['empresas'], 1))
+
+            # __busca ignora acentos e maiúsculas: 'zelia' encontra 'ZÉLIA'
+            notas = NotaFiscal.objects.filter(empresa=empresa)
+            encontradas = notas.filter(emitente_nome__busca=TERMO_RARO).count()
+            esperadas = notas.filter(emitente_nome__contains=PALAVRA_RARA).count()
+            if encontradas != esperadas:
+                falhas.append('Busca sem acento')
+            self.stdout.write(
+                f"   • Busca por '{TERMO_RARO}': {encontradas} nota(s) com '{PALAVRA_RARA}' (esperado {esperadas})"
+            )
+
+            self.stdout.write('\n🔎 Planos de consulta:')
+            for descricao, queryset, indices in self._consultas(empresa):
+                plano = queryset.explain(analyze=True)
+                tempo = re.search(r'Execution Time: ([\d.]+) ms', plano)
+                usados = [indice for indice in indices if indice in plano]
+
+                if not usados:
+                    falhas.append(descricao)
+                    self.stdout.write(self.style.ERROR(
+                        f"   ❌ {descricao}: nenhum de {', '.join(indices)}"
+                    ))
+                else:
+                    self.stdout.write(
+                        f"   ✅ {descricao}: {', '.join(usados)} ({tempo.group(1) if tempo else '?'} ms)"
+                    )
+                if not usados or options['planos']:
+                    self.stdout.write('\n'.join(f"        {linha}" for linha in plano.splitlines()))
+
+            # Nada do que foi gerado fica no banco
+            transaction.set_rollback(True)
+
+        if falhas:
+            raise CommandError(f"{len(falhas)} consulta(s) sem o índice esperado")
+        self.stdout.write(self.style.SUCCESS('\n✅ Todas as consultas usam os índices esperados\n'))
+
+    def _consultas(self, empresa):
+        """
+        Consultas verificadas: as mesmas das views e tarefas (a lista de NF-e usa o próprio
+        FiltroNotasFiscaisForm). Agregações são verificadas pelo SELECT com os mesmos filtros.
+
+        Returns:
+            Lista de (descrição, queryset, índices aceitos: ao menos um deve aparecer no plano)
+        """
+        from financeiro.models import ContaPagar, Fornecedor, NotaFiscal
+        from financeiro.nfe.forms import FiltroNotasFiscaisForm
+
+        def lista_nfe(**filtros):
+            form = FiltroNotasFiscaisForm(filtros, empresa=empresa)
+            notas = form.filtrar(NotaFiscal.objects.filter(empresa=empresa))
+            # Primeira página da lista (paginar_keyset)
+            return notas.order_by('-data_emissao', '-pk')[:form.tamanho_pagina + 1]
+
+        hoje = date.today()
+        inicio_mes = hoje.replace(day=1)
+        fim_mes = inicio_mes + relativedelta(months=1, days=-1)
+        mes_passado = inicio_mes - relativedelta(months=1)
+        contas = ContaPagar.objects.filter(empresa=empresa)
+        em_aberto = ['a_vencer', 'vencida']
+
+        return [
+            # Lista de NF-e (nfe_lista)
+            ('NF-e: lista, últimos 30 dias', lista_nfe(periodo='30dias'), ['nfe_empresa_emissao_id_idx']),
+            ('NF-e: lista, mês anterior', lista_nfe(periodo='mes_anterior'), ['nfe_empresa_emissao_id_idx']),
+            ('NF-e: lista por status', lista_nfe(periodo='30dias', status='pendente'),
+             ['nfe_empresa_status_emissao_idx']),
+            ('NF-e: emitente por nome', lista_nfe(periodo='personalizado', emitente=TERMO_RARO),
+             ['nfe_emitente_nome_trgm']),
+            ('NF-e: emitente por CNPJ', lista_nfe(periodo='personalizado', emitente='98.765.432'),
+             ['nfe_emitente_cnpj_trgm']),
+            # Admin de notas (todas as empresas, ordering/date_hierarchy)
+            ('NF-e: admin', NotaFiscal.objects.order_by('-data_emissao')[:100], ['financeiro__data_em_b07d6f_idx']),
+
+            # Lista de contas a pagar (listar_contas_pagar)
+            ('Contas: lista "à pagar"', contas.filter(status__in=em_aberto).order_by('data_vencimento')[:25],
+             ['conta_aberta_venc_idx']),
+            ('Contas: lista por status', contas.filter(status='vencida').order_by('data_vencimento')[:25],
+             ['conta_empresa_status_venc_idx']),
+            ('Contas: documento', contas.filter(documento__busca='0765432').order_by('data_vencimento')[:25],
+             ['conta_documento_trgm']),
+            ('Contas: números das notas', contas.filter(numero_notas__busca='876543').order_by('data_vencimento')[:25],
+             ['conta_numero_notas_trgm']),
+            ('Autocomplete: fornecedor', Fornecedor.objects.filter(empresa=empresa, nome__busca=TERMO_RARO)[:20],
+             ['fornecedor_nome_trgm']),
+
+            # Dashboard (dashboard_view); sem filtro de data, o prefixo empresa + status dos
+            # índices compostos também serve (o planejador os prefere em tabelas pequenas)
+            ('Dashboard: pendentes', contas.filter(status__in=em_aberto).values('valor_bruto'),
+             ['conta_aberta_venc_idx', 'conta_empresa_status_venc_idx', 'conta_empresa_status_pag_idx']),
+            # Só igualdade em empresa + status: o prefixo de qualquer um dos dois índices serve
+            ('Dashboard: vencidas', contas.filter(status='vencida').values('valor_bruto'),
+             ['conta_empresa_status_venc_idx', 'conta_empresa_status_pag_idx']),
+            ('Dashboard: pagas no mês',
+             contas.filter(status='pago', data_pagamento__gte=inicio_mes, data_pagamento__lte=fim_mes)
+             .values('valor_pago'),
+             ['conta_empresa_status_pag_idx']),
+            ('Dashboard: próximos 7 dias',
+             contas.filter(status='a_vencer', data_vencimento__gte=hoje, data_vencimento__lte=hoje + timedelta(days=7))
+             .values('valor_bruto'),
+             ['conta_empresa_status_venc_idx', 'conta_aberta_venc_idx']),
+            ('Dashboard: gráfico do mês',
+             contas.filter(status__in=em_aberto, data_vencimento__gte=inicio_mes, data_vencimento__lte=fim_mes)
+             .values('data_vencimento', 'valor_bruto', 'fornecedor__nome').order_by('data_vencimento'),
+             ['conta_aberta_venc_idx']),
+
+            # Tarefas (notificar_contas_*, gerar_relatorio_faturamento_mensal)
+            ('Notificação: vencidas', contas.filter(status='vencida', valor_pago__lte=0).values('valor_bruto'),
+             ['conta_empresa_status_venc_idx', 'conta_empresa_status_pag_idx']),
+            ('Relatório de faturamento',
+             contas.filter(status='pago', data_pagamento__gte=mes_passado, data_pagamento__lt=inicio_mes),
+             ['conta_empresa_status_pag_idx']),
+        ]
+
+    def _replicar(self, modelo_salvo, total: int, expressoes: dict, parametros: dict = None):
+        """
+        Gera `total` cópias de um registro com INSERT ... SELECT generate_series
+        (muito mais rápido que bulk_create para milhões de linhas).
+
+        Args:
+            modelo_salvo: Registro já gravado, usado como modelo das colunas não informadas
+            total: Quantidade de linhas
+            expressoes: {coluna: expressão SQL} usando `i` (1..total), `r` (aleatório em [0, 1)
+                da linha) e `m` (o modelo); % escrito como %%
+            parametros: Parâmetros usados nas expressões (%(nome)s)
+        """
+        meta = modelo_salvo._meta
+        quote = connection.ops.quote_name
+        colunas = [campo.column for campo in meta.concrete_fields if not campo.primary_key]
+        valores = [expressoes.get(coluna, f"m.{quote(coluna)}") for coluna in colunas]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(meta.db_table)} ({', '.join(quote(coluna) for coluna in colunas)}) "
+                f"SELECT {', '.join(valores)} FROM {quote(meta.db_table)} m, "
+                f"(SELECT i, random() AS r FROM generate_series(1, %(total)s) AS i) AS g "
+                f"WHERE m.{quote(meta.pk.column)} = %(modelo)s",
+                {'total': total, 'modelo': modelo_salvo.pk, **(parametros or {})},
+            )
+
+    def _gerar_dados(self, linhas: int, total_empresas: int):
+        """
+        Empresas com notas, contas e fornecedores sintéticos, seguido de ANALYZE.
+
+        Returns:
+            A primeira empresa (a das consultas verificadas)
+        """
+        from accounts.models import Empresa
+        from financeiro.models import ContaPagar, Filial, Fornecedor, NotaFiscal, TipoPagamento, Transacao
+
+        # Três palavras sorteadas; a do meio é a PALAVRA_RARA em 1 a cada 2000 linhas
+        palavra = "(%(palavras)s::text[])[1 + floor(random() * cardinality(%(palavras)s::text[]))::int]"
+        nome = (
+            f"{palavra} || ' ' || CASE WHEN i %% 2000 = 0 THEN '{PALAVRA_RARA}' ELSE {palavra} END "
+            f"|| ' ' || {palavra}"
+        )
+        # Linhas distribuídas entre as empresas, uma a uma
+        empresa_da_linha = "(%(empresas)s::bigint[])[1 + i %% cardinality(%(empresas)s::bigint[])]"
+
+        inicio = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT setseed(0.42)")
+
+        empresas = [
+            Empresa.objects.create(nome=f'VERIFICAÇÃO DE PLANOS {numero}', cnpj=f'PLANOS-{numero}')
+            for numero in range(1, total_empresas + 1)
+        ]
+        empresa = empresas[0]
+        parametros = {'palavras': PALAVRAS, 'empresas': [e.pk for e in empresas]}
+        filial = Filial.objects.create(empresa=empresa, nome='MATRIZ', cnpj='00000000000191')
+        transacao = Transacao.objects.create(empresa=empresa, nome='COMPRAS')
+        tipo_pagamento = TipoPagamento.objects.create(empresa=empresa, nome='BOLETO')
+
+        self.stdout.write(f"\n⏱️  Gerando {linhas // 10} fornecedor(es) em {total_empresas} empresa(s)...")
+        self._replicar(
+            Fornecedor.objects.create(empresa=empresa, nome='MODELO'), linhas // 10,
+            {'empresa_id': empresa_da_linha, 'nome': f"{nome} || ' ' || i"}, parametros,
+        )
+
+        self.stdout.write(f"⏱️  Gerando {linhas} nota(s) fiscal(is)...")
+        nota = NotaFiscal.objects.create(
+            empresa=empresa, filial=filial, chave_acesso='MODELO', numero='0', serie='1',
+            data_emissao=datetime.now().astimezone(), emitente_cnpj='00000000000191',
+            emitente_nome='MODELO', valor_total=0, valor_liquido=0,
+        )
+        self._replicar(nota, linhas, {
+            'empresa_id': empresa_da_linha,
+            'chave_acesso': "lpad(i::text, 44, '0')",
+            'numero': 'i::text',
+            # Uma nota por minuto para trás (1M de notas = quase dois anos)
+            'data_emissao': "m.data_emissao - i * interval '1 minute'",
+            'emitente_cnpj': "(10000000 + floor(random() * 90000000))::bigint::text || '000191'",
+            'emitente_nome': nome,
+            'status': "CASE WHEN r < 0.6 THEN 'importado' WHEN r < 0.8 THEN 'vinculado' "
+                      "WHEN r < 0.9 THEN 'descartado' ELSE 'pendente' END",
+        }, parametros)
+
+        self.stdout.write(f"⏱️  Gerando {linhas} conta(s) a pagar...")
+        conta = ContaPagar.objects.create(
+            empresa=empresa, filial=filial, transacao=transacao, tipo_pagamento=tipo_pagamento,
+            documento='MODELO', data_movimentacao=date.today(), data_vencimento=date.today(),
+            valor_bruto=Decimal('100.00'), status='pago',
+        )
+        # Vencimentos de cerca de quatro anos atrás até 30 dias à frente; 80% pagas no vencimento
+        vencimento = 'm.data_vencimento - (i %% 1500 - 30)'
+        self._replicar(conta, linhas, {
+            'empresa_id': empresa_da_linha,
+            'documento': "'BOLETO ' || lpad(i::text, 7, '0')",
+            'numero_notas': "i || ', ' || (i + 1)",
+            'data_movimentacao': 'm.data_movimentacao - i %% 1500',
+            'data_vencimento': vencimento,
+            'data_pagamento': f"CASE WHEN r < 0.8 THEN {vencimento} END",
+            'valor_pago': "CASE WHEN r < 0.8 THEN m.valor_bruto ELSE 0 END",
+            'status': f"CASE WHEN r < 0.8 THEN 'pago' WHEN {vencimento} < CURRENT_DATE THEN 'vencida' "
+                      f"ELSE 'a_vencer' END",
+        }, parametros)
+
+        with connection.cursor() as cursor:
+            for modelo in (Fornecedor, NotaFiscal, ContaPagar):
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(modelo._meta.db_table)}")
+
+        self.stdout.write(f"   • Dados gerados em {time.perf_counter() - inicio:.1f}s")
+        return empresa
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0013_configuracaonfe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configuracaonfe',
+            name='busca_historica_nsu',
+            field=models.CharField(default='000000000000000', help_text='Último NSU processado pela busca histórica (independente do NSU do certificado)', max_length=15, verbose_name='NSU da Busca Histórica'),
+        ),
+    ]
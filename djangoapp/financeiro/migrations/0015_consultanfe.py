@@ -0,0 +1,46 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('financeiro', '0014_configuracaonfe_busca_historica_nsu'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultaNFe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_inicio', models.DateField(verbose_name='Data Início')),
+                ('data_fim', models.DateField(verbose_name='Data Fim')),
+                ('buscar_novos', models.BooleanField(default=True, verbose_name='Apenas Novos Documentos')),
+                ('status', models.CharField(choices=[('pendente', 'Na fila'), ('executando', 'Executando'), ('concluida', 'Concluída'), ('erro', 'Erro')], default='pendente', max_length=20, verbose_name='Status')),
+                ('nsu_inicial', models.CharField(blank=True, max_length=15, verbose_name='NSU Inicial')),
+                ('ult_nsu', models.CharField(blank=True, max_length=15, verbose_name='Último NSU')),
+                ('max_nsu', models.CharField(blank=True, max_length=15, verbose_name='Maior NSU')),
+                ('lotes', models.IntegerField(default=0, verbose_name='Lotes Recebidos')),
+                ('documentos_recebidos', models.IntegerField(default=0, verbose_name='Documentos Recebidos')),
+                ('importados', models.IntegerField(default=0, verbose_name='Notas Importadas')),
+                ('duplicados', models.IntegerField(default=0, verbose_name='Notas Já Existentes')),
+                ('mensagem', models.TextField(blank=True, verbose_name='Mensagem')),
+                ('nivel', models.CharField(blank=True, choices=[('success', 'Sucesso'), ('info', 'Informação'), ('warning', 'Aviso'), ('danger', 'Erro')], max_length=10, verbose_name='Nível da Mensagem')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True, verbose_name='Iniciado em')),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True, verbose_name='Finalizado em')),
+                ('certificado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consultas_nfe', to='financeiro.certificadodigital', verbose_name='Certificado Digital')),
+                ('solicitado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Solicitado por')),
+            ],
+            options={
+                'verbose_name': 'Consulta NFe',
+                'verbose_name_plural': 'Consultas NFe',
+                'db_table': 'consulta_nfe',
+                'ordering': ['-criado_em'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:30
+
+from django.db import migrations, models
+import financeiro.nfe.armazenamento
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0015_consultanfe'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notafiscal',
+            name='arquivo_xml',
+            field=models.FileField(help_text='Arquivo XML da NF-e (compactado em disco)', max_length=150, storage=financeiro.nfe.armazenamento.XMLNotaFiscalStorage(), upload_to=financeiro.nfe.armazenamento.upload_xml_nota),
+        ),
+    ]
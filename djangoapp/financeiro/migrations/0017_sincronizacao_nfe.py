@@ -0,0 +1,50 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0016_notafiscal_arquivo_xml_compactado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SincronizacaoNFe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('automatica', 'Automática'), ('historica', 'Histórica'), ('manual', 'Manual')], max_length=20, verbose_name='Tipo')),
+                ('status', models.CharField(choices=[('sucesso', 'Sucesso'), ('erro', 'Erro')], default='sucesso', max_length=20, verbose_name='Status')),
+                ('iniciado_em', models.DateTimeField(verbose_name='Iniciado em')),
+                ('finalizado_em', models.DateTimeField(verbose_name='Finalizado em')),
+                ('nsu_inicial', models.CharField(blank=True, max_length=15, verbose_name='NSU Inicial')),
+                ('nsu_final', models.CharField(blank=True, max_length=15, verbose_name='NSU Final')),
+                ('chamadas_dist_nsu', models.IntegerField(default=0, verbose_name='Chamadas distNSU')),
+                ('chamadas_cons_chave', models.IntegerField(default=0, verbose_name='Chamadas consChNFe')),
+                ('bytes_recebidos', models.BigIntegerField(default=0, verbose_name='Bytes Recebidos')),
+                ('cstats', models.JSONField(blank=True, default=dict, help_text='Respostas por cStat', verbose_name='cStat')),
+                ('documentos_recebidos', models.IntegerField(default=0, verbose_name='Documentos Recebidos')),
+                ('importados', models.IntegerField(default=0, verbose_name='Notas Importadas')),
+                ('duplicados', models.IntegerField(default=0, verbose_name='Notas Já Existentes')),
+                ('ignorados', models.IntegerField(default=0, verbose_name='Documentos Ignorados')),
+                ('resumos_resolvidos', models.IntegerField(default=0, verbose_name='Resumos Resolvidos')),
+                ('tempo_total', models.FloatField(default=0, verbose_name='Tempo Total (s)')),
+                ('tempo_sefaz', models.FloatField(default=0, verbose_name='Tempo distNSU (s)')),
+                ('tempo_resumos', models.FloatField(default=0, verbose_name='Tempo Resumos (s)')),
+                ('tempo_preparar', models.FloatField(default=0, verbose_name='Tempo Metadados (s)')),
+                ('tempo_arquivos', models.FloatField(default=0, verbose_name='Tempo Arquivos (s)')),
+                ('tempo_banco', models.FloatField(default=0, verbose_name='Tempo Banco (s)')),
+                ('erro', models.TextField(blank=True, verbose_name='Erro')),
+                ('certificado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sincronizacoes_nfe', to='financeiro.certificadodigital', verbose_name='Certificado Digital')),
+            ],
+            options={
+                'verbose_name': 'Sincronização NFe',
+                'verbose_name_plural': 'Sincronizações NFe',
+                'db_table': 'sincronizacao_nfe',
+                'ordering': ['-iniciado_em'],
+                'indexes': [models.Index(fields=['certificado', '-iniciado_em'], name='sincronizac_certifi_b9b42d_idx')],
+            },
+        ),
+    ]
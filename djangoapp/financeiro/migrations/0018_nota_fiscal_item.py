@@ -0,0 +1,46 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_user_tempo_antecedencia_minutos'),
+        ('financeiro', '0017_sincronizacao_nfe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotaFiscalItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('emitente_cnpj', models.CharField(max_length=14, verbose_name='CNPJ Emitente')),
+                ('numero_item', models.PositiveSmallIntegerField(verbose_name='Nº Item')),
+                ('codigo_produto', models.CharField(blank=True, max_length=60, verbose_name='Código')),
+                ('ean', models.CharField(blank=True, max_length=14, verbose_name='EAN')),
+                ('descricao', models.CharField(blank=True, max_length=120, verbose_name='Descrição')),
+                ('ncm', models.CharField(blank=True, max_length=8, verbose_name='NCM')),
+                ('cfop', models.CharField(blank=True, max_length=4, verbose_name='CFOP')),
+                ('unidade', models.CharField(blank=True, max_length=6, verbose_name='Unidade')),
+                ('quantidade', models.DecimalField(decimal_places=4, default=0, max_digits=15, verbose_name='Quantidade')),
+                ('valor_unitario', models.DecimalField(decimal_places=10, default=0, max_digits=21, verbose_name='Valor Unitário')),
+                ('valor_total', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor Total')),
+                ('valor_desconto', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Desconto')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens_nfe', to='accounts.empresa')),
+                ('nota', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens', to='financeiro.notafiscal', verbose_name='Nota Fiscal')),
+            ],
+            options={
+                'verbose_name': 'Item de NF-e',
+                'verbose_name_plural': 'Itens de NF-e',
+                'db_table': 'nota_fiscal_item',
+                'ordering': ['nota', 'numero_item'],
+                'indexes': [models.Index(fields=['empresa', 'ncm'], name='nota_fiscal_empresa_2ad00e_idx'), models.Index(fields=['empresa', 'cfop'], name='nota_fiscal_empresa_4fac41_idx'), models.Index(fields=['empresa', 'emitente_cnpj'], name='nota_fiscal_empresa_4a6e06_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='notafiscalitem',
+            constraint=models.UniqueConstraint(fields=('nota', 'numero_item'), name='nota_fiscal_item_unico'),
+        ),
+    ]
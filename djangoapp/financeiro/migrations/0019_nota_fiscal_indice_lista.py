@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-18 04:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0018_nota_fiscal_item'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notafiscal',
+            index=models.Index(fields=['empresa', 'data_emissao', 'id'], name='nfe_empresa_emissao_id_idx'),
+        ),
+    ]
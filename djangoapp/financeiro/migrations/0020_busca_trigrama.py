@@ -0,0 +1,70 @@
+"""
+Índices GIN de trigramas (pg_trgm) para as buscas por trecho de texto.
+
+Atendem o lookup __busca (financeiro/busca.py): f_unaccent(coluna) ILIKE
+f_unaccent('%termo%'). O CNPJ do emitente só tem dígitos/letras maiúsculas e
+é buscado com LIKE direto na coluna.
+
+Só no PostgreSQL (nos outros bancos a migração não faz nada). Os índices são
+criados com CONCURRENTLY, sem bloquear gravações nas tabelas grandes.
+"""
+from django.contrib.postgres.operations import TrigramExtension, UnaccentExtension
+from django.db import migrations
+
+
+# unaccent() é STABLE (depende do dicionário configurado); fixando o dicionário
+# o resultado só depende do texto e a função pode ser IMMUTABLE
+SQL_F_UNACCENT = """
+CREATE OR REPLACE FUNCTION public.f_unaccent(text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS
+$func$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $func$
+"""
+
+# (modelo, nome do índice, expressão indexada)
+INDICES = [
+    ('NotaFiscal', 'nfe_emitente_nome_trgm', 'f_unaccent(emitente_nome) gin_trgm_ops'),
+    ('NotaFiscal', 'nfe_emitente_cnpj_trgm', 'emitente_cnpj gin_trgm_ops'),
+    ('ContaPagar', 'conta_documento_trgm', 'f_unaccent(documento) gin_trgm_ops'),
+    ('ContaPagar', 'conta_numero_notas_trgm', 'f_unaccent(numero_notas) gin_trgm_ops'),
+    ('Fornecedor', 'fornecedor_nome_trgm', 'f_unaccent(nome) gin_trgm_ops'),
+    ('Filial', 'filial_nome_trgm', 'f_unaccent(nome) gin_trgm_ops'),
+    ('Transacao', 'transacao_nome_trgm', 'f_unaccent(nome) gin_trgm_ops'),
+    ('TipoPagamento', 'tipo_pagamento_nome_trgm', 'f_unaccent(nome) gin_trgm_ops'),
+]
+
+
+def criar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(SQL_F_UNACCENT)
+    for modelo, nome, expressao in INDICES:
+        tabela = schema_editor.quote_name(apps.get_model('financeiro', modelo)._meta.db_table)
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nome} ON {tabela} USING gin ({expressao})"
+        )
+
+
+def remover_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for _, nome, _ in INDICES:
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}")
+    schema_editor.execute("DROP FUNCTION IF EXISTS public.f_unaccent(text)")
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY não roda dentro de transação
+    atomic = False
+
+    dependencies = [
+        ('financeiro', '0019_nota_fiscal_indice_lista'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        UnaccentExtension(),
+        migrations.RunPython(criar_indices, remover_indices),
+    ]
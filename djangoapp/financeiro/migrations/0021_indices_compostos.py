@@ -0,0 +1,41 @@
+# Generated by Django 4.2.20 on 2026-10-18 05:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0020_busca_trigrama'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notafiscal',
+            name='financeiro__chave_a_9c6f11_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='notafiscal',
+            name='financeiro__data_em_b07d6f_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='notafiscal',
+            name='financeiro__status_4532a6_idx',
+        ),
+        migrations.AddIndex(
+            model_name='contapagar',
+            index=models.Index(fields=['empresa', 'status', 'data_vencimento'], name='conta_empresa_status_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contapagar',
+            index=models.Index(fields=['empresa', 'status', 'data_pagamento'], name='conta_empresa_status_pag_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contapagar',
+            index=models.Index(condition=models.Q(('status__in', ['a_vencer', 'vencida'])), fields=['empresa', 'data_vencimento'], name='conta_aberta_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notafiscal',
+            index=models.Index(fields=['empresa', 'status', 'data_emissao', 'id'], name='nfe_empresa_status_emissao_idx'),
+        ),
+    ]
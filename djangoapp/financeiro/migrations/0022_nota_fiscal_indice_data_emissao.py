@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-18 05:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0021_indices_compostos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notafiscal',
+            index=models.Index(fields=['data_emissao'], name='financeiro__data_em_b07d6f_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
 from accounts.models import Empresa
+# XMLs das notas fiscais: compactados e distribuídos em diretórios pela chave
+from financeiro.nfe.armazenamento import upload_xml_nota, xml_storage
 import re
 
 class Filial(models.Model):
@@ -166,6 +168,18 @@ class ContaPagar(models.Model):
         ordering = ['-data_vencimento']
         verbose_name = 'Conta a Pagar'
         verbose_name_plural = 'Contas a Pagar'
+        indexes = [
+            # Listas, dashboard, notificações e relatório filtram empresa + status + uma data
+            models.Index(fields=['empresa', 'status', 'data_vencimento'], name='conta_empresa_status_venc_idx'),
+            models.Index(fields=['empresa', 'status', 'data_pagamento'], name='conta_empresa_status_pag_idx'),
+            # Contas em aberto (lista "à pagar", cards/gráfico do dashboard), já na ordem de vencimento
+            models.Index(
+                fields=['empresa', 'data_vencimento'], name='conta_aberta_venc_idx',
+                condition=models.Q(status__in=['a_vencer', 'vencida']),
+            ),
+            # Índices de trigramas de documento/numero_notas: só no PostgreSQL,
+            # criados na migração 0020_busca_trigrama
+        ]
 
     def __str__(self):
         return f"{self.transacao} - R$ {self.valor_bruto} - {self.data_vencimento}"
@@ -349,6 +363,31 @@ class CertificadoDigital(models.Model):
         from django.utils import timezone
         return timezone.now().date() > self.data_validade
 
+    def avancar_nsu(self, ult_nsu):
+        """
+        Grava o cursor de NSU do certificado sem permitir retrocesso.
+
+        Deve ser chamado dentro da transação que importa o lote do NSU, para
+        que o cursor salvo nunca aponte além de documentos não gravados.
+
+        Args:
+            ult_nsu: ultNSU retornado pela SEFAZ para o lote
+
+        Returns:
+            True se o NSU foi atualizado
+        """
+        if not ult_nsu:
+            return False
+
+        # NSUs têm sempre 15 dígitos, então a comparação de texto é numérica
+        atualizado = CertificadoDigital.objects.filter(
+            pk=self.pk, ultimo_nsu__lt=ult_nsu
+        ).update(ultimo_nsu=ult_nsu)
+
+        if atualizado:
+            self.ultimo_nsu = ult_nsu
+        return bool(atualizado)
+
 
 class NotaFiscal(models.Model):
     """
@@ -432,8 +471,10 @@ class NotaFiscal(models.Model):
 
     # Arquivo XML
     arquivo_xml = models.FileField(
-        upload_to='notas_fiscais/%Y/%m/',
-        help_text='Arquivo XML da NF-e'
+        upload_to=upload_xml_nota,
+        storage=xml_storage,
+        max_length=150,
+        help_text='Arquivo XML da NF-e (compactado em disco)'
     )
 
     # NSU
@@ -478,21 +519,34 @@ class NotaFiscal(models.Model):
         verbose_name_plural = 'Notas Fiscais Eletrônicas'
         ordering = ['-data_emissao']
         indexes = [
-            models.Index(fields=['chave_acesso']),
+            # chave_acesso já tem o índice da restrição unique
             models.Index(fields=['emitente_cnpj']),
+            # Admin (todas as empresas): ordering e date_hierarchy por data_emissao
             models.Index(fields=['data_emissao']),
-            models.Index(fields=['status']),
+            # status sozinho não tem índice: poucos valores, e as consultas por status filtram
+            # a empresa (índice abaixo) ou, no admin, seguem a ordem do índice de data_emissao
+            # Paginação por chave da lista de notas (ver financeiro/nfe/paginacao.py); lido de trás
+            # para frente, também atende ORDER BY data_emissao DESC
+            models.Index(fields=['empresa', 'data_emissao', 'id'], name='nfe_empresa_emissao_id_idx'),
+            # Lista filtrada por status, na mesma ordem da paginação
+            models.Index(fields=['empresa', 'status', 'data_emissao', 'id'], name='nfe_empresa_status_emissao_idx'),
+            # Índices de trigramas de emitente_nome/emitente_cnpj: só no PostgreSQL,
+            # criados na migração 0020_busca_trigrama
         ]
 
     def __str__(self):
         return f"NF-e {self.numero} - {self.emitente_nome} - R$ {self.valor_total}"
 
-    def save(self, *args, **kwargs):
+    def normalizar(self):
+        """Padroniza os campos de texto (também usado antes de bulk_create, que não chama save)."""
         # Uppercase em campos de texto
         if self.emitente_nome:
             self.emitente_nome = self.emitente_nome.upper()
         if self.emitente_cnpj:
             self.emitente_cnpj = re.sub(r'\D', '', self.emitente_cnpj)
+
+    def save(self, *args, **kwargs):
+        self.normalizar()
         super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
@@ -516,6 +570,57 @@ class NotaFiscal(models.Model):
         return cnpj
 
 
+class NotaFiscalItem(models.Model):
+    """
+    Item (det/prod) de uma NF-e, extraído do XML na importação.
+    Permite consultar produtos, NCM, CFOP e preços sem reler os arquivos.
+    Empresa e CNPJ do emitente são copiados da nota para filtrar sem join.
+    """
+
+    nota = models.ForeignKey(
+        NotaFiscal,
+        on_delete=models.CASCADE,
+        related_name='itens',
+        verbose_name='Nota Fiscal'
+    )
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='itens_nfe')
+    emitente_cnpj = models.CharField(max_length=14, verbose_name='CNPJ Emitente')
+
+    numero_item = models.PositiveSmallIntegerField(verbose_name='Nº Item')
+    codigo_produto = models.CharField(max_length=60, blank=True, verbose_name='Código')
+    ean = models.CharField(max_length=14, blank=True, verbose_name='EAN')
+    descricao = models.CharField(max_length=120, blank=True, verbose_name='Descrição')
+    ncm = models.CharField(max_length=8, blank=True, verbose_name='NCM')
+    cfop = models.CharField(max_length=4, blank=True, verbose_name='CFOP')
+    unidade = models.CharField(max_length=6, blank=True, verbose_name='Unidade')
+    quantidade = models.DecimalField(max_digits=15, decimal_places=4, default=0, verbose_name='Quantidade')
+    valor_unitario = models.DecimalField(max_digits=21, decimal_places=10, default=0, verbose_name='Valor Unitário')
+    valor_total = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name='Valor Total')
+    valor_desconto = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name='Desconto')
+
+    class Meta:
+        verbose_name = 'Item de NF-e'
+        verbose_name_plural = 'Itens de NF-e'
+        db_table = 'nota_fiscal_item'
+        ordering = ['nota', 'numero_item']
+        constraints = [
+            models.UniqueConstraint(fields=['nota', 'numero_item'], name='nota_fiscal_item_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['empresa', 'ncm']),
+            models.Index(fields=['empresa', 'cfop']),
+            models.Index(fields=['empresa', 'emitente_cnpj']),
+        ]
+
+    def __str__(self):
+        return f"{self.numero_item} - {self.descricao}"
+
+    @classmethod
+    def da_nota(cls, nota, dados: dict) -> 'NotaFiscalItem':
+        """Cria (sem salvar) o item a partir de um dicionário de metadados.extrair_itens."""
+        return cls(nota_id=nota.pk, empresa_id=nota.empresa_id, emitente_cnpj=nota.emitente_cnpj, **dados)
+
+
 class ConfiguracaoNFe(models.Model):
     """
     Configurações para importação automática de notas fiscais.
@@ -564,6 +669,13 @@ class ConfiguracaoNFe(models.Model):
         help_text='Percentual de conclusão da busca histórica'
     )
 
+    busca_historica_nsu = models.CharField(
+        max_length=15,
+        default='000000000000000',
+        verbose_name='NSU da Busca Histórica',
+        help_text='Último NSU processado pela busca histórica (independente do NSU do certificado)'
+    )
+
     # Estatísticas
     ultima_execucao = models.DateTimeField(
         null=True,
@@ -620,6 +732,31 @@ class ConfiguracaoNFe(models.Model):
         status = "Ativa" if self.busca_automatica_ativa else "Inativa"
         return f"Config NFe - {self.certificado.filial.nome} ({status})"
 
+    def avancar_nsu_historico(self, ult_nsu):
+        """
+        Grava o cursor da busca histórica sem permitir retrocesso.
+
+        Mesmo contrato de CertificadoDigital.avancar_nsu: chamado dentro da
+        transação que importa o lote do NSU.
+
+        Args:
+            ult_nsu: ultNSU retornado pela SEFAZ para o lote
+
+        Returns:
+            True se o NSU foi atualizado
+        """
+        if not ult_nsu:
+            return False
+
+        # NSUs têm sempre 15 dígitos, então a comparação de texto é numérica
+        atualizado = ConfiguracaoNFe.objects.filter(
+            pk=self.pk, busca_historica_nsu__lt=ult_nsu
+        ).update(busca_historica_nsu=ult_nsu)
+
+        if atualizado:
+            self.busca_historica_nsu = ult_nsu
+        return bool(atualizado)
+
     def registrar_execucao_sucesso(self, quantidade_importada):
         """Registra execução bem-sucedida"""
         from django.utils import timezone
@@ -645,3 +782,213 @@ class ConfiguracaoNFe(models.Model):
 
         self.save()
 
+
+
+class ConsultaNFe(models.Model):
+    """
+    Consulta manual de NF-e na SEFAZ (tela "Consultar NF-e").
+    Executada em background pela task `consultar_nfe_manual`; a tela de
+    status acompanha o progresso pelos contadores abaixo.
+    """
+
+    STATUS_CHOICES = [
+        ('pendente', 'Na fila'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('erro', 'Erro'),
+    ]
+
+    # Nível da mensagem final (classe de alerta do Bootstrap)
+    NIVEL_CHOICES = [
+        ('success', 'Sucesso'),
+        ('info', 'Informação'),
+        ('warning', 'Aviso'),
+        ('danger', 'Erro'),
+    ]
+
+    certificado = models.ForeignKey(
+        CertificadoDigital,
+        on_delete=models.CASCADE,
+        related_name='consultas_nfe',
+        verbose_name='Certificado Digital'
+    )
+    solicitado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name='Solicitado por'
+    )
+
+    # Parâmetros da consulta
+    data_inicio = models.DateField(verbose_name='Data Início')
+    data_fim = models.DateField(verbose_name='Data Fim')
+    buscar_novos = models.BooleanField(default=True, verbose_name='Apenas Novos Documentos')
+
+    # Andamento
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente', verbose_name='Status')
+    nsu_inicial = models.CharField(max_length=15, blank=True, verbose_name='NSU Inicial')
+    ult_nsu = models.CharField(max_length=15, blank=True, verbose_name='Último NSU')
+    max_nsu = models.CharField(max_length=15, blank=True, verbose_name='Maior NSU')
+    lotes = models.IntegerField(default=0, verbose_name='Lotes Recebidos')
+    documentos_recebidos = models.IntegerField(default=0, verbose_name='Documentos Recebidos')
+    importados = models.IntegerField(default=0, verbose_name='Notas Importadas')
+    duplicados = models.IntegerField(default=0, verbose_name='Notas Já Existentes')
+
+    # Resultado
+    mensagem = models.TextField(blank=True, verbose_name='Mensagem')
+    nivel = models.CharField(max_length=10, choices=NIVEL_CHOICES, blank=True, verbose_name='Nível da Mensagem')
+
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
+    iniciado_em = models.DateTimeField(null=True, blank=True, verbose_name='Iniciado em')
+    finalizado_em = models.DateTimeField(null=True, blank=True, verbose_name='Finalizado em')
+
+    class Meta:
+        verbose_name = 'Consulta NFe'
+        verbose_name_plural = 'Consultas NFe'
+        db_table = 'consulta_nfe'
+        ordering = ['-criado_em']
+
+    def __str__(self):
+        return f"Consulta NFe #{self.pk} - {self.certificado.filial.nome} ({self.get_status_display()})"
+
+    @property
+    def em_andamento(self):
+        return self.status in ('pendente', 'executando')
+
+    @property
+    def progresso(self):
+        """Percentual estimado pelo NSU (do NSU inicial até o maior NSU informado pela SEFAZ)."""
+        if self.status == 'concluida':
+            return 100
+        if not self.ult_nsu or not self.max_nsu:
+            return 0
+
+        inicio = int(self.nsu_inicial or 0)
+        total = int(self.max_nsu) - inicio
+        if total <= 0:
+            return 99
+        return min(int((int(self.ult_nsu) - inicio) / total * 100), 99)
+
+    def registrar_progresso(self, **campos):
+        """Atualiza apenas os campos informados (visíveis para o endpoint de progresso)."""
+        for campo, valor in campos.items():
+            setattr(self, campo, valor)
+        ConsultaNFe.objects.filter(pk=self.pk).update(**campos)
+
+    def finalizar(self, status, mensagem, nivel):
+        """Registra o resultado final da consulta."""
+        from django.utils import timezone
+        self.registrar_progresso(
+            status=status,
+            mensagem=mensagem,
+            nivel=nivel,
+            finalizado_em=timezone.now(),
+        )
+
+    def como_dict(self):
+        """Estado da consulta para o endpoint JSON de progresso."""
+        return {
+            'id': self.pk,
+            'status': self.status,
+            'status_display': self.get_status_display(),
+            'em_andamento': self.em_andamento,
+            'progresso': self.progresso,
+            'lotes': self.lotes,
+            'documentos_recebidos': self.documentos_recebidos,
+            'importados': self.importados,
+            'duplicados': self.duplicados,
+            'ult_nsu': self.ult_nsu,
+            'max_nsu': self.max_nsu,
+            'mensagem': self.mensagem,
+            'nivel': self.nivel,
+        }
+
+
+class SincronizacaoNFe(models.Model):
+    """
+    Telemetria de uma execução de sincronização de NF-e de um certificado
+    (busca automática, histórica ou consulta manual).
+    Gravada por financeiro.nfe.telemetria.medir_sincronizacao.
+    """
+
+    TIPO_CHOICES = [
+        ('automatica', 'Automática'),
+        ('historica', 'Histórica'),
+        ('manual', 'Manual'),
+    ]
+
+    STATUS_CHOICES = [
+        ('sucesso', 'Sucesso'),
+        ('erro', 'Erro'),
+    ]
+
+    certificado = models.ForeignKey(
+        CertificadoDigital,
+        on_delete=models.CASCADE,
+        related_name='sincronizacoes_nfe',
+        verbose_name='Certificado Digital'
+    )
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, verbose_name='Tipo')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='sucesso', verbose_name='Status')
+    iniciado_em = models.DateTimeField(verbose_name='Iniciado em')
+    finalizado_em = models.DateTimeField(verbose_name='Finalizado em')
+    nsu_inicial = models.CharField(max_length=15, blank=True, verbose_name='NSU Inicial')
+    nsu_final = models.CharField(max_length=15, blank=True, verbose_name='NSU Final')
+
+    # Chamadas SOAP
+    chamadas_dist_nsu = models.IntegerField(default=0, verbose_name='Chamadas distNSU')
+    chamadas_cons_chave = models.IntegerField(default=0, verbose_name='Chamadas consChNFe')
+    bytes_recebidos = models.BigIntegerField(default=0, verbose_name='Bytes Recebidos')
+    cstats = models.JSONField(default=dict, blank=True, verbose_name='cStat', help_text='Respostas por cStat')
+
+    # Documentos
+    documentos_recebidos = models.IntegerField(default=0, verbose_name='Documentos Recebidos')
+    importados = models.IntegerField(default=0, verbose_name='Notas Importadas')
+    duplicados = models.IntegerField(default=0, verbose_name='Notas Já Existentes')
+    ignorados = models.IntegerField(default=0, verbose_name='Documentos Ignorados')
+    resumos_resolvidos = models.IntegerField(default=0, verbose_name='Resumos Resolvidos')
+
+    # Tempos por etapa (segundos)
+    tempo_total = models.FloatField(default=0, verbose_name='Tempo Total (s)')
+    tempo_sefaz = models.FloatField(default=0, verbose_name='Tempo distNSU (s)')
+    tempo_resumos = models.FloatField(default=0, verbose_name='Tempo Resumos (s)')
+    tempo_preparar = models.FloatField(default=0, verbose_name='Tempo Metadados (s)')
+    tempo_arquivos = models.FloatField(default=0, verbose_name='Tempo Arquivos (s)')
+    tempo_banco = models.FloatField(default=0, verbose_name='Tempo Banco (s)')
+
+    erro = models.TextField(blank=True, verbose_name='Erro')
+
+    class Meta:
+        verbose_name = 'Sincronização NFe'
+        verbose_name_plural = 'Sincronizações NFe'
+        db_table = 'sincronizacao_nfe'
+        ordering = ['-iniciado_em']
+        indexes = [
+            models.Index(fields=['certificado', '-iniciado_em']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} - {self.certificado.filial.nome} ({self.iniciado_em:%d/%m/%Y %H:%M})"
+
+    @property
+    def documentos_por_segundo(self):
+        if not self.tempo_total:
+            return 0
+        return self.documentos_recebidos / self.tempo_total
+
+    @property
+    def taxa_duplicados(self):
+        """Fração dos documentos válidos que já existiam (0 a 1)."""
+        total = self.importados + self.duplicados
+        return self.duplicados / total if total else 0
+
+    @property
+    def megabytes(self):
+        return self.bytes_recebidos / 1024 / 1024
+
+    @property
+    def tempo_outros(self):
+        """Tempo não atribuído às etapas medidas (parse das respostas, espera do limitador etc.)."""
+        etapas = self.tempo_sefaz + self.tempo_resumos + self.tempo_preparar + self.tempo_arquivos + self.tempo_banco
+        return max(self.tempo_total - etapas, 0)
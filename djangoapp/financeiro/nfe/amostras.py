@@ -0,0 +1,166 @@
+"""
+Geração de documentos NF-e sintéticos (procNFe e resNFe) para benchmarks.
+
+Os documentos seguem a estrutura do leiaute 4.00 (ide, emit, dest, det,
+total, transp, cobr, pag, Signature e protNFe), com chaves de acesso válidas,
+mas os valores e a assinatura são fictícios.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+
+NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+
+_NCMS = ['22021000', '19053100', '04012010', '15079011', '17019900', '21069090', '33051000', '34011190']
+_CFOPS = ['5102', '5405', '6102', '6108', '5101']
+_FUSO = timezone(timedelta(hours=-3))
+
+
+def gerar_chave(uf: str, emissao: datetime, cnpj: str, serie: int, numero: int, codigo: int) -> str:
+    """
+    Monta uma chave de acesso de 44 dígitos com dígito verificador (módulo 11).
+
+    Args:
+        uf: Código IBGE da UF do emitente
+        emissao: Data de emissão
+        cnpj: CNPJ do emitente
+        serie: Série da nota
+        numero: Número da nota
+        codigo: Código numérico (cNF)
+
+    Returns:
+        Chave de acesso
+    """
+    base = f"{uf}{emissao:%y%m}{cnpj:0>14}55{serie:03d}{numero:09d}1{codigo:08d}"
+    soma = sum(int(digito) * peso for digito, peso in zip(reversed(base), [2, 3, 4, 5, 6, 7, 8, 9] * 6))
+    resto = soma % 11
+    dv = 0 if resto < 2 else 11 - resto
+    return f"{base}{dv}"
+
+
+def _item(n: int, rnd: random.Random) -> tuple:
+    quantidade = Decimal(rnd.randint(1, 48))
+    unitario = Decimal(rnd.randint(150, 25000)) / 100
+    total = (quantidade * unitario).quantize(Decimal('0.01'))
+    icms = (total * Decimal('0.18')).quantize(Decimal('0.01'))
+    ncm = rnd.choice(_NCMS)
+    cfop = rnd.choice(_CFOPS)
+    xml = (
+        f'<det nItem="{n}"><prod><cProd>{rnd.randint(1000, 99999)}</cProd><cEAN>SEM GTIN</cEAN>'
+        f'<xProd>PRODUTO DE TESTE {n:03d}</xProd><NCM>{ncm}</NCM><CFOP>{cfop}</CFOP>'
+        f'<uCom>UN</uCom><qCom>{quantidade:.4f}</qCom><vUnCom>{unitario:.10f}</vUnCom><vProd>{total}</vProd>'
+        f'<cEANTrib>SEM GTIN</cEANTrib><uTrib>UN</uTrib><qTrib>{quantidade:.4f}</qTrib>'
+        f'<vUnTrib>{unitario:.10f}</vUnTrib><indTot>1</indTot></prod>'
+        f'<imposto><vTotTrib>0.00</vTotTrib><ICMS><ICMS00><orig>0</orig><CST>00</CST><modBC>3</modBC>'
+        f'<vBC>{total}</vBC><pICMS>18.00</pICMS><vICMS>{icms}</vICMS></ICMS00></ICMS>'
+        f'<PIS><PISAliq><CST>01</CST><vBC>{total}</vBC><pPIS>1.65</pPIS><vPIS>0.00</vPIS></PISAliq></PIS>'
+        f'<COFINS><COFINSAliq><CST>01</CST><vBC>{total}</vBC><pCOFINS>7.60</pCOFINS><vCOFINS>0.00</vCOFINS>'
+        f'</COFINSAliq></COFINS></imposto></det>'
+    )
+    return xml, total, icms
+
+
+def gerar_proc_nfe(numero: int, cnpj_emitente: str, cnpj_destinatario: str, uf: str = '42',
+                   emissao: Optional[datetime] = None, itens: int = 20, seed: int = None) -> bytes:
+    """
+    Gera um procNFe completo (NFe + protNFe).
+
+    Args:
+        numero: Número da nota
+        cnpj_emitente: CNPJ do emitente
+        cnpj_destinatario: CNPJ do destinatário
+        uf: Código IBGE da UF
+        emissao: Data de emissão (padrão: agora)
+        itens: Quantidade de itens (det)
+        seed: Semente para valores reproduzíveis
+
+    Returns:
+        XML em bytes
+    """
+    rnd = random.Random(numero if seed is None else seed)
+    emissao = emissao or datetime.now(_FUSO)
+    chave = gerar_chave(uf, emissao, cnpj_emitente, 1, numero, rnd.randint(1, 99999999))
+
+    detalhes = []
+    total_produtos = Decimal('0.00')
+    total_icms = Decimal('0.00')
+    for n in range(1, itens + 1):
+        xml, total, icms = _item(n, rnd)
+        detalhes.append(xml)
+        total_produtos += total
+        total_icms += icms
+
+    desconto = (total_produtos * Decimal(rnd.choice([0, 0, 0, 2, 5])) / 100).quantize(Decimal('0.01'))
+    valor_nota = total_produtos - desconto
+    dh = emissao.isoformat(timespec='seconds')
+
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>'
+        f'<nfeProc xmlns="{NS_NFE}" versao="4.00"><NFe xmlns="{NS_NFE}">'
+        f'<infNFe Id="NFe{chave}" versao="4.00">'
+        f'<ide><cUF>{uf}</cUF><cNF>{chave[35:43]}</cNF><natOp>VENDA DE MERCADORIA</natOp><mod>55</mod>'
+        f'<serie>1</serie><nNF>{numero}</nNF><dhEmi>{dh}</dhEmi><dhSaiEnt>{dh}</dhSaiEnt><tpNF>1</tpNF>'
+        f'<idDest>1</idDest><cMunFG>4205407</cMunFG><tpImp>1</tpImp><tpEmis>1</tpEmis><cDV>{chave[-1]}</cDV>'
+        f'<tpAmb>1</tpAmb><finNFe>1</finNFe><indFinal>0</indFinal><indPres>1</indPres><procEmi>0</procEmi>'
+        f'<verProc>1.0</verProc></ide>'
+        f'<emit><CNPJ>{cnpj_emitente}</CNPJ><xNome>FORNECEDOR {cnpj_emitente[:8]} LTDA</xNome>'
+        f'<xFant>FORNECEDOR {cnpj_emitente[:8]}</xFant><enderEmit><xLgr>RUA DAS FLORES</xLgr><nro>100</nro>'
+        f'<xBairro>CENTRO</xBairro><cMun>4205407</cMun><xMun>FLORIANOPOLIS</xMun><UF>SC</UF><CEP>88010000</CEP>'
+        f'<cPais>1058</cPais><xPais>BRASIL</xPais></enderEmit><IE>255555555</IE><CRT>3</CRT></emit>'
+        f'<dest><CNPJ>{cnpj_destinatario}</CNPJ><xNome>DESTINATARIO {cnpj_destinatario[:8]} LTDA</xNome>'
+        f'<enderDest><xLgr>AVENIDA BRASIL</xLgr><nro>2000</nro><xBairro>CENTRO</xBairro><cMun>4205407</cMun>'
+        f'<xMun>FLORIANOPOLIS</xMun><UF>SC</UF><CEP>88020000</CEP></enderDest><indIEDest>1</indIEDest>'
+        f'<IE>266666666</IE></dest>'
+        f'{"".join(detalhes)}'
+        f'<total><ICMSTot><vBC>{total_produtos}</vBC><vICMS>{total_icms}</vICMS><vICMSDeson>0.00</vICMSDeson>'
+        f'<vFCP>0.00</vFCP><vBCST>0.00</vBCST><vST>0.00</vST><vFCPST>0.00</vFCPST><vFCPSTRet>0.00</vFCPSTRet>'
+        f'<vProd>{total_produtos}</vProd><vFrete>0.00</vFrete><vSeg>0.00</vSeg><vDesc>{desconto}</vDesc>'
+        f'<vII>0.00</vII><vIPI>0.00</vIPI><vIPIDevol>0.00</vIPIDevol><vPIS>0.00</vPIS><vCOFINS>0.00</vCOFINS>'
+        f'<vOutro>0.00</vOutro><vNF>{valor_nota}</vNF></ICMSTot></total>'
+        f'<transp><modFrete>0</modFrete><transporta><CNPJ>11222333000181</CNPJ>'
+        f'<xNome>TRANSPORTADORA TESTE</xNome></transporta></transp>'
+        f'<cobr><fat><nFat>{numero}</nFat><vOrig>{total_produtos}</vOrig><vDesc>{desconto}</vDesc>'
+        f'<vLiq>{valor_nota}</vLiq></fat><dup><nDup>001</nDup><dVenc>{(emissao + timedelta(days=30)):%Y-%m-%d}</dVenc>'
+        f'<vDup>{valor_nota}</vDup></dup></cobr>'
+        f'<pag><detPag><tPag>15</tPag><vPag>{valor_nota}</vPag></detPag></pag>'
+        f'<infAdic><infCpl>DOCUMENTO GERADO PARA TESTES</infCpl></infAdic></infNFe>'
+        f'<Signature xmlns="http://www.w3.org/2000/09/xmldsig#"><SignedInfo>'
+        f'<CanonicalizationMethod Algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315"/>'
+        f'<SignatureMethod Algorithm="http://www.w3.org/2000/09/xmldsig#rsa-sha1"/>'
+        f'<Reference URI="#NFe{chave}"><DigestValue>{"A" * 28}</DigestValue></Reference></SignedInfo>'
+        f'<SignatureValue>{"B" * 344}</SignatureValue><KeyInfo><X509Data><X509Certificate>{"C" * 2400}'
+        f'</X509Certificate></X509Data></KeyInfo></Signature></NFe>'
+        f'<protNFe versao="4.00"><infProt><tpAmb>1</tpAmb><verAplic>SVRS202401</verAplic><chNFe>{chave}</chNFe>'
+        f'<dhRecbto>{dh}</dhRecbto><nProt>1{numero:014d}</nProt><digVal>{"D" * 28}</digVal>'
+        f'<cStat>100</cStat><xMotivo>Autorizado o uso da NF-e</xMotivo></infProt></protNFe></nfeProc>'
+    ).encode('utf-8')
+
+
+def gerar_res_nfe(numero: int, cnpj_emitente: str, uf: str = '42',
+                  emissao: Optional[datetime] = None, seed: int = None) -> bytes:
+    """
+    Gera um resumo de NF-e (resNFe) como o entregue pela distribuição DF-e.
+
+    Args:
+        numero: Número da nota
+        cnpj_emitente: CNPJ do emitente
+        uf: Código IBGE da UF
+        emissao: Data de emissão (padrão: agora)
+        seed: Semente para valores reproduzíveis
+
+    Returns:
+        XML em bytes
+    """
+    rnd = random.Random(numero if seed is None else seed)
+    emissao = emissao or datetime.now(_FUSO)
+    chave = gerar_chave(uf, emissao, cnpj_emitente, 1, numero, rnd.randint(1, 99999999))
+    dh = emissao.isoformat(timespec='seconds')
+    valor = Decimal(rnd.randint(1000, 5000000)) / 100
+
+    return (
+        f'<resNFe xmlns="{NS_NFE}" versao="1.01"><chNFe>{chave}</chNFe><CNPJ>{cnpj_emitente}</CNPJ>'
+        f'<xNome>FORNECEDOR {cnpj_emitente[:8]} LTDA</xNome><IE>255555555</IE><dhEmi>{dh}</dhEmi>'
+        f'<tpNF>1</tpNF><vNF>{valor:.2f}</vNF><digVal>{"D" * 28}</digVal><dhRecbto>{dh}</dhRecbto>'
+        f'<nProt>1{numero:014d}</nProt><cSitNFe>1</cSitNFe></resNFe>'
+    ).encode('utf-8')
@@ -0,0 +1,161 @@
+"""
+Armazenamento compactado dos XMLs de NotaFiscal.
+
+Os arquivos ficam em notas_fiscais/<aa>/<bb>/<chave>.xml.gz, onde <aa>/<bb>
+são os quatro primeiros caracteres do SHA-1 da chave de acesso. O caminho
+depende só da chave: a mesma nota sempre cai no mesmo arquivo e os
+diretórios ficam com poucas centenas de arquivos mesmo com milhões de notas.
+
+A compressão é escolhida pela extensão do nome (.gz = gzip, .zst = zstd) e a
+leitura descompacta de forma transparente, reconhecendo o formato pelos
+primeiros bytes; arquivos antigos sem compressão continuam legíveis.
+zstd é opcional e exige o pacote `zstandard`; sem ele a gravação usa gzip e o
+aviso aparece uma vez, no system check (manage.py check / migrate / runserver).
+"""
+import gzip
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.core import checks
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+_MAGICA_GZIP = b'\x1f\x8b'
+_MAGICA_ZSTD = b'\x28\xb5\x2f\xfd'
+
+EXTENSOES = {
+    'gzip': '.xml.gz',
+    'zstd': '.xml.zst',
+}
+
+
+def formato_compressao() -> str:
+    """Formato configurado em NFE_XML_COMPRESSAO (zstd sem o pacote instalado cai para gzip)."""
+    formato = settings.NFE_XML_COMPRESSAO
+    if formato == 'zstd' and zstandard is None:
+        # Avisado pelo system check verificar_zstandard
+        return 'gzip'
+    if formato not in EXTENSOES:
+        return 'gzip'
+    return formato
+
+
+@checks.register()
+def verificar_zstandard(app_configs, **kwargs):
+    """System check: zstd configurado sem o pacote zstandard."""
+    if settings.NFE_XML_COMPRESSAO == 'zstd' and zstandard is None:
+        return [checks.Warning(
+            'NFE_XML_COMPRESSAO=zstd, mas o pacote zstandard não está instalado.',
+            hint='Instale o pacote zstandard; até lá os XMLs de NF-e são gravados com gzip.',
+            id='financeiro.W001',
+        )]
+    return []
+
+
+def caminho_xml(chave_acesso: str, formato: str = None) -> str:
+    """
+    Caminho relativo (dentro do MEDIA_ROOT) do XML de uma nota.
+
+    Args:
+        chave_acesso: Chave de acesso da NF-e
+        formato: 'gzip' ou 'zstd' (padrão: NFE_XML_COMPRESSAO)
+
+    Returns:
+        Ex.: notas_fiscais/3f/a2/42240112345678000199550010000000011000000017.xml.gz
+    """
+    digest = hashlib.sha1(chave_acesso.encode('ascii')).hexdigest()
+    extensao = EXTENSOES[formato or formato_compressao()]
+    return f"notas_fiscais/{digest[:2]}/{digest[2:4]}/{chave_acesso}{extensao}"
+
+
+def upload_xml_nota(instance, filename):
+    """upload_to de NotaFiscal.arquivo_xml: o nome enviado é ignorado, vale a chave."""
+    return caminho_xml(instance.chave_acesso)
+
+
+def compactar(conteudo: bytes, formato: str) -> bytes:
+    if formato == 'zstd':
+        return zstandard.ZstdCompressor(level=settings.NFE_XML_NIVEL_ZSTD).compress(conteudo)
+    # mtime=0: o mesmo XML gera sempre os mesmos bytes
+    return gzip.compress(conteudo, compresslevel=settings.NFE_XML_NIVEL_GZIP, mtime=0)
+
+
+def descompactar(conteudo: bytes) -> bytes:
+    """Descompacta gzip/zstd pelos bytes iniciais; XML sem compressão é devolvido como está."""
+    if conteudo.startswith(_MAGICA_GZIP):
+        return gzip.decompress(conteudo)
+    if conteudo.startswith(_MAGICA_ZSTD):
+        if zstandard is None:
+            raise Exception("XML compactado com zstd, mas o pacote zstandard não está instalado")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(conteudo)
+    return conteudo
+
+
+def _formato_do_nome(name: str):
+    for formato, extensao in EXTENSOES.items():
+        if name.endswith(extensao):
+            return formato
+    return None
+
+
+def compactado(name: str) -> bool:
+    """True se o arquivo é gravado compactado (o conteúdo em disco não é o XML)."""
+    return _formato_do_nome(name) is not None
+
+
+@deconstructible
+class XMLNotaFiscalStorage(FileSystemStorage):
+    """
+    FileSystemStorage que grava os XMLs compactados e os devolve descompactados.
+
+    Como o caminho é derivado da chave, um novo arquivo com o mesmo nome
+    substitui o anterior em vez de receber sufixo. A gravação vai para um
+    temporário no mesmo diretório e é trocada com os.replace (atômico): dois
+    gravadores da mesma chave não disputam o nome e ninguém lê um XML pela metade.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        caminho = self.path(name)
+        diretorio = os.path.dirname(caminho)
+        os.makedirs(diretorio, exist_ok=True)
+
+        content.seek(0)
+        conteudo = content.read()
+        formato = _formato_do_nome(name)
+        if formato is not None:
+            conteudo = compactar(conteudo, formato)
+
+        temporario = os.path.join(diretorio, f".{os.path.basename(caminho)}.{uuid.uuid4().hex}.tmp")
+        try:
+            # 'x': o temporário é exclusivo deste gravador (permissões seguem o umask, como no Django)
+            with open(temporario, 'xb') as arquivo:
+                arquivo.write(conteudo)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporario, self.file_permissions_mode)
+            os.replace(temporario, caminho)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+        return str(name).replace('\\', '/')
+
+    def _open(self, name, mode='rb'):
+        with super()._open(name, 'rb') as arquivo:
+            conteudo = descompactar(arquivo.read())
+        return ContentFile(conteudo, name=name)
+
+
+xml_storage = XMLNotaFiscalStorage()
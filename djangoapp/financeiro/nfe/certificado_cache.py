@@ -0,0 +1,149 @@
+"""
+Cache por processo do material criptográfico dos certificados digitais.
+
+Evita descriptografar a senha e reprocessar o arquivo PFX a cada consulta:
+a chave privada, o certificado e o SSLContext já montado ficam em memória,
+indexados pelo id do certificado e pelo mtime do arquivo.
+"""
+import os
+import secrets
+import ssl
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+from django.conf import settings
+
+from financeiro.crypto import decrypt_password
+
+
+class MaterialCertificado:
+    """Chave, certificado e SSLContext prontos para uso em conexões mTLS."""
+
+    def __init__(self, chave_privada, certificado, cadeia, ssl_context: ssl.SSLContext):
+        self.chave_privada = chave_privada
+        self.certificado = certificado
+        self.cadeia = cadeia
+        self.ssl_context = ssl_context
+
+    @classmethod
+    def carregar(cls, pkcs12_data: bytes, senha: str) -> 'MaterialCertificado':
+        """
+        Faz o parse do PFX e monta o SSLContext do cliente.
+
+        Args:
+            pkcs12_data: Conteúdo do arquivo .pfx/.p12
+            senha: Senha do certificado em texto plano
+
+        Returns:
+            MaterialCertificado
+
+        Raises:
+            ValueError: Se o certificado estiver vencido ou a senha for inválida
+        """
+        chave_privada, certificado, cadeia = pkcs12.load_key_and_certificates(
+            pkcs12_data, senha.encode('utf-8')
+        )
+
+        if certificado.not_valid_after_utc < datetime.now(timezone.utc):
+            raise ValueError(f"Certificado vencido em {certificado.not_valid_after_utc:%Y-%m-%d}")
+
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+
+        # O SSLContext só carrega a chave a partir de arquivo: grava um PEM
+        # temporário protegido por uma senha descartável e o remove em seguida
+        senha_temporaria = secrets.token_bytes(16)
+        with tempfile.NamedTemporaryFile(delete=False) as pem:
+            try:
+                pem.write(chave_privada.private_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PrivateFormat.TraditionalOpenSSL,
+                    serialization.BestAvailableEncryption(senha_temporaria)
+                ))
+                pem.write(certificado.public_bytes(serialization.Encoding.PEM))
+                for ca in cadeia or []:
+                    pem.write(ca.public_bytes(serialization.Encoding.PEM))
+                pem.close()
+                ssl_context.load_cert_chain(pem.name, password=senha_temporaria)
+            finally:
+                os.remove(pem.name)
+
+        return cls(chave_privada, certificado, cadeia, ssl_context)
+
+
+class CacheCertificados:
+    """
+    Cache LRU com TTL de MaterialCertificado, seguro para uso entre threads.
+
+    A chave de cada entrada é (id do certificado, caminho do PFX, mtime do PFX),
+    de modo que a troca do arquivo gera automaticamente uma nova entrada.
+    """
+
+    def __init__(self, max_entradas: int = 32, ttl: int = 3600):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _chave(certificado):
+        caminho = certificado.arquivo_pfx.path
+        return (certificado.pk, caminho, os.path.getmtime(caminho))
+
+    def obter(self, certificado) -> MaterialCertificado:
+        """
+        Retorna o material do certificado, carregando-o se necessário.
+
+        Args:
+            certificado: Instância de CertificadoDigital
+
+        Returns:
+            MaterialCertificado
+        """
+        chave = self._chave(certificado)
+        agora = time.monotonic()
+
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada and entrada[0] > agora:
+                self._entradas.move_to_end(chave)
+                return entrada[1]
+
+        # Carrega fora do lock: o parse do PFX é a parte cara
+        with open(chave[1], 'rb') as arquivo:
+            pkcs12_data = arquivo.read()
+        senha = decrypt_password(certificado.senha_encrypted)
+        material = MaterialCertificado.carregar(pkcs12_data, senha)
+
+        with self._lock:
+            # Remove versões antigas do mesmo certificado (arquivo trocado)
+            for antiga in [c for c in self._entradas if c[0] == certificado.pk and c != chave]:
+                del self._entradas[antiga]
+
+            self._entradas[chave] = (agora + self.ttl, material)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+        return material
+
+    def invalidar(self, certificado_id):
+        """Descarta todas as entradas de um certificado."""
+        with self._lock:
+            for chave in [c for c in self._entradas if c[0] == certificado_id]:
+                del self._entradas[chave]
+
+    def limpar(self):
+        """Descarta todas as entradas."""
+        with self._lock:
+            self._entradas.clear()
+
+
+cache_certificados = CacheCertificados(
+    max_entradas=settings.NFE_CERTIFICADO_CACHE_MAX_ENTRADAS,
+    ttl=settings.NFE_CERTIFICADO_CACHE_TTL,
+)
@@ -0,0 +1,68 @@
+"""
+Exportação de XMLs de notas fiscais em ZIP transmitido em partes.
+
+O zipfile escreve em um "arquivo" que só acumula os bytes da entrada atual;
+a cada XML adicionado, o que foi escrito é entregue à StreamingHttpResponse
+e descartado. A memória fica limitada a um XML por vez (mais o diretório
+central do ZIP, algumas centenas de bytes por nota), qualquer que seja o
+número de notas.
+"""
+import zipfile
+from typing import Iterator
+
+
+class _SaidaStreaming:
+    """Destino não pesquisável do zipfile: guarda só o que ainda não foi transmitido."""
+
+    def __init__(self):
+        self._partes = []
+        self._posicao = 0
+
+    def write(self, dados) -> int:
+        self._partes.append(bytes(dados))
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self) -> int:
+        return self._posicao
+
+    def flush(self):
+        pass
+
+    def retirar(self) -> bytes:
+        dados = b''.join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def gerar_zip_xmls(notas, chunk_size: int = 500) -> Iterator[bytes]:
+    """
+    Gera o ZIP com os XMLs das notas, em partes, à medida que cada arquivo é lido.
+
+    Args:
+        notas: QuerySet de NotaFiscal
+        chunk_size: Notas lidas do banco por vez
+
+    Yields:
+        Bytes do ZIP
+    """
+    saida = _SaidaStreaming()
+    notas = notas.exclude(arquivo_xml='').only('pk', 'chave_acesso', 'arquivo_xml').order_by('pk')
+
+    with zipfile.ZipFile(saida, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for nota in notas.iterator(chunk_size=chunk_size):
+            # Lê pelo storage, não por nota.arquivo_xml: o FieldFile guardaria o XML
+            # descompactado (ContentFile, cujo close() não libera nada) em cada nota
+            # do bloco do iterator
+            try:
+                with nota.arquivo_xml.storage.open(nota.arquivo_xml.name) as arquivo:
+                    xml_content = arquivo.read()
+            except OSError as e:
+                print(f"[NFe ZIP] ⚠️ XML da nota {nota.pk} não encontrado: {e}")
+                continue
+
+            zip_file.writestr(f"nfe_{nota.chave_acesso}.xml", xml_content)
+            yield saida.retirar()
+
+    # Diretório central, escrito ao fechar o ZIP
+    yield saida.retirar()
@@ -2,10 +2,18 @@
 Forms para gestão de certificados digitais e consulta de NF-e.
 """
 from django import forms
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import timezone
 from financeiro.models import CertificadoDigital, Filial
 from financeiro.crypto import encrypt_password
-from datetime import datetime
+from datetime import datetime, timedelta
+
+
+def _inicio_do_dia(dia):
+    """Meia-noite do dia no fuso do projeto (datetime com timezone)."""
+    return timezone.make_aware(datetime.combine(dia, datetime.min.time()))
 
 
 class CertificadoDigitalForm(forms.ModelForm):
@@ -245,6 +253,17 @@ class FiltroNotasFiscaisForm(forms.Form):
         label='Emitente'
     )
 
+    por_pagina = forms.TypedChoiceField(
+        choices=[(n, n) for n in (25, 50, 100, 200)],
+        coerce=int,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        label='Por página'
+    )
+
+    # Campos que não filtram (não entram na chave da contagem em cache)
+    CAMPOS_EXIBICAO = ('por_pagina',)
+
     def __init__(self, *args, empresa=None, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -252,6 +271,107 @@ class FiltroNotasFiscaisForm(forms.Form):
         if empresa:
             self.fields['filial'].queryset = Filial.objects.filter(empresa=empresa)
 
+        self.fields['por_pagina'].initial = settings.NFE_LISTA_POR_PAGINA
+
+    @property
+    def tamanho_pagina(self) -> int:
+        """Notas por página escolhidas no filtro (padrão: NFE_LISTA_POR_PAGINA)."""
+        if self.is_bound and self.is_valid() and self.cleaned_data.get('por_pagina'):
+            return self.cleaned_data['por_pagina']
+        return settings.NFE_LISTA_POR_PAGINA
+
+    def filtros_aplicados(self) -> dict:
+        """
+        Valores dos filtros válidos (identifica a consulta para a contagem em cache).
+        Inclui as datas do período: '30dias' de ontem e de hoje são consultas diferentes.
+        """
+        if not (self.is_bound and self.is_valid()):
+            return {}
+        filtros = {
+            campo: getattr(valor, 'pk', valor)
+            for campo, valor in self.cleaned_data.items()
+            if valor not in (None, '') and campo not in self.CAMPOS_EXIBICAO
+        }
+        if filtros.get('periodo'):
+            filtros['intervalo'] = self.intervalo()
+        return filtros
+
+    def intervalo(self) -> tuple:
+        """
+        Datas do período escolhido, com os períodos relativos resolvidos pela data de hoje.
+
+        Returns:
+            Tupla (início, fim); None em um dos lados deixa o intervalo aberto
+        """
+        periodo = self.cleaned_data.get('periodo')
+        hoje = timezone.localdate()
+        inicio = fim = None
+
+        if periodo == 'hoje':
+            inicio = fim = hoje
+        elif periodo == '7dias':
+            inicio = hoje - timedelta(days=7)
+        elif periodo == '30dias':
+            inicio = hoje - timedelta(days=30)
+        elif periodo == 'mes_atual':
+            inicio = hoje.replace(day=1)
+        elif periodo == 'mes_anterior':
+            fim = hoje.replace(day=1) - timedelta(days=1)
+            inicio = fim.replace(day=1)
+        elif periodo == 'personalizado':
+            inicio = self.cleaned_data.get('data_inicio')
+            fim = self.cleaned_data.get('data_fim')
+
+        return inicio, fim
+
+    def filtrar(self, notas):
+        """
+        Aplica os filtros do formulário a um queryset de NotaFiscal.
+        Usado pela lista de notas e pelo download em massa.
+
+        Args:
+            notas: QuerySet de NotaFiscal (já restrito à empresa)
+
+        Returns:
+            QuerySet filtrado (sem filtros se o formulário não for válido)
+        """
+        if not (self.is_bound and self.is_valid()):
+            return notas
+
+        # Filtro de filial
+        filial = self.cleaned_data.get('filial')
+        if filial:
+            notas = notas.filter(filial=filial)
+
+        # Filtro de período: intervalo direto em data_emissao (não data_emissao__date,
+        # que converte cada linha) para usar os índices (empresa, ..., data_emissao)
+        if self.cleaned_data.get('periodo'):
+            inicio, fim = self.intervalo()
+
+            if inicio:
+                notas = notas.filter(data_emissao__gte=_inicio_do_dia(inicio))
+            if fim:
+                notas = notas.filter(data_emissao__lt=_inicio_do_dia(fim + timedelta(days=1)))
+
+        # Filtro de status
+        status = self.cleaned_data.get('status')
+        if status:
+            notas = notas.filter(status=status)
+
+        # Filtro de emitente
+        emitente = self.cleaned_data.get('emitente')
+        if emitente:
+            # Nome sem diferenciar acentos; CNPJ gravado só com dígitos/maiúsculas.
+            # Ambos usam os índices de trigramas (migração 0020_busca_trigrama)
+            filtro = Q(emitente_nome__busca=emitente)
+            # Só pontuação ('.', '/', '-') vira termo vazio, que encontraria qualquer CNPJ
+            cnpj = emitente.replace('.', '').replace('/', '').replace('-', '').upper()
+            if cnpj:
+                filtro |= Q(emitente_cnpj__contains=cnpj)
+            notas = notas.filter(filtro)
+
+        return notas
+
 
 class VincularNotaContaForm(forms.Form):
     """Form para vincular uma nota fiscal a uma conta a pagar existente"""
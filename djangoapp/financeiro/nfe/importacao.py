@@ -0,0 +1,389 @@
+"""
+Importação em lote dos documentos da distribuição DF-e para NotaFiscal.
+
+É o único caminho de gravação usado pela task automática, pela busca
+histórica e pela consulta manual. Cada lote passa por fases separadas:
+
+1. preparar: extrai os metadados e os itens (um parse por XML) e descobre as chaves
+   já importadas com uma única consulta chave_acesso__in. Notas já gravadas
+   sem arquivo (importação interrompida antes da fase 4) seguem no lote para
+   receber o XML;
+2. resolver: troca pelo XML completo (consChNFe) apenas os resumos de notas
+   novas. É a única fase com rede e roda sem transação aberta;
+3. metadados: insere as notas e seus itens (det/prod → NotaFiscalItem) com
+   bulk_create em transações curtas de até NFE_IMPORTACAO_MAX_POR_TRANSACAO
+   notas, ainda sem o nome do arquivo. As chaves do grupo ficam travadas até
+   o commit, então uma nota inserida por uma importação concorrente não é
+   contada nem recebe itens ou arquivo desta;
+4. arquivos: após o commit de cada grupo (transaction.on_commit), os XMLs são
+   gravados no storage por um pool de NFE_XML_GRAVACAO_WORKERS threads, sem
+   transação aberta durante o I/O, e o nome do arquivo é registrado na nota.
+   Um rollback não deixa arquivos órfãos. O cursor de NSU só avança depois
+   dos arquivos do último grupo: se a gravação falhar (ou o worker cair), o
+   lote é consultado de novo e as notas sem arquivo são completadas.
+
+Nenhuma chamada à SEFAZ acontece com transação aberta: o SefazClient recusa
+a consulta nesse caso (garantir_fora_de_transacao).
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import List
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+
+from .resolver import buscar_documentos_completos
+from .sefaz_client import DocumentoDFe
+
+
+def _travar_chaves(chaves: List[str]):
+    """
+    Trava as chaves de acesso até o fim da transação (advisory lock do PostgreSQL).
+
+    Duas importações com a mesma chave (certificados de filiais diferentes,
+    busca histórica e sincronização) ficam em fila: a segunda só confere as
+    chaves existentes depois do commit da primeira e não insere, conta nem
+    grava o arquivo de uma nota que não inseriu. A ordem fixa evita deadlock.
+    Outros bancos ficam sem a trava; um conflito de chave lá desfaz o grupo.
+    """
+    if connection.vendor != 'postgresql' or not chaves:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(hashtext(chave)) FROM unnest(%s::text[]) AS chave",
+            [sorted(chaves)],
+        )
+
+
+@dataclass
+class ResultadoImportacao:
+    """Contadores de uma importação (um lote ou o acumulado de vários)."""
+
+    recebidos: int = 0
+    importados: int = 0
+    duplicados: int = 0
+    ignorados: int = 0
+    resumos_resolvidos: int = 0
+    itens: int = 0
+    segundos: float = 0.0
+    # Tempo de cada fase (segundos)
+    tempo_preparar: float = 0.0
+    tempo_resumos: float = 0.0
+    tempo_arquivos: float = 0.0
+    tempo_banco: float = 0.0
+
+    @property
+    def total(self) -> int:
+        """Documentos válidos processados (importados + duplicados)."""
+        return self.importados + self.duplicados
+
+    def somar(self, outro: 'ResultadoImportacao'):
+        self.recebidos += outro.recebidos
+        self.importados += outro.importados
+        self.duplicados += outro.duplicados
+        self.ignorados += outro.ignorados
+        self.resumos_resolvidos += outro.resumos_resolvidos
+        self.itens += outro.itens
+        self.segundos += outro.segundos
+        self.tempo_preparar += outro.tempo_preparar
+        self.tempo_resumos += outro.tempo_resumos
+        self.tempo_arquivos += outro.tempo_arquivos
+        self.tempo_banco += outro.tempo_banco
+
+    def __str__(self):
+        return (
+            f"{self.recebidos} recebido(s), {self.importados} importado(s), "
+            f"{self.duplicados} duplicado(s), {self.ignorados} ignorado(s) em {self.segundos:.2f}s"
+        )
+
+
+class ImportadorNFe:
+    """
+    Importa lotes de DocumentoDFe de um certificado.
+
+    Uso:
+        importador = ImportadorNFe(certificado, client)
+        for lote in client.distribuicao(nsu).lotes():
+            importador.importar_lote(list(lote), lote.ult_nsu)
+        print(importador.total)
+    """
+
+    def __init__(self, certificado, client=None, importado_por=None, avancar_cursor=None):
+        """
+        Args:
+            certificado: CertificadoDigital que consultou os documentos
+            client: SefazClient usado para trocar resumos pelo XML completo
+                    (sem cliente, os resumos são importados como estão)
+            importado_por: Usuário da importação manual (None na automática)
+            avancar_cursor: Função que grava o ultNSU de cada lote (padrão:
+                            certificado.avancar_nsu; a busca histórica usa o
+                            cursor próprio da ConfiguracaoNFe)
+        """
+        self.certificado = certificado
+        self.client = client
+        self.importado_por = importado_por
+        self.avancar_cursor = avancar_cursor or certificado.avancar_nsu
+        self.total = ResultadoImportacao()
+
+    def importar_lote(self, documentos: List[DocumentoDFe], ult_nsu: str = None) -> ResultadoImportacao:
+        """
+        Importa um lote de documentos.
+
+        Quando `ult_nsu` é informado, o cursor de NSU (`avancar_cursor`) é gravado
+        depois dos XMLs do último grupo de notas: se o worker cair no meio da
+        sincronização, a próxima execução retoma do último lote completo (as
+        notas de grupos já gravados são reconhecidas como duplicadas e as que
+        ficaram sem arquivo recebem o XML).
+
+        Args:
+            documentos: Documentos de um lote da distribuição
+            ult_nsu: ultNSU do lote (cursor a gravar depois das notas e dos XMLs)
+
+        Returns:
+            ResultadoImportacao do lote
+        """
+        inicio = time.perf_counter()
+        resultado = ResultadoImportacao(recebidos=len(documentos))
+
+        # 1. Metadados + deduplicação (somente leitura)
+        candidatas, sem_arquivo = self._preparar(documentos, resultado)
+        marca = time.perf_counter()
+        resultado.tempo_preparar = marca - inicio
+
+        # 2. Rede: resumos de notas novas → XML completo
+        if self.client is not None:
+            resultado.resumos_resolvidos = self._resolver_resumos(candidatas)
+        resultado.tempo_resumos = time.perf_counter() - marca
+        marca = time.perf_counter()
+
+        # 3. Metadados em transações curtas; 4. arquivos após cada commit
+        notas = self._montar_notas(candidatas)
+        self._gravar_metadados(notas, ult_nsu, resultado, sem_arquivo)
+        resultado.tempo_banco = time.perf_counter() - marca - resultado.tempo_arquivos
+
+        resultado.segundos = time.perf_counter() - inicio
+        self.total.somar(resultado)
+
+        print(f"[NFe Importação] Lote: {resultado}")
+        return resultado
+
+    def _preparar(self, documentos: List[DocumentoDFe], resultado: ResultadoImportacao) -> tuple:
+        """
+        Extrai os metadados e separa as notas a gravar.
+
+        Returns:
+            Tupla ({chave: (documento, metadados)} das notas ainda não importadas ou
+            sem arquivo, {chave: pk} das já gravadas sem arquivo)
+        """
+        from financeiro.models import NotaFiscal
+
+        candidatas = {}
+        for documento in documentos:
+            # Lê os metadados e os itens e libera a árvore lxml do documento
+            metadados = documento.extrair_metadados(itens=True)
+            chave = metadados['chave_acesso']
+
+            if not chave or metadados['data_emissao'] is None:
+                print(f"⚠️ Documento NSU {documento.nsu or '?'} sem chave ou data de emissão, ignorado")
+                resultado.ignorados += 1
+                continue
+
+            if chave in candidatas:
+                resultado.duplicados += 1
+                continue
+
+            candidatas[chave] = (documento, metadados)
+
+        # Uma consulta para todas as chaves do lote
+        sem_arquivo = {}
+        if candidatas:
+            existentes = NotaFiscal.objects.filter(chave_acesso__in=list(candidatas)).values_list(
+                'chave_acesso', 'pk', 'arquivo_xml'
+            )
+            for chave, pk, arquivo_xml in existentes:
+                if arquivo_xml:
+                    del candidatas[chave]
+                    resultado.duplicados += 1
+                else:
+                    # Importação interrompida entre o commit e a gravação do XML
+                    sem_arquivo[chave] = pk
+
+        return candidatas, sem_arquivo
+
+    def _montar_notas(self, candidatas: dict) -> list:
+        """Monta as NotaFiscal (sem arquivo, gravado após o commit). Retorna [(nota, conteúdo do XML, itens)]."""
+        from financeiro.models import NotaFiscal
+
+        notas = []
+        for chave, (documento, metadados) in candidatas.items():
+            nota = NotaFiscal(
+                empresa=self.certificado.empresa,
+                filial=self.certificado.filial,
+                chave_acesso=chave,
+                numero=metadados['numero'],
+                serie=metadados['serie'],
+                data_emissao=metadados['data_emissao'],
+                emitente_cnpj=metadados['emitente_cnpj'],
+                emitente_nome=metadados['emitente_nome'],
+                valor_total=metadados['valor_total'],
+                valor_desconto=metadados['valor_desconto'],
+                valor_liquido=metadados['valor_liquido'],
+                nsu=metadados['nsu'],
+                importado_por=self.importado_por,
+            )
+            # bulk_create não chama save()
+            nota.normalizar()
+
+            # Itens (det/prod) lidos em _preparar; resumos não têm
+            notas.append((nota, documento.conteudo, metadados['itens']))
+
+        return notas
+
+    def _gravar_metadados(self, notas: list, ult_nsu: str = None, resultado: ResultadoImportacao = None,
+                          sem_arquivo: dict = None):
+        """
+        Insere as notas em transações de até NFE_IMPORTACAO_MAX_POR_TRANSACAO registros.
+        Após o commit de cada grupo, grava os XMLs das notas inseridas e das já
+        gravadas sem arquivo (`sem_arquivo`: {chave: pk}); o cursor avança depois
+        dos XMLs do último grupo.
+
+        Raises:
+            Exception: Se um XML não puder ser gravado (as notas ficam sem arquivo
+                       e o cursor não avança)
+        """
+        from financeiro.models import NotaFiscal
+
+        sem_arquivo = sem_arquivo or {}
+
+        tamanho = settings.NFE_IMPORTACAO_MAX_POR_TRANSACAO
+        grupos = [notas[i:i + tamanho] for i in range(0, len(notas), tamanho)] or [[]]
+
+        for posicao, grupo in enumerate(grupos, start=1):
+            with transaction.atomic():
+                chaves = [nota.chave_acesso for nota, _, _ in grupo]
+                _travar_chaves(chaves)
+
+                # Chaves gravadas por outra importação depois de _preparar (ou que ela
+                # acabou de confirmar enquanto esta esperava a trava): não são
+                # inseridas, contadas nem têm o arquivo regravado
+                existentes = set()
+                if chaves:
+                    existentes = set(
+                        NotaFiscal.objects.filter(chave_acesso__in=chaves)
+                        .values_list('chave_acesso', flat=True)
+                    )
+                novas = [item for item in grupo if item[0].chave_acesso not in existentes]
+                # Notas sem arquivo de uma importação anterior interrompida
+                completar = [
+                    item for item in grupo if item[0].chave_acesso in existentes and item[0].chave_acesso in sem_arquivo
+                ]
+                for nota, _, _ in completar:
+                    nota.pk = sem_arquivo[nota.chave_acesso]
+
+                # Sem ignore_conflicts: todas as notas de `novas` são inseridas por esta
+                # importação e o bulk_create devolve as PKs (PostgreSQL e SQLite ≥ 3.35)
+                NotaFiscal.objects.bulk_create([nota for nota, _, _ in novas])
+                itens = self._gravar_itens(novas)
+                if resultado is not None:
+                    resultado.itens += itens
+                    resultado.importados += len(novas)
+                    resultado.duplicados += len(grupo) - len(novas)
+
+                # Após o commit, na ordem: arquivos do grupo e então o cursor. Se a
+                # gravação falhar, os callbacks seguintes (e o cursor) não rodam
+                if novas or completar:
+                    transaction.on_commit(partial(self._gravar_arquivos, novas, completar, resultado))
+
+                # Checkpoint: o NSU só avança depois dos XMLs do último grupo do lote
+                if ult_nsu and posicao == len(grupos):
+                    transaction.on_commit(partial(self.avancar_cursor, ult_nsu))
+
+    def _gravar_itens(self, grupo: list) -> int:
+        """Insere os itens das notas recém-inseridas (na transação das notas). Retorna quantos foram inseridos."""
+        from financeiro.models import NotaFiscalItem
+
+        registros = [
+            NotaFiscalItem.da_nota(nota, item)
+            for nota, _, itens in grupo
+            for item in itens
+        ]
+        # ignore_conflicts: nItem repetido em um XML malformado não derruba o grupo
+        NotaFiscalItem.objects.bulk_create(registros, batch_size=1000, ignore_conflicts=True)
+        return len(registros)
+
+    def _gravar_arquivos(self, novas: list, completar: list = (), resultado: ResultadoImportacao = None):
+        """
+        Grava em paralelo os XMLs de um grupo já confirmado e registra o nome do
+        arquivo nas notas (um UPDATE em lote, fora da transação do grupo).
+
+        Args:
+            novas: Notas inseridas por esta importação
+            completar: Notas já gravadas sem arquivo; um XML que já exista (gravado
+                       por outra importação nesse meio tempo) não é sobrescrito
+
+        Raises:
+            Exception: Se algum XML não puder ser gravado (as notas gravadas até
+                       ali ficam com o arquivo registrado)
+        """
+        from financeiro.models import NotaFiscal
+
+        inicio = time.perf_counter()
+        campo_xml = NotaFiscal._meta.get_field('arquivo_xml')
+        storage = campo_xml.storage
+
+        def gravar(item):
+            (nota, conteudo, _), sobrescrever = item
+            # Caminho definitivo do XML (derivado da chave)
+            nome = campo_xml.generate_filename(nota, f"nfe_{nota.chave_acesso}.xml")
+            try:
+                if sobrescrever or not storage.exists(nome):
+                    # Salva o XML exatamente como veio da SEFAZ
+                    nome = storage.save(nome, ContentFile(conteudo))
+            except Exception as e:
+                print(f"❌ Erro ao gravar XML da nota {nota.chave_acesso}: {e}")
+                return f"Erro ao gravar XML da nota {nota.chave_acesso}: {e}"
+            nota.arquivo_xml.name = nome
+            return None
+
+        itens = [(item, True) for item in novas] + [(item, False) for item in completar]
+        try:
+            with ThreadPoolExecutor(max_workers=settings.NFE_XML_GRAVACAO_WORKERS) as executor:
+                erros = [erro for erro in executor.map(gravar, itens) if erro]
+
+            gravadas = [nota for (nota, _, _), _ in itens if nota.arquivo_xml]
+            NotaFiscal.objects.bulk_update(gravadas, ['arquivo_xml'], batch_size=1000)
+        finally:
+            if resultado is not None:
+                resultado.tempo_arquivos += time.perf_counter() - inicio
+
+        if erros:
+            raise Exception(f"{len(erros)} XML(s) não gravado(s); o cursor não avança. {erros[0]}")
+
+    def _resolver_resumos(self, candidatas: dict) -> int:
+        """Troca, em `candidatas`, os resumos pelo documento completo. Retorna quantos foram trocados."""
+        chaves = [chave for chave, (documento, _) in candidatas.items() if documento.eh_resumo]
+        if not chaves:
+            return 0
+
+        resolvidos = 0
+        for chave, completo in zip(chaves, buscar_documentos_completos(self.client, chaves)):
+            if completo is None:
+                print(f"Não foi possível obter XML completo, usando resumo: {chave}")
+                continue
+
+            resumo, metadados_resumo = candidatas[chave]
+            # Mantém o NSU da distribuição do CNPJ (o do resumo)
+            completo.nsu = resumo.nsu
+            metadados = completo.extrair_metadados(itens=True)
+            if metadados['chave_acesso'] != chave or metadados['data_emissao'] is None:
+                print(f"⚠️ XML completo inconsistente para {chave}, usando resumo")
+                continue
+
+            candidatas[chave] = (completo, metadados)
+            resolvidos += 1
+
+        return resolvidos
@@ -0,0 +1,197 @@
+"""
+Extração dos metadados de NF-e (procNFe, NFe e resNFe) em uma única passada.
+
+Em vez de um findtext('.//...') por campo (cada um percorrendo a árvore
+inteira, primeiro com namespace e depois com curinga), o documento é percorrido
+uma só vez pelo iterador do lxml filtrado pelas tags de interesse. O filtro
+'{*}tag' aceita tanto documentos com namespace quanto sem namespace.
+"""
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+from lxml import etree
+
+
+# Campos lidos na primeira ocorrência, em qualquer ponto do documento
+_CAMPOS_DOCUMENTO = {
+    'chNFe': 'chave_acesso',
+    'nNF': 'numero',
+    'serie': 'serie',
+    'dhEmi': 'dhEmi',
+}
+
+# Campos que dependem do elemento pai: {tag: {pai: campo}}
+# No resNFe o CNPJ, o nome do emitente e o vNF ficam direto na raiz
+_CAMPOS_POR_PAI = {
+    'CNPJ': {'emit': 'emitente_cnpj', 'resNFe': 'emitente_cnpj'},
+    'xNome': {'emit': 'emitente_nome', 'resNFe': 'emitente_nome'},
+    'vNF': {'ICMSTot': 'valor_total', 'resNFe': 'valor_total'},
+    'vDesc': {'ICMSTot': 'valor_desconto'},
+}
+
+_TAGS = [f'{{*}}{tag}' for tag in (*_CAMPOS_DOCUMENTO, *_CAMPOS_POR_PAI)]
+
+_TOTAL_CAMPOS = len(
+    set(_CAMPOS_DOCUMENTO.values()) | {campo for pais in _CAMPOS_POR_PAI.values() for campo in pais.values()}
+)
+
+
+def _nome_local(tag: str) -> str:
+    return tag.rpartition('}')[2]
+
+
+def converter_data_emissao(dhEmi: Optional[str]) -> Optional[datetime]:
+    """
+    Converte o dhEmi da NF-e (ISO 8601, com ou sem fuso) em datetime.
+
+    Args:
+        dhEmi: Texto do campo dhEmi
+
+    Returns:
+        Data de emissão ou None
+    """
+    if not dhEmi:
+        return None
+    try:
+        return datetime.fromisoformat(dhEmi.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            # Tenta apenas a parte da data
+            return datetime.strptime(dhEmi[:10], "%Y-%m-%d")
+        except ValueError:
+            return None
+
+
+def _decimal(valor: Optional[str]) -> Decimal:
+    try:
+        return Decimal(valor) if valor else Decimal('0.00')
+    except InvalidOperation:
+        return Decimal('0.00')
+
+
+def extrair_data_emissao(xml: etree._Element) -> Optional[datetime]:
+    """
+    Extrai a data de emissão parando no primeiro dhEmi encontrado.
+
+    Args:
+        xml: XML do documento
+
+    Returns:
+        Data de emissão ou None
+    """
+    elemento = next(xml.iter('{*}dhEmi'), None)
+    return converter_data_emissao(elemento.text if elemento is not None else None)
+
+
+def extrair_metadados(xml: etree._Element) -> dict:
+    """
+    Extrai os metadados principais da NF-e percorrendo o documento uma vez.
+
+    Args:
+        xml: XML do documento (procNFe, NFe ou resNFe)
+
+    Returns:
+        Dicionário com metadados
+    """
+    valores = {}
+
+    for elemento in xml.iter(*_TAGS):
+        tag = _nome_local(elemento.tag)
+
+        campo = _CAMPOS_DOCUMENTO.get(tag)
+        if campo is None:
+            pai = elemento.getparent()
+            if pai is None:
+                continue
+            campo = _CAMPOS_POR_PAI[tag].get(_nome_local(pai.tag))
+            if campo is None:
+                continue
+
+        if campo not in valores:
+            valores[campo] = elemento.text
+            if len(valores) == _TOTAL_CAMPOS:
+                break
+
+    valor_total = _decimal(valores.get('valor_total'))
+    valor_desconto = _decimal(valores.get('valor_desconto'))
+
+    return {
+        'chave_acesso': valores.get('chave_acesso') or '',
+        'numero': valores.get('numero') or '',
+        'serie': valores.get('serie') or '',
+        'data_emissao': converter_data_emissao(valores.get('dhEmi')),
+        'emitente_cnpj': valores.get('emitente_cnpj') or '',
+        'emitente_nome': valores.get('emitente_nome') or '',
+        'valor_total': valor_total,
+        'valor_desconto': valor_desconto,
+        'valor_liquido': valor_total - valor_desconto,
+        'nsu': xml.get('NSU', ''),
+    }
+
+
+# Campos de det/prod copiados para NotaFiscalItem: {tag: campo}
+_CAMPOS_PRODUTO = {
+    'cProd': 'codigo_produto',
+    'cEAN': 'ean',
+    'xProd': 'descricao',
+    'NCM': 'ncm',
+    'CFOP': 'cfop',
+    'uCom': 'unidade',
+    'qCom': 'quantidade',
+    'vUnCom': 'valor_unitario',
+    'vProd': 'valor_total',
+    'vDesc': 'valor_desconto',
+}
+
+_CAMPOS_PRODUTO_DECIMAIS = ('quantidade', 'valor_unitario', 'valor_total', 'valor_desconto')
+
+# Limites das colunas de NotaFiscalItem
+_TAMANHOS_PRODUTO = {
+    'codigo_produto': 60,
+    'ean': 14,
+    'descricao': 120,
+    'ncm': 8,
+    'cfop': 4,
+    'unidade': 6,
+}
+
+
+def extrair_itens(xml: etree._Element) -> list:
+    """
+    Extrai os itens (det/prod) da NF-e. Resumos (resNFe) não têm itens.
+
+    Args:
+        xml: XML do documento (procNFe ou NFe)
+
+    Returns:
+        Lista de dicionários com numero_item e os campos de _CAMPOS_PRODUTO
+    """
+    itens = []
+
+    for det in xml.iter('{*}det'):
+        prod = next(det.iterchildren('{*}prod'), None)
+        if prod is None:
+            continue
+
+        item = {campo: '' for campo in _CAMPOS_PRODUTO.values()}
+        for elemento in prod:
+            campo = _CAMPOS_PRODUTO.get(_nome_local(elemento.tag)) if isinstance(elemento.tag, str) else None
+            if campo is not None:
+                item[campo] = (elemento.text or '').strip()
+
+        for campo in _CAMPOS_PRODUTO_DECIMAIS:
+            item[campo] = _decimal(item[campo])
+        for campo, tamanho in _TAMANHOS_PRODUTO.items():
+            item[campo] = item[campo][:tamanho]
+        # "SEM GTIN" e afins não são EAN
+        if not item['ean'].isdigit():
+            item['ean'] = ''
+
+        try:
+            item['numero_item'] = int(det.get('nItem') or len(itens) + 1)
+        except ValueError:
+            item['numero_item'] = len(itens) + 1
+        itens.append(item)
+
+    return itens
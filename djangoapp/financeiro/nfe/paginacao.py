@@ -0,0 +1,133 @@
+"""
+Paginação por chave (keyset) e contagem em cache para a lista de notas fiscais.
+
+Em vez de OFFSET (que lê e descarta todas as linhas anteriores), cada página
+continua a partir da última nota exibida: WHERE (data_emissao, id) < (...)
+ORDER BY data_emissao DESC, id DESC LIMIT n. Com o índice
+(empresa, data_emissao, id) o custo de qualquer página é o mesmo.
+
+O total por filtro vem do cache (NFE_LISTA_CACHE_CONTAGEM segundos), então
+a contagem completa roda no máximo uma vez por filtro nesse intervalo.
+"""
+import hashlib
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+_SEPARADOR = '_'
+
+
+def codificar_cursor(nota) -> str:
+    """Cursor de uma nota: '<data_emissao ISO>_<id>'."""
+    return f"{nota.data_emissao.isoformat()}{_SEPARADOR}{nota.pk}"
+
+
+def decodificar_cursor(cursor: Optional[str]):
+    """
+    Args:
+        cursor: Texto gerado por codificar_cursor
+
+    Returns:
+        (data_emissao, id) ou None se o cursor for inválido
+    """
+    if not cursor:
+        return None
+    data, _, pk = cursor.rpartition(_SEPARADOR)
+    try:
+        return datetime.fromisoformat(data), int(pk)
+    except ValueError:
+        return None
+
+
+@dataclass
+class PaginaKeyset:
+    """Uma página da lista, com os cursores para a anterior e a próxima."""
+
+    itens: List = field(default_factory=list)
+    cursor_anterior: Optional[str] = None
+    cursor_proximo: Optional[str] = None
+
+    @property
+    def tem_anterior(self) -> bool:
+        return self.cursor_anterior is not None
+
+    @property
+    def tem_proxima(self) -> bool:
+        return self.cursor_proximo is not None
+
+
+def paginar_keyset(queryset, tamanho: int, apos: str = None, antes: str = None) -> PaginaKeyset:
+    """
+    Retorna uma página de notas ordenadas por (-data_emissao, -id).
+
+    Args:
+        queryset: QuerySet de NotaFiscal já filtrado
+        tamanho: Notas por página
+        apos: Cursor da última nota da página anterior (avança)
+        antes: Cursor da primeira nota da página seguinte (volta)
+
+    Returns:
+        PaginaKeyset
+    """
+    chave_antes = decodificar_cursor(antes)
+    chave_apos = decodificar_cursor(apos)
+
+    if chave_antes:
+        # Volta: lê em ordem crescente a partir do cursor e inverte
+        data, pk = chave_antes
+        itens = list(
+            queryset.filter(Q(data_emissao__gt=data) | Q(data_emissao=data, pk__gt=pk))
+            .order_by('data_emissao', 'pk')[:tamanho + 1]
+        )
+        ha_mais = len(itens) > tamanho
+        itens = itens[:tamanho][::-1]
+        return PaginaKeyset(
+            itens=itens,
+            cursor_anterior=codificar_cursor(itens[0]) if ha_mais and itens else None,
+            cursor_proximo=codificar_cursor(itens[-1]) if itens else None,
+        )
+
+    if chave_apos:
+        data, pk = chave_apos
+        queryset = queryset.filter(Q(data_emissao__lt=data) | Q(data_emissao=data, pk__lt=pk))
+
+    # Uma nota a mais indica se existe próxima página
+    itens = list(queryset.order_by('-data_emissao', '-pk')[:tamanho + 1])
+    ha_mais = len(itens) > tamanho
+    itens = itens[:tamanho]
+    return PaginaKeyset(
+        itens=itens,
+        cursor_anterior=codificar_cursor(itens[0]) if chave_apos and itens else None,
+        cursor_proximo=codificar_cursor(itens[-1]) if ha_mais else None,
+    )
+
+
+def contar_em_cache(queryset, empresa_id, filtros: dict) -> int:
+    """
+    Conta as notas de um filtro, guardando o resultado no cache.
+
+    Args:
+        queryset: QuerySet filtrado
+        empresa_id: Empresa da lista (parte da chave do cache)
+        filtros: Valores dos filtros aplicados (parte da chave do cache; períodos
+                 relativos devem vir com as datas resolvidas, ver
+                 FiltroNotasFiscaisForm.filtros_aplicados)
+
+    Returns:
+        Total de notas (pode estar defasado em até NFE_LISTA_CACHE_CONTAGEM segundos)
+    """
+    assinatura = hashlib.sha1(
+        json.dumps(filtros, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    chave = f"nfe:lista:contagem:{empresa_id}:{assinatura}"
+
+    total = cache.get(chave)
+    if total is None:
+        total = queryset.count()
+        cache.set(chave, total, settings.NFE_LISTA_CACHE_CONTAGEM)
+    return total
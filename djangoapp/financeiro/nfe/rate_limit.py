@@ -0,0 +1,163 @@
+"""
+Limite de consultas à SEFAZ por CNPJ, compartilhado entre processos via Redis.
+
+Todas as chamadas do SefazClient (views, task de 4 horas e task histórica)
+passam pelo mesmo token bucket do CNPJ. Quando a SEFAZ responde 656
+(Consumo Indevido), o CNPJ fica bloqueado até o horário de liberação gravado
+no Redis e nenhuma consulta é enviada antes disso.
+"""
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Optional
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+
+# Token bucket atômico. Usa o relógio do Redis para que todos os workers
+# enxerguem o mesmo tempo. Retorna 0 quando o token foi obtido ou os
+# milissegundos a aguardar até o próximo token.
+_SCRIPT_TOKEN_BUCKET = """
+local capacidade = tonumber(ARGV[1])
+local taxa = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local agora = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local estado = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(estado[1])
+local ts = tonumber(estado[2])
+if tokens == nil then
+    tokens = capacidade
+    ts = agora
+end
+
+tokens = math.min(capacidade, tokens + (agora - ts) * taxa / 1000)
+
+local espera = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    espera = math.ceil((1 - tokens) * 1000 / taxa)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', agora)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacidade * 1000 / taxa) + 60000)
+return espera
+"""
+
+
+class SefazBloqueadaError(Exception):
+    """O CNPJ está bloqueado pela SEFAZ (656 - Consumo Indevido) até `ate`."""
+
+    def __init__(self, cnpj: str, ate: datetime):
+        self.cnpj = cnpj
+        self.ate = ate
+        horario = timezone.localtime(ate).strftime('%d/%m/%Y %H:%M')
+        super().__init__(f"Consumo Indevido (656): CNPJ {cnpj} bloqueado na SEFAZ até {horario}")
+
+
+class LimiteSefazExcedidoError(Exception):
+    """Nenhum token do CNPJ ficou disponível dentro da espera máxima."""
+
+
+class LimitadorSefaz:
+    """Token bucket por CNPJ e controle de bloqueio após erro 656."""
+
+    PREFIXO = 'nfe:sefaz'
+
+    def __init__(self, redis_url: str, capacidade: int, chamadas_por_minuto: float,
+                 bloqueio_656_segundos: int, espera_maxima: float):
+        self.redis_url = redis_url
+        self.capacidade = capacidade
+        self.taxa = chamadas_por_minuto / 60.0
+        self.bloqueio_656_segundos = bloqueio_656_segundos
+        self.espera_maxima = espera_maxima
+        self._redis = None
+        self._script = None
+
+    def _conexao(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.redis_url, socket_connect_timeout=2, socket_timeout=5)
+            self._script = self._redis.register_script(_SCRIPT_TOKEN_BUCKET)
+        return self._redis
+
+    def _chave(self, tipo: str, cnpj: str) -> str:
+        return f"{self.PREFIXO}:{tipo}:{cnpj}"
+
+    def bloqueado_ate(self, cnpj: str) -> Optional[datetime]:
+        """Retorna o horário de liberação do CNPJ, ou None se não estiver bloqueado."""
+        try:
+            valor = self._conexao().get(self._chave('bloqueio', cnpj))
+        except redis.RedisError as e:
+            print(f"[SEFAZ Limite] Redis indisponível, bloqueio não verificado: {e}")
+            return None
+
+        if not valor:
+            return None
+
+        ate = datetime.fromtimestamp(float(valor), tz=dt_timezone.utc)
+        if ate <= datetime.now(dt_timezone.utc):
+            return None
+        return ate
+
+    def bloquear(self, cnpj: str, segundos: int = None) -> datetime:
+        """Bloqueia novas consultas do CNPJ (após 656 - Consumo Indevido)."""
+        segundos = segundos or self.bloqueio_656_segundos
+        ate = datetime.now(dt_timezone.utc).timestamp() + segundos
+
+        try:
+            self._conexao().set(self._chave('bloqueio', cnpj), ate, ex=segundos)
+        except redis.RedisError as e:
+            print(f"[SEFAZ Limite] Redis indisponível, bloqueio não registrado: {e}")
+
+        print(f"[SEFAZ Limite] CNPJ {cnpj} bloqueado por {segundos}s")
+        return datetime.fromtimestamp(ate, tz=dt_timezone.utc)
+
+    def desbloquear(self, cnpj: str):
+        """Remove o bloqueio do CNPJ."""
+        self._conexao().delete(self._chave('bloqueio', cnpj))
+
+    def adquirir(self, cnpj: str):
+        """
+        Aguarda um token do CNPJ antes de uma chamada à SEFAZ.
+
+        Raises:
+            SefazBloqueadaError: Se o CNPJ estiver bloqueado por 656
+            LimiteSefazExcedidoError: Se o token não for obtido dentro da espera máxima
+        """
+        inicio = time.monotonic()
+
+        while True:
+            ate = self.bloqueado_ate(cnpj)
+            if ate:
+                raise SefazBloqueadaError(cnpj, ate)
+
+            try:
+                self._conexao()
+                espera_ms = self._script(
+                    keys=[self._chave('bucket', cnpj)],
+                    args=[self.capacidade, self.taxa],
+                )
+            except redis.RedisError as e:
+                print(f"[SEFAZ Limite] Redis indisponível, consulta liberada sem limite: {e}")
+                return
+
+            if not espera_ms:
+                return
+
+            espera = espera_ms / 1000
+            if time.monotonic() - inicio + espera > self.espera_maxima:
+                raise LimiteSefazExcedidoError(
+                    f"Limite de consultas à SEFAZ atingido para o CNPJ {cnpj}. Tente novamente em instantes."
+                )
+            time.sleep(espera)
+
+
+limitador_sefaz = LimitadorSefaz(
+    redis_url=settings.NFE_RATE_LIMIT_REDIS_URL,
+    capacidade=settings.NFE_RATE_LIMIT_CAPACIDADE,
+    chamadas_por_minuto=settings.NFE_RATE_LIMIT_POR_MINUTO,
+    bloqueio_656_segundos=settings.NFE_BLOQUEIO_656_SEGUNDOS,
+    espera_maxima=settings.NFE_RATE_LIMIT_ESPERA_MAXIMA,
+)
@@ -0,0 +1,77 @@
+"""
+Resolução em lote dos resumos (resNFe) retornados pela distribuição DF-e.
+
+Os resumos de um lote são trocados pelo XML completo (consChNFe) usando um
+pool pequeno de threads, antes de qualquer escrita no banco. O ritmo das
+consultas é controlado pelo limitador por CNPJ do SefazClient.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from django.conf import settings
+
+from .sefaz_client import DocumentoDFe, garantir_fora_de_transacao
+
+
+def buscar_documentos_completos(client, chaves: List[str], max_workers: int = None) -> List[Optional[DocumentoDFe]]:
+    """
+    Busca o documento completo (consChNFe) de várias chaves em paralelo.
+
+    Args:
+        client: SefazClient do certificado
+        chaves: Chaves de acesso
+        max_workers: Máximo de consultas simultâneas
+
+    Returns:
+        Lista na mesma ordem das chaves (None quando não obtido)
+    """
+    if not chaves:
+        return []
+
+    # As threads do pool usam conexões próprias: a verificação de _enviar
+    # não enxergaria uma transação aberta nesta thread
+    garantir_fora_de_transacao("Resolução de resumos")
+
+    if max_workers is None:
+        max_workers = settings.NFE_RESOLVER_MAX_WORKERS
+
+    print(f"Resolvendo {len(chaves)} resumo(s) com até {max_workers} consulta(s) simultânea(s)")
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='resnfe') as executor:
+        return list(executor.map(client.buscar_documento_completo, chaves))
+
+
+def resolver_resumos(client, documentos: List[DocumentoDFe], max_workers: int = None) -> List[DocumentoDFe]:
+    """
+    Substitui os resumos (resNFe) de um lote pelo documento completo da NF-e.
+
+    Args:
+        client: SefazClient do certificado
+        documentos: Documentos retornados pela SEFAZ
+        max_workers: Máximo de consultas simultâneas
+
+    Returns:
+        Lista na mesma ordem de entrada; resumos cujo XML completo não foi
+        obtido são mantidos como estão
+    """
+    pendentes = []
+    for posicao, documento in enumerate(documentos):
+        if documento.eh_resumo:
+            chave = client.extrair_chave_resumo(documento.xml)
+            if chave:
+                pendentes.append((posicao, chave))
+
+    if not pendentes:
+        return list(documentos)
+
+    completos = buscar_documentos_completos(client, [chave for _, chave in pendentes], max_workers)
+
+    resolvidos = list(documentos)
+    for (posicao, chave), completo in zip(pendentes, completos):
+        if completo is not None:
+            # Mantém o NSU da distribuição do CNPJ (o do resumo)
+            completo.nsu = resolvidos[posicao].nsu
+            resolvidos[posicao] = completo
+        else:
+            print(f"Não foi possível obter XML completo, usando resumo: {chave}")
+
+    return resolvidos
@@ -5,13 +5,64 @@ Adaptado do script original para uso no Django.
 import base64
 import gzip
 import os
+import ssl
+import threading
+import time
 from datetime import datetime
-from typing import List, Tuple, Optional
-from decimal import Decimal
+from io import BytesIO
+from typing import Iterator, List, Tuple, Optional
 
-import requests_pkcs12
+import requests
+from requests.adapters import HTTPAdapter
+from requests_pkcs12 import Pkcs12Adapter
 from lxml import etree
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db import connection
+
+from . import metadados
+from .rate_limit import limitador_sefaz
+
+
+NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+
+
+class ConsultaEmTransacaoError(Exception):
+    """Consulta à SEFAZ disparada com uma transação do banco aberta."""
+
+
+def garantir_fora_de_transacao(operacao: str):
+    """
+    Impede chamadas à SEFAZ dentro de transaction.atomic(): uma resposta lenta
+    (até 60s por chamada) manteria a transação e os locks das linhas abertos.
+
+    Args:
+        operacao: Descrição da chamada, para a mensagem de erro
+
+    Raises:
+        ConsultaEmTransacaoError: Se a conexão da thread atual estiver em um bloco atomic
+    """
+    if connection.in_atomic_block:
+        raise ConsultaEmTransacaoError(
+            f"{operacao} chamada dentro de uma transação do banco. "
+            "Consulte a SEFAZ antes de abrir a transação (veja financeiro/nfe/importacao.py)."
+        )
+
+
+class SSLContextAdapter(HTTPAdapter):
+    """Adapter HTTPS que usa um SSLContext já carregado com o certificado do cliente."""
+
+    def __init__(self, ssl_context: ssl.SSLContext, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super().proxy_manager_for(*args, **kwargs)
 
 
 class SefazClient:
@@ -26,21 +77,89 @@ class SefazClient:
         '42': 'https://www1.nfe.fazenda.gov.br/NFeDistribuicaoDFe/NFeDistribuicaoDFe.asmx',  # SC
     }
 
-    def __init__(self, certificado_path: str, certificado_senha: str, cnpj: str, uf_cod: str):
+    def __init__(self, certificado_path: str, certificado_senha: Optional[str], cnpj: str, uf_cod: str,
+                 ssl_context: Optional[ssl.SSLContext] = None):
         """
         Inicializa o cliente SEFAZ.
 
         Args:
             certificado_path: Caminho para o arquivo .pfx
-            certificado_senha: Senha do certificado
+            certificado_senha: Senha do certificado (dispensável se ssl_context for informado)
             cnpj: CNPJ para consulta (14 dígitos, sem formatação)
             uf_cod: Código da UF (2 dígitos)
+            ssl_context: SSLContext já carregado com o certificado (evita novo parse do PFX)
         """
         self.certificado_path = certificado_path
         self.certificado_senha = certificado_senha
+        self.ssl_context = ssl_context
         self.cnpj = cnpj.replace('.', '').replace('/', '').replace('-', '')
         self.uf_cod = uf_cod
-        self.url = self.URLS_SEFAZ.get(uf_cod, self.URLS_SEFAZ['nacional'])
+        # NFE_SEFAZ_URL aponta todas as consultas para outro endpoint (ex.: simulador local)
+        self.url = settings.NFE_SEFAZ_URL or self.URLS_SEFAZ.get(uf_cod, self.URLS_SEFAZ['nacional'])
+        self._session = None
+        self._session_lock = threading.Lock()
+        # TelemetriaSefaz ligada durante uma sincronização medida (financeiro/nfe/telemetria.py)
+        self.telemetria = None
+
+    @classmethod
+    def do_certificado(cls, certificado) -> 'SefazClient':
+        """
+        Cria um cliente para um CertificadoDigital usando o cache de certificados
+        do processo (senha descriptografada e PFX processado uma única vez).
+
+        Args:
+            certificado: Instância de CertificadoDigital
+
+        Returns:
+            SefazClient
+        """
+        from financeiro.nfe.certificado_cache import cache_certificados
+
+        material = cache_certificados.obter(certificado)
+        return cls(
+            certificado_path=certificado.arquivo_pfx.path,
+            certificado_senha=None,
+            cnpj=certificado.filial.cnpj,
+            uf_cod=certificado.uf_codigo,
+            ssl_context=material.ssl_context,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.fechar()
+
+    def _obter_sessao(self) -> requests.Session:
+        """
+        Retorna a sessão HTTPS (mTLS) do certificado, criando-a na primeira chamada.
+
+        O PFX é lido e convertido em SSLContext uma única vez; as conexões
+        ficam em keep-alive no pool do adapter e são reaproveitadas por todas
+        as consultas feitas com este cliente, inclusive a partir de threads.
+        """
+        with self._session_lock:
+            if self._session is None:
+                if self.ssl_context is not None:
+                    adapter = SSLContextAdapter(self.ssl_context)
+                else:
+                    adapter = Pkcs12Adapter(
+                        pkcs12_filename=self.certificado_path,
+                        pkcs12_password=self.certificado_senha,
+                    )
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.headers.update({
+                    "Content-Type": "application/soap+xml; charset=utf-8",
+                })
+                self._session = session
+            return self._session
+
+    def fechar(self):
+        """Encerra a sessão HTTPS e as conexões mantidas no pool."""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
 
     def _criar_envelope_soap(self, ult_nsu: str = "000000000000000", chave_nfe: str = None) -> str:
         """Cria envelope SOAP para consulta de DFe"""
@@ -74,146 +193,169 @@ class SefazClient:
   </soap12:Body>
 </soap12:Envelope>"""
 
-    def consultar_dfe(self, ult_nsu: str = "000000000000000", chave_nfe: str = None) -> etree._Element:
+    def _enviar(self, ult_nsu: str = "000000000000000", chave_nfe: str = None) -> bytes:
         """
-        Consulta documentos fiscais via SOAP.
-
-        Args:
-            ult_nsu: Último NSU consultado
-            chave_nfe: Chave de acesso da NF-e (para buscar XML completo)
-
-        Returns:
-            XML da resposta
+        Envia a consulta SOAP e retorna o corpo da resposta sem parse.
 
         Raises:
+            SefazBloqueadaError: Se o CNPJ estiver bloqueado por consumo indevido
+            ConsultaEmTransacaoError: Se houver uma transação do banco aberta
             Exception: Em caso de erro na consulta
         """
+        garantir_fora_de_transacao("Consulta SOAP à SEFAZ")
+
         envelope = self._criar_envelope_soap(ult_nsu, chave_nfe)
 
-        headers = {
-            "Content-Type": "application/soap+xml; charset=utf-8",
-        }
+        # Token do CNPJ (compartilhado entre processos); falha se houver bloqueio 656
+        limitador_sefaz.adquirir(self.cnpj)
 
         try:
-            response = requests_pkcs12.post(
+            response = self._obter_sessao().post(
                 self.url,
                 data=envelope.encode("utf-8"),
-                headers=headers,
-                pkcs12_filename=self.certificado_path,
-                pkcs12_password=self.certificado_senha,
-                timeout=60
+                timeout=60,
+                # CA alternativa (simulador); passada por chamada para prevalecer sobre REQUESTS_CA_BUNDLE
+                verify=settings.NFE_SEFAZ_CA_BUNDLE or True
             )
 
             if response.status_code != 200:
                 raise Exception(f"HTTP {response.status_code}: {response.text[:500]}")
 
-            return etree.fromstring(response.content)
+            return response.content
 
         except Exception as e:
             raise Exception(f"Erro na consulta SOAP: {e}")
 
-    def buscar_xml_completo(self, chave_acesso: str) -> Optional[etree._Element]:
+    def consultar_lote(self, ult_nsu: str = "000000000000000", chave_nfe: str = None) -> 'LoteDFe':
         """
-        Busca o XML completo de uma NF-e pela chave de acesso.
+        Consulta documentos fiscais e devolve a resposta para leitura incremental.
 
         Args:
-            chave_acesso: Chave de 44 dígitos da NF-e
+            ult_nsu: Último NSU consultado
+            chave_nfe: Chave de acesso da NF-e (para buscar XML completo)
 
         Returns:
-            XML completo da NF-e ou None se não encontrado
+            LoteDFe com cabeçalho (cStat, NSUs) já lido
+
+        Raises:
+            SefazBloqueadaError: Se o CNPJ estiver bloqueado por consumo indevido
+            Exception: Em caso de erro na consulta ou status de erro da SEFAZ
         """
+        tipo = 'consChNFe' if chave_nfe else 'distNSU'
+        inicio = time.perf_counter()
         try:
-            resposta_xml = self.consultar_dfe(chave_nfe=chave_acesso)
-            documentos, _, _, _ = self.extrair_documentos(resposta_xml)
+            conteudo = self._enviar(ult_nsu, chave_nfe)
+        except Exception:
+            if self.telemetria is not None:
+                self.telemetria.registrar(tipo, time.perf_counter() - inicio, 0, 'falha')
+            raise
 
-            if documentos:
-                return documentos[0]
+        lote = LoteDFe(conteudo)
+        if self.telemetria is not None:
+            self.telemetria.registrar(tipo, time.perf_counter() - inicio, len(conteudo), lote.cstat)
 
-            return None
+        print(f"Status SEFAZ: {lote.cstat} - {lote.xmotivo}")
+        lote.mensagem = self._tratar_status(lote.cstat, lote.xmotivo)
+        return lote
+
+    def buscar_documento_completo(self, chave_acesso: str) -> Optional['DocumentoDFe']:
+        """
+        Busca o documento completo (procNFe) de uma NF-e pela chave de acesso.
+
+        Args:
+            chave_acesso: Chave de 44 dígitos da NF-e
+
+        Returns:
+            DocumentoDFe com os bytes originais ou None se não encontrado
+        """
+        try:
+            lote = self.consultar_lote(chave_nfe=chave_acesso)
+            return next(iter(lote), None)
 
         except Exception as e:
             print(f"Erro ao buscar XML completo da chave {chave_acesso}: {e}")
             return None
 
-    def extrair_documentos(self, resposta_xml: etree._Element) -> Tuple[List[etree._Element], str, str, str]:
+    def buscar_xml_completo(self, chave_acesso: str) -> Optional[etree._Element]:
         """
-        Extrai e decodifica documentos do XML de resposta.
+        Busca o XML completo de uma NF-e pela chave de acesso.
 
         Args:
-            resposta_xml: XML da resposta SOAP
+            chave_acesso: Chave de 44 dígitos da NF-e
 
         Returns:
-            Tupla (documentos, ultNSU, maxNSU, mensagem)
-
-        Raises:
-            Exception: Em caso de erro não recuperável
+            XML completo da NF-e ou None se não encontrado
         """
-        documentos = []
-
-        # Namespace SOAP
-        ns = {
-            'soap': 'http://www.w3.org/2003/05/soap-envelope',
-            'nfe': 'http://www.portalfiscal.inf.br/nfe'
-        }
+        documento = self.buscar_documento_completo(chave_acesso)
+        return documento.xml if documento is not None else None
 
-        # Busca código de status
-        cStat = resposta_xml.findtext('.//nfe:cStat', namespaces=ns)
-        xMotivo = resposta_xml.findtext('.//nfe:xMotivo', namespaces=ns)
+    def _tratar_status(self, cStat: Optional[str], xMotivo: Optional[str]) -> Optional[str]:
+        """
+        Interpreta o cStat da resposta de distribuição.
 
-        # Debug
-        print(f"Status SEFAZ: {cStat} - {xMotivo}")
+        Returns:
+            xMotivo em caso de sucesso (138) ou a mensagem de status quando
+            não há documentos (656)
 
-        # Extrai NSUs (mesmo em caso de erro, podem estar presentes)
-        ultNSU = resposta_xml.findtext('.//nfe:ultNSU', namespaces=ns)
-        maxNSU = resposta_xml.findtext('.//nfe:maxNSU', namespaces=ns)
+        Raises:
+            Exception: Em caso de erro não recuperável
+        """
+        if cStat == "138":  # 138 = sucesso
+            return xMotivo
+
+        status_msg = f"Status {cStat}: {xMotivo}" if cStat else "Resposta inválida"
+
+        if cStat == "656":
+            # 656 pode ser "nenhum documento" OU "consumo indevido"
+            if "Consumo Indevido" in (xMotivo or ""):
+                # Congela o CNPJ para todos os processos até a liberação
+                limitador_sefaz.bloquear(self.cnpj)
+                # Retorna os NSUs para atualizar o certificado
+                print(f"SEFAZ - Consumo Indevido: {status_msg}")
+            else:
+                # Nenhum documento encontrado (normal)
+                print(f"SEFAZ - Sem documentos: {status_msg}")
+            return status_msg
+
+        print(f"Erro SEFAZ: {status_msg}")
+        raise Exception(status_msg)
 
-        if cStat != "138":  # 138 = sucesso
-            status_msg = f"Status {cStat}: {xMotivo}" if cStat else "Resposta inválida"
+    @staticmethod
+    def abrir_doc_zip(conteudo_b64: Optional[str], nsu: str = '', schema: str = '') -> Optional['DocumentoDFe']:
+        """
+        Decodifica o conteúdo de um docZip (Base64 + GZIP) mantendo os bytes originais.
 
-            if cStat == "656":
-                # 656 pode ser "nenhum documento" OU "consumo indevido"
-                if "Consumo Indevido" in (xMotivo or ""):
-                    # Retorna os NSUs para atualizar o certificado
-                    print(f"SEFAZ - Consumo Indevido: {status_msg}")
-                    return [], ultNSU, maxNSU, status_msg
-                else:
-                    # Nenhum documento encontrado (normal)
-                    print(f"SEFAZ - Sem documentos: {status_msg}")
-                    return [], ultNSU, maxNSU, status_msg
+        Args:
+            conteudo_b64: Texto do elemento docZip
+            nsu: Atributo NSU do docZip
+            schema: Atributo schema do docZip
 
-            print(f"Erro SEFAZ: {status_msg}")
-            raise Exception(status_msg)
+        Returns:
+            DocumentoDFe ou None se vazio/inválido
+        """
+        if not conteudo_b64:
+            return None
 
-        # Extrai documentos
-        docs_zip = resposta_xml.findall('.//nfe:docZip', namespaces=ns)
+        try:
+            # Decodifica Base64
+            conteudo_comprimido = base64.b64decode(conteudo_b64)
 
-        for doc_zip in docs_zip:
+            # Descomprime GZIP
             try:
-                # O conteúdo está em Base64
-                conteudo_b64 = doc_zip.text
-                if not conteudo_b64:
-                    continue
-
-                # Decodifica Base64
-                conteudo_comprimido = base64.b64decode(conteudo_b64)
-
-                # Descomprime GZIP
-                try:
-                    conteudo_xml = gzip.decompress(conteudo_comprimido)
-                except:
-                    # Se não estiver comprimido, usa direto
-                    conteudo_xml = conteudo_comprimido
-
-                # Parse XML
-                xml = etree.fromstring(conteudo_xml)
-                documentos.append(xml)
+                conteudo_xml = gzip.decompress(conteudo_comprimido)
+            except:
+                # Se não estiver comprimido, usa direto
+                conteudo_xml = conteudo_comprimido
 
-            except Exception as e:
-                # Log do erro, mas continua processando outros documentos
-                print(f"⚠️  Erro ao processar documento: {e}")
-                continue
+            # Parse XML (valida o documento; a árvore é liberada após os metadados)
+            documento = DocumentoDFe(conteudo_xml, nsu, schema)
+            documento.xml
+            return documento
 
-        return documentos, ultNSU, maxNSU, xMotivo
+        except Exception as e:
+            # Log do erro, mas continua processando outros documentos
+            print(f"⚠️  Erro ao processar documento: {e}")
+            return None
 
     def sincronizar_nsu(self) -> Tuple[str, str, str]:
         """
@@ -228,56 +370,30 @@ class SefazClient:
         """
         try:
             # Faz uma consulta com NSU zero para obter os NSUs atuais
-            resposta_xml = self.consultar_dfe("000000000000000")
-            _, ult_nsu, max_nsu, mensagem = self.extrair_documentos(resposta_xml)
+            lote = self.consultar_lote("000000000000000")
 
-            return ult_nsu or "000000000000000", max_nsu or "000000000000000", mensagem
+            return lote.ult_nsu or "000000000000000", lote.max_nsu or "000000000000000", lote.mensagem
 
         except Exception as e:
             # Mesmo em caso de erro, tenta extrair os NSUs da resposta
             print(f"Erro ao sincronizar NSU: {e}")
             raise
 
-    def buscar_todos_documentos(self, nsu_inicial: str = "000000000000000") -> List[etree._Element]:
+    def distribuicao(self, nsu_inicial: str = "000000000000000", max_iteracoes: int = 100) -> 'DistribuicaoDFe':
         """
-        Busca todos os documentos disponíveis a partir de um NSU.
+        Iterador com todos os documentos disponíveis a partir de um NSU.
+
+        Os lotes são consultados sob demanda e cada documento é decodificado
+        apenas quando consumido.
 
         Args:
             nsu_inicial: NSU inicial para busca
+            max_iteracoes: Limite de consultas distNSU
 
         Returns:
-            Lista de XMLs dos documentos
+            DistribuicaoDFe
         """
-        ult_nsu = nsu_inicial
-        docs_todos = []
-        iteracao = 0
-        max_iteracoes = 100  # Limite de segurança
-
-        while iteracao < max_iteracoes:
-            iteracao += 1
-
-            try:
-                resposta_xml = self.consultar_dfe(ult_nsu)
-                novos, novo_nsu, max_nsu, mensagem = self.extrair_documentos(resposta_xml)
-
-                if not novos:
-                    break
-
-                docs_todos.extend(novos)
-
-                # Atualiza NSU
-                if novo_nsu:
-                    ult_nsu = novo_nsu
-
-                # Se chegou no final
-                if novo_nsu == max_nsu:
-                    break
-
-            except Exception as e:
-                print(f"❌ Erro na iteração {iteracao}: {e}")
-                break
-
-        return docs_todos
+        return DistribuicaoDFe(self, nsu_inicial, max_iteracoes)
 
     @staticmethod
     def extrair_data_emissao(xml: etree._Element) -> Optional[datetime]:
@@ -290,17 +406,7 @@ class SefazClient:
         Returns:
             Data de emissão ou None
         """
-        dhEmi = xml.findtext(".//{*}dhEmi")
-        if dhEmi:
-            try:
-                return datetime.fromisoformat(dhEmi.replace("Z", "+00:00"))
-            except:
-                try:
-                    # Tenta apenas a parte da data
-                    return datetime.strptime(dhEmi[:10], "%Y-%m-%d")
-                except:
-                    pass
-        return None
+        return metadados.extrair_data_emissao(xml)
 
     @staticmethod
     def eh_resumo_nfe(xml: etree._Element) -> bool:
@@ -317,8 +423,8 @@ class SefazClient:
         if xml.tag.endswith('resNFe'):
             return True
 
-        # Verifica se é procNFe ou NFe (completo)
-        if xml.tag.endswith('procNFe') or xml.tag.endswith('NFe'):
+        # Verifica se é procNFe (raiz nfeProc) ou NFe (completo)
+        if xml.tag.endswith('nfeProc') or xml.tag.endswith('procNFe') or xml.tag.endswith('NFe'):
             return False
 
         # Se não identificar, assume que é resumo
@@ -340,7 +446,7 @@ class SefazClient:
     @staticmethod
     def extrair_metadados_nfe(xml: etree._Element) -> dict:
         """
-        Extrai metadados principais da NF-e.
+        Extrai metadados principais da NF-e (uma única passada pelo documento).
 
         Args:
             xml: XML do documento
@@ -348,89 +454,14 @@ class SefazClient:
         Returns:
             Dicionário com metadados
         """
-        # Namespace NFe
-        ns = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
-
-        # Tenta com namespace e sem namespace (usando {*})
-        def buscar_texto(xpath_com_ns, xpath_sem_ns):
-            valor = xml.findtext(xpath_com_ns, namespaces=ns)
-            if valor is None:
-                valor = xml.findtext(xpath_sem_ns)
-            return valor
-
-        chave = buscar_texto('.//nfe:chNFe', './/{*}chNFe')
-        numero = buscar_texto('.//nfe:nNF', './/{*}nNF')
-        serie = buscar_texto('.//nfe:serie', './/{*}serie')
-        dhEmi = buscar_texto('.//nfe:dhEmi', './/{*}dhEmi')
-
-        # Emitente
-        emit_cnpj = buscar_texto('.//nfe:emit/nfe:CNPJ', './/{*}emit/{*}CNPJ')
-        emit_nome = buscar_texto('.//nfe:emit/nfe:xNome', './/{*}emit/{*}xNome')
-
-        # Valores
-        valor_total_str = buscar_texto('.//nfe:total/nfe:ICMSTot/nfe:vNF', './/{*}total/{*}ICMSTot/{*}vNF')
-        valor_desconto_str = buscar_texto('.//nfe:total/nfe:ICMSTot/nfe:vDesc', './/{*}total/{*}ICMSTot/{*}vDesc')
-
-        # NSU
-        nsu = xml.get('NSU', '')
+        return metadados.extrair_metadados(xml)
 
-        # Converte valores
-        try:
-            valor_total = Decimal(valor_total_str) if valor_total_str else Decimal('0.00')
-        except:
-            valor_total = Decimal('0.00')
-
-        try:
-            valor_desconto = Decimal(valor_desconto_str) if valor_desconto_str else Decimal('0.00')
-        except:
-            valor_desconto = Decimal('0.00')
-
-        valor_liquido = valor_total - valor_desconto
-
-        # Data de emissão
-        data_emissao = None
-        if dhEmi:
-            try:
-                data_emissao = datetime.fromisoformat(dhEmi.replace("Z", "+00:00"))
-            except:
-                try:
-                    data_emissao = datetime.strptime(dhEmi[:10], "%Y-%m-%d")
-                except:
-                    pass
-
-        return {
-            'chave_acesso': chave or '',
-            'numero': numero or '',
-            'serie': serie or '',
-            'data_emissao': data_emissao,
-            'emitente_cnpj': emit_cnpj or '',
-            'emitente_nome': emit_nome or '',
-            'valor_total': valor_total,
-            'valor_desconto': valor_desconto,
-            'valor_liquido': valor_liquido,
-            'nsu': nsu,
-        }
-
-    @staticmethod
-    def xml_to_string(xml: etree._Element) -> bytes:
-        """
-        Converte XML Element para string formatada.
-
-        Args:
-            xml: XML Element
-
-        Returns:
-            bytes: XML formatado
-        """
-        return etree.tostring(xml, encoding='utf-8', pretty_print=True)
-
-    def filtrar_por_periodo(self, documentos: List[etree._Element],
-                           data_inicio: datetime, data_fim: datetime) -> List[etree._Element]:
+    def filtrar_por_periodo(self, documentos: List, data_inicio: datetime, data_fim: datetime) -> List:
         """
         Filtra documentos por período.
 
         Args:
-            documentos: Lista de XMLs
+            documentos: Lista de XMLs ou de DocumentoDFe
             data_inicio: Data inicial
             data_fim: Data final
 
@@ -440,7 +471,7 @@ class SefazClient:
         filtradas = []
 
         for xml in documentos:
-            data_emissao = self.extrair_data_emissao(xml)
+            data_emissao = self.extrair_data_emissao(xml.xml if isinstance(xml, DocumentoDFe) else xml)
             if data_emissao:
                 # Converte para date se necessário
                 data_check = data_emissao.date() if hasattr(data_emissao, 'date') else data_emissao
@@ -451,3 +482,169 @@ class SefazClient:
                     filtradas.append(xml)
 
         return filtradas
+
+
+class DocumentoDFe:
+    """
+    Documento entregue pela distribuição DF-e.
+
+    Guarda os bytes exatamente como vieram no docZip (após Base64 + GZIP), que
+    são o que vai para o arquivo da nota, e a árvore lxml apenas enquanto ela é
+    necessária: `extrair_metadados()` libera a árvore após a leitura.
+    """
+
+    __slots__ = ('conteudo', 'nsu', 'schema', '_xml')
+
+    def __init__(self, conteudo: bytes, nsu: str = '', schema: str = ''):
+        self.conteudo = conteudo
+        self.nsu = nsu
+        self.schema = schema
+        self._xml = None
+
+    @property
+    def xml(self) -> etree._Element:
+        """Árvore do documento (refeita a partir dos bytes se já liberada)."""
+        if self._xml is None:
+            self._xml = etree.fromstring(self.conteudo)
+        return self._xml
+
+    def liberar(self):
+        """Descarta a árvore lxml, mantendo apenas os bytes originais."""
+        self._xml = None
+
+    @property
+    def eh_resumo(self) -> bool:
+        if self.schema:
+            return self.schema.startswith('resNFe')
+        return SefazClient.eh_resumo_nfe(self.xml)
+
+    def extrair_metadados(self, itens: bool = False) -> dict:
+        """
+        Extrai os metadados (com o NSU do docZip) e libera a árvore.
+
+        Args:
+            itens: Também extrai os itens (det/prod) em dados['itens'], da mesma
+                   árvore, para não reprocessar o XML depois
+        """
+        dados = metadados.extrair_metadados(self.xml)
+        dados['nsu'] = self.nsu or dados['nsu']
+        if itens:
+            dados['itens'] = metadados.extrair_itens(self.xml)
+        self.liberar()
+        return dados
+
+
+class LoteDFe:
+    """
+    Resposta de uma consulta de distribuição lida de forma incremental (iterparse).
+
+    O cabeçalho (cStat, xMotivo, ultNSU, maxNSU) é lido na criação; os docZip
+    são decodificados um a um durante a iteração (como DocumentoDFe) e
+    descartados da árvore da resposta logo em seguida.
+
+    Cada leitura usa seu próprio iterparse, então o lote pode ser criado em
+    uma thread e consumido em outra.
+    """
+
+    CAMPOS = {'cStat': 'cstat', 'xMotivo': 'xmotivo', 'ultNSU': 'ult_nsu', 'maxNSU': 'max_nsu'}
+
+    def __init__(self, conteudo: bytes):
+        self.conteudo = conteudo
+        self.cstat = None
+        self.xmotivo = None
+        self.ult_nsu = None
+        self.max_nsu = None
+        self.mensagem = None
+        self.tem_doc_zip = False
+
+        # Lê até o primeiro docZip: o cabeçalho vem antes dos documentos
+        tags = [f'{{{NS_NFE}}}{nome}' for nome in (*self.CAMPOS, 'docZip')]
+        for _, elemento in etree.iterparse(BytesIO(conteudo), events=('end',), tag=tags):
+            nome = etree.QName(elemento).localname
+            if nome == 'docZip':
+                self.tem_doc_zip = True
+                break
+            setattr(self, self.CAMPOS[nome], elemento.text)
+
+    @property
+    def tem_documentos(self) -> bool:
+        return self.cstat == "138" and self.tem_doc_zip
+
+    def __iter__(self) -> Iterator['DocumentoDFe']:
+        if not self.tem_documentos:
+            return
+
+        eventos = etree.iterparse(BytesIO(self.conteudo), events=('end',), tag=f'{{{NS_NFE}}}docZip')
+        for _, doc_zip in eventos:
+            documento = SefazClient.abrir_doc_zip(doc_zip.text, doc_zip.get('NSU', ''), doc_zip.get('schema', ''))
+
+            # Libera o docZip já lido (e os anteriores) da árvore da resposta
+            doc_zip.clear()
+            while doc_zip.getprevious() is not None:
+                del doc_zip.getparent()[0]
+
+            if documento is not None:
+                yield documento
+
+
+class DistribuicaoDFe:
+    """
+    Documentos disponíveis na SEFAZ a partir de um NSU, consultados lote a lote.
+
+    Iterar sobre a instância entrega um documento por vez; `lotes()` entrega um
+    LoteDFe por passo de ultNSU. Ao final, `ult_nsu`, `max_nsu` e `mensagem`
+    refletem a última resposta recebida.
+
+    Erros na primeira consulta são propagados; erros nas seguintes encerram a
+    iteração e ficam em `erro`.
+    """
+
+    def __init__(self, client: SefazClient, nsu_inicial: str = "000000000000000", max_iteracoes: int = 100):
+        self.client = client
+        self.nsu_inicial = nsu_inicial
+        self.max_iteracoes = max_iteracoes
+        self.ult_nsu = nsu_inicial
+        self.max_nsu = None
+        self.mensagem = None
+        self.erro = None
+        self.iteracoes = 0
+
+    @property
+    def consumo_indevido(self) -> bool:
+        return "Consumo Indevido" in (self.mensagem or "")
+
+    def lotes(self) -> Iterator[LoteDFe]:
+        while self.iteracoes < self.max_iteracoes:
+            self.iteracoes += 1
+
+            try:
+                lote = self.client.consultar_lote(self.ult_nsu)
+            except Exception as e:
+                if self.iteracoes == 1:
+                    raise
+                print(f"❌ Erro na iteração {self.iteracoes}: {e}")
+                self.erro = e
+                return
+
+            self.mensagem = lote.mensagem
+            self.max_nsu = lote.max_nsu
+
+            if not lote.tem_documentos:
+                # Sem documentos (ou 656): ainda assim guarda o NSU retornado
+                if lote.ult_nsu:
+                    self.ult_nsu = lote.ult_nsu
+                return
+
+            yield lote
+
+            # Atualiza NSU
+            if lote.ult_nsu:
+                self.ult_nsu = lote.ult_nsu
+
+            # Se chegou no final
+            if lote.ult_nsu == lote.max_nsu:
+                return
+
+    def __iter__(self) -> Iterator[DocumentoDFe]:
+        for lote in self.lotes():
+            yield from lote
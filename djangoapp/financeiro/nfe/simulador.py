@@ -0,0 +1,322 @@
+"""
+Simulador local do web service NFeDistribuicaoDFe (SOAP 1.2 sobre mTLS).
+
+Atende distNSU e consChNFe com documentos sintéticos (financeiro.nfe.amostras)
+gerados de forma determinística por CNPJ e NSU, permitindo exercitar o
+SefazClient, as tasks e a consulta manual sem a SEFAZ real. Volume, latência,
+proporção de resumos e injeção do erro 656 são configuráveis.
+
+Uso: python manage.py simular_sefaz (ver o comando para as opções).
+"""
+import base64
+import gzip
+import os
+import random
+import ssl
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+from lxml import etree
+
+from .amostras import gerar_proc_nfe, gerar_res_nfe
+
+NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+
+_FUSO = timezone(timedelta(hours=-3))
+
+
+@dataclass
+class ConfiguracaoSimulador:
+    """Parâmetros de carga do simulador."""
+
+    documentos: int = 1000          # NSUs disponíveis por CNPJ (maxNSU)
+    lote: int = 50                  # docZip por resposta distNSU
+    latencia: float = 0.0           # segundos adicionados a cada resposta
+    proporcao_resumos: float = 0.7  # fração de resNFe entre os documentos
+    taxa_656: float = 0.0           # probabilidade de responder 656 (Consumo Indevido)
+    itens: int = 20                 # itens (det) por procNFe
+    fornecedores: int = 50          # CNPJs emitentes distintos
+    dias: int = 90                  # janela de emissão dos documentos
+
+
+class EstadoSimulador:
+    """Documentos gerados e contadores do simulador, compartilhados entre as threads."""
+
+    def __init__(self, config: ConfiguracaoSimulador):
+        self.config = config
+        self._lock = threading.Lock()
+        self._chaves = {}
+        self.requisicoes = {'distNSU': 0, 'consChNFe': 0, '656': 0}
+        self.inicio = datetime.now(_FUSO)
+
+    def _dados_documento(self, cnpj: str, nsu: int) -> Tuple[bool, int, str, datetime]:
+        """Sorteio determinístico de (resumo, número, emitente, emissão) para o NSU."""
+        rnd = random.Random(f"{cnpj}:{nsu}")
+        resumo = rnd.random() < self.config.proporcao_resumos
+        numero = nsu
+        emitente = f"{10000000 + rnd.randrange(self.config.fornecedores):08d}000191"
+        # NSUs mais altos são mais recentes
+        fracao = 1 - nsu / max(self.config.documentos, 1)
+        emissao = self.inicio - timedelta(days=self.config.dias * fracao, minutes=rnd.randint(0, 1439))
+        return resumo, numero, emitente, emissao
+
+    def documento(self, cnpj: str, nsu: int) -> Tuple[str, bytes]:
+        """
+        Retorna o documento do NSU para o CNPJ destinatário.
+
+        Returns:
+            Tupla (schema, xml)
+        """
+        resumo, numero, emitente, emissao = self._dados_documento(cnpj, nsu)
+        if resumo:
+            xml = gerar_res_nfe(numero, emitente, emissao=emissao, seed=nsu)
+            schema = 'resNFe_v1.01.xsd'
+        else:
+            xml = gerar_proc_nfe(numero, emitente, cnpj, emissao=emissao, itens=self.config.itens, seed=nsu)
+            schema = 'procNFe_v4.00.xsd'
+
+        # Guarda a chave para atender o consChNFe do resumo
+        chave = xml.split(b'<chNFe>', 1)[1][:44].decode('ascii')
+        with self._lock:
+            self._chaves[chave] = (cnpj, nsu)
+        return schema, xml
+
+    def documento_completo(self, chave: str) -> Optional[bytes]:
+        """Retorna o procNFe correspondente a uma chave já distribuída."""
+        with self._lock:
+            origem = self._chaves.get(chave)
+        if origem is None:
+            return None
+        cnpj, nsu = origem
+        _, numero, emitente, emissao = self._dados_documento(cnpj, nsu)
+        return gerar_proc_nfe(numero, emitente, cnpj, emissao=emissao, itens=self.config.itens, seed=nsu)
+
+    def contar(self, tipo: str):
+        with self._lock:
+            self.requisicoes[tipo] += 1
+
+
+def _doc_zip(nsu: int, schema: str, xml: bytes) -> str:
+    conteudo = base64.b64encode(gzip.compress(xml)).decode('ascii')
+    return f'<docZip NSU="{nsu:015d}" schema="{schema}">{conteudo}</docZip>'
+
+
+def _resposta_soap(cstat: str, xmotivo: str, ult_nsu: int, max_nsu: int, doc_zips: str = '') -> bytes:
+    lote = f'<loteDistDFeInt>{doc_zips}</loteDistDFeInt>' if doc_zips else ''
+    dh_resp = datetime.now(_FUSO).isoformat(timespec='seconds')
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">'
+        '<soap:Body><nfeDistDFeInteresseResponse xmlns="http://www.portalfiscal.inf.br/nfe/wsdl/NFeDistribuicaoDFe">'
+        f'<nfeDistDFeInteresseResult><retDistDFeInt xmlns="{NS_NFE}" versao="1.01">'
+        f'<tpAmb>1</tpAmb><verAplic>SIMULADOR</verAplic><cStat>{cstat}</cStat><xMotivo>{xmotivo}</xMotivo>'
+        f'<dhResp>{dh_resp}</dhResp><ultNSU>{ult_nsu:015d}</ultNSU><maxNSU>{max_nsu:015d}</maxNSU>{lote}'
+        '</retDistDFeInt></nfeDistDFeInteresseResult></nfeDistDFeInteresseResponse></soap:Body></soap:Envelope>'
+    ).encode('utf-8')
+
+
+class ManipuladorSefaz(BaseHTTPRequestHandler):
+    """Atende o POST SOAP do NFeDistribuicaoDFe (qualquer caminho)."""
+
+    protocol_version = 'HTTP/1.1'  # mantém a conexão aberta (keep-alive), como a SEFAZ
+    estado: EstadoSimulador = None
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _responder(self, status: int, corpo: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/soap+xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_POST(self):
+        tamanho = int(self.headers.get('Content-Length', 0))
+        corpo = self.rfile.read(tamanho)
+
+        try:
+            requisicao = etree.fromstring(corpo)
+        except etree.XMLSyntaxError:
+            self._responder(400, b'XML invalido')
+            return
+
+        config = self.estado.config
+        if config.latencia:
+            time.sleep(config.latencia)
+
+        cnpj = requisicao.findtext('.//{*}distDFeInt/{*}CNPJ') or ''
+        chave = requisicao.findtext('.//{*}consChNFe/{*}chNFe')
+        ult_nsu_texto = requisicao.findtext('.//{*}distNSU/{*}ultNSU')
+        max_nsu = config.documentos
+
+        if chave:
+            self.estado.contar('consChNFe')
+            xml = self.estado.documento_completo(chave)
+            if xml is None:
+                self._responder(200, _resposta_soap('137', 'Nenhum documento localizado', 0, 0))
+                return
+            self._responder(200, _resposta_soap(
+                '138', 'Documento localizado', 0, 0, _doc_zip(0, 'procNFe_v4.00.xsd', xml)
+            ))
+            return
+
+        if ult_nsu_texto is None:
+            self._responder(200, _resposta_soap('215', 'Rejeição: Falha no schema XML', 0, max_nsu))
+            return
+
+        self.estado.contar('distNSU')
+        ult_nsu = int(ult_nsu_texto or 0)
+
+        if config.taxa_656 and random.random() < config.taxa_656:
+            self.estado.contar('656')
+            self._responder(200, _resposta_soap(
+                '656',
+                'Rejeição: Consumo Indevido (Deve ser aguardado 1 hora para efetuar nova solicitação '
+                'caso não existam mais documentos a serem pesquisados. Tente após 1 hora)',
+                ult_nsu, max_nsu
+            ))
+            return
+
+        if ult_nsu >= max_nsu:
+            self._responder(200, _resposta_soap('137', 'Nenhum documento localizado', max_nsu, max_nsu))
+            return
+
+        ultimo = min(ult_nsu + config.lote, max_nsu)
+        doc_zips = ''.join(
+            _doc_zip(nsu, *self.estado.documento(cnpj, nsu))
+            for nsu in range(ult_nsu + 1, ultimo + 1)
+        )
+        self._responder(200, _resposta_soap('138', 'Documento localizado', ultimo, max_nsu, doc_zips))
+
+
+def criar_servidor(host: str, porta: int, config: ConfiguracaoSimulador, certificados: Dict[str, str],
+                   verbose: bool = False) -> ThreadingHTTPServer:
+    """
+    Cria o servidor HTTPS com autenticação mútua (exige certificado do cliente).
+
+    Args:
+        host: Endereço de escuta
+        porta: Porta de escuta
+        config: Parâmetros de carga
+        certificados: Caminhos retornados por gerar_certificados_teste
+        verbose: Registra cada requisição no console
+
+    Returns:
+        Servidor pronto para serve_forever()
+    """
+    manipulador = type('ManipuladorConfigurado', (ManipuladorSefaz,), {'estado': EstadoSimulador(config)})
+    servidor = ThreadingHTTPServer((host, porta), manipulador)
+    servidor.daemon_threads = True
+    servidor.verbose = verbose
+
+    contexto = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    contexto.load_cert_chain(certificados['servidor_certificado'], certificados['servidor_chave'])
+    contexto.load_verify_locations(certificados['ca'])
+    contexto.verify_mode = ssl.CERT_REQUIRED
+    # Handshake na thread de cada conexão, não no laço de accept
+    servidor.socket = contexto.wrap_socket(servidor.socket, server_side=True, do_handshake_on_connect=False)
+    return servidor
+
+
+def gerar_certificados_teste(diretorio: str, cnpj: str = '12345678000199', senha: str = 'simulador') -> Dict[str, str]:
+    """
+    Gera (se ainda não existirem) uma CA de teste, o certificado do servidor
+    (localhost/127.0.0.1) e um PFX de cliente A1 para o CNPJ informado.
+
+    Args:
+        diretorio: Onde gravar os arquivos
+        cnpj: CNPJ que aparece no certificado do cliente
+        senha: Senha do PFX do cliente
+
+    Returns:
+        Dicionário com os caminhos: ca, servidor_certificado, servidor_chave, cliente_pfx
+    """
+    import ipaddress
+
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives.serialization import pkcs12
+    from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+    caminhos = {
+        'ca': os.path.join(diretorio, 'ca.pem'),
+        'servidor_certificado': os.path.join(diretorio, 'servidor.pem'),
+        'servidor_chave': os.path.join(diretorio, 'servidor.key'),
+        'cliente_pfx': os.path.join(diretorio, f'cliente_{cnpj}.pfx'),
+    }
+    if all(os.path.exists(caminho) for caminho in caminhos.values()):
+        return caminhos
+
+    os.makedirs(diretorio, exist_ok=True)
+    agora = datetime.now(timezone.utc)
+    validade = agora + timedelta(days=365)
+
+    def nome(comum: str) -> x509.Name:
+        return x509.Name([
+            x509.NameAttribute(NameOID.COUNTRY_NAME, 'BR'),
+            x509.NameAttribute(NameOID.ORGANIZATION_NAME, 'Simulador SEFAZ'),
+            x509.NameAttribute(NameOID.COMMON_NAME, comum),
+        ])
+
+    def emitir(assunto, chave_publica, emissor, chave_emissor, ca=False, extensoes=()):
+        construtor = (
+            x509.CertificateBuilder()
+            .subject_name(assunto)
+            .issuer_name(emissor)
+            .public_key(chave_publica)
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(agora - timedelta(minutes=5))
+            .not_valid_after(validade)
+            .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+        )
+        for extensao in extensoes:
+            construtor = construtor.add_extension(extensao, critical=False)
+        return construtor.sign(chave_emissor, hashes.SHA256())
+
+    chave_ca = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    ca = emitir(nome('Simulador SEFAZ CA'), chave_ca.public_key(), nome('Simulador SEFAZ CA'), chave_ca, ca=True)
+
+    chave_servidor = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    servidor = emitir(
+        nome('localhost'), chave_servidor.public_key(), ca.subject, chave_ca,
+        extensoes=[
+            x509.SubjectAlternativeName([
+                x509.DNSName('localhost'),
+                x509.IPAddress(ipaddress.ip_address('127.0.0.1')),
+            ]),
+            x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]),
+        ]
+    )
+
+    chave_cliente = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    cliente = emitir(
+        nome(f'EMPRESA TESTE LTDA:{cnpj}'), chave_cliente.public_key(), ca.subject, chave_ca,
+        extensoes=[x509.ExtendedKeyUsage([ExtendedKeyUsageOID.CLIENT_AUTH])]
+    )
+
+    with open(caminhos['ca'], 'wb') as arquivo:
+        arquivo.write(ca.public_bytes(serialization.Encoding.PEM))
+    with open(caminhos['servidor_certificado'], 'wb') as arquivo:
+        arquivo.write(servidor.public_bytes(serialization.Encoding.PEM))
+        arquivo.write(ca.public_bytes(serialization.Encoding.PEM))
+    with open(caminhos['servidor_chave'], 'wb') as arquivo:
+        arquivo.write(chave_servidor.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption()
+        ))
+    with open(caminhos['cliente_pfx'], 'wb') as arquivo:
+        arquivo.write(pkcs12.serialize_key_and_certificates(
+            b'cliente', chave_cliente, cliente, [ca],
+            serialization.BestAvailableEncryption(senha.encode('utf-8'))
+        ))
+
+    return caminhos
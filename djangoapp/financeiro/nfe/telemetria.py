@@ -0,0 +1,239 @@
+"""
+Telemetria das sincronizações de NF-e por certificado.
+
+Cada execução (busca automática, histórica ou consulta manual) vira um
+registro SincronizacaoNFe com a duração de cada etapa, o número de chamadas
+SOAP, os bytes recebidos e o histograma de cStat das respostas. A tela de
+status da importação mostra as últimas execuções e a tendência semanal.
+
+Uso:
+    with medir_sincronizacao(certificado, 'automatica', client, nsu_inicial) as medicao:
+        distribuicao = client.distribuicao(nsu_inicial)
+        medicao.importador = ImportadorNFe(certificado, client)
+        for lote in distribuicao.lotes():
+            medicao.importador.importar_lote(list(lote), lote.ult_nsu)
+        medicao.nsu_final = distribuicao.ult_nsu
+        medicao.erro = distribuicao.erro
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.utils import timezone
+
+
+class TelemetriaSefaz:
+    """
+    Contadores das chamadas SOAP de um SefazClient.
+
+    O cliente chama registrar() a cada resposta (ou falha) de consultar_lote;
+    os resumos são resolvidos em várias threads, por isso o lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.chamadas = Counter()
+        self.segundos = defaultdict(float)
+        self.bytes_recebidos = 0
+        self.cstats = Counter()
+
+    def registrar(self, tipo: str, segundos: float, tamanho: int, cstat):
+        """
+        Args:
+            tipo: 'distNSU' ou 'consChNFe'
+            segundos: Duração da chamada (envio + resposta)
+            tamanho: Bytes da resposta SOAP
+            cstat: cStat da resposta ('falha' quando não houve resposta válida)
+        """
+        with self._lock:
+            self.chamadas[tipo] += 1
+            self.segundos[tipo] += segundos
+            self.bytes_recebidos += tamanho
+            self.cstats[str(cstat or 'sem cStat')] += 1
+
+
+class MedicaoSincronizacao:
+    """Estado de uma sincronização medida (ver medir_sincronizacao)."""
+
+    def __init__(self, certificado, tipo: str, client, nsu_inicial: str = ''):
+        self.certificado = certificado
+        self.tipo = tipo
+        self.client = client
+        self.nsu_inicial = nsu_inicial or ''
+        # Preenchidos pelo chamador
+        self.importador = None
+        self.nsu_final = None
+        self.erro = None
+
+        self.telemetria = TelemetriaSefaz()
+        self.iniciado_em = None
+        self._inicio = None
+
+    def __enter__(self):
+        self.iniciado_em = timezone.now()
+        self._inicio = time.perf_counter()
+        if self.client is not None:
+            self.client.telemetria = self.telemetria
+        return self
+
+    def __exit__(self, tipo_excecao, excecao, traceback):
+        segundos = time.perf_counter() - self._inicio
+        if self.client is not None:
+            self.client.telemetria = None
+
+        if excecao is not None and not self.erro:
+            self.erro = excecao
+
+        # A telemetria nunca pode derrubar a sincronização
+        try:
+            self._gravar(segundos)
+        except Exception as e:
+            print(f"[NFe Telemetria] ⚠️ Não foi possível registrar a sincronização: {e}")
+
+        # Não suprime a exceção original
+        return False
+
+    def _gravar(self, segundos: float):
+        from financeiro.models import SincronizacaoNFe
+
+        telemetria = self.telemetria
+        campos = {}
+        if self.importador is not None:
+            total = self.importador.total
+            campos = {
+                'documentos_recebidos': total.recebidos,
+                'importados': total.importados,
+                'duplicados': total.duplicados,
+                'ignorados': total.ignorados,
+                'resumos_resolvidos': total.resumos_resolvidos,
+                'tempo_preparar': total.tempo_preparar,
+                'tempo_resumos': total.tempo_resumos,
+                'tempo_arquivos': total.tempo_arquivos,
+                'tempo_banco': total.tempo_banco,
+            }
+
+        SincronizacaoNFe.objects.create(
+            certificado=self.certificado,
+            tipo=self.tipo,
+            status='erro' if self.erro else 'sucesso',
+            iniciado_em=self.iniciado_em,
+            finalizado_em=timezone.now(),
+            nsu_inicial=self.nsu_inicial,
+            nsu_final=self.nsu_final or '',
+            chamadas_dist_nsu=telemetria.chamadas['distNSU'],
+            chamadas_cons_chave=telemetria.chamadas['consChNFe'],
+            bytes_recebidos=telemetria.bytes_recebidos,
+            cstats=dict(telemetria.cstats),
+            tempo_total=segundos,
+            tempo_sefaz=telemetria.segundos['distNSU'],
+            erro=str(self.erro)[:500] if self.erro else '',
+            **campos,
+        )
+
+
+def medir_sincronizacao(certificado, tipo: str, client, nsu_inicial: str = '') -> MedicaoSincronizacao:
+    """
+    Mede uma sincronização e grava um SincronizacaoNFe ao sair do bloco
+    (também quando o bloco termina com exceção, que é propagada).
+
+    Args:
+        certificado: CertificadoDigital sincronizado
+        tipo: 'automatica', 'historica' ou 'manual'
+        client: SefazClient usado nas consultas
+        nsu_inicial: NSU de partida
+
+    Returns:
+        MedicaoSincronizacao (context manager)
+    """
+    return MedicaoSincronizacao(certificado, tipo, client, nsu_inicial)
+
+
+def resumir(sincronizacoes) -> dict:
+    """
+    Agrega um conjunto de SincronizacaoNFe.
+
+    Args:
+        sincronizacoes: Iterável de SincronizacaoNFe
+
+    Returns:
+        Dict com execucoes, erros, documentos, docs_por_segundo,
+        taxa_duplicados, megabytes e duracao_media
+    """
+    execucoes = erros = documentos = importados = duplicados = bytes_recebidos = 0
+    segundos = 0.0
+    for sincronizacao in sincronizacoes:
+        execucoes += 1
+        erros += sincronizacao.status == 'erro'
+        documentos += sincronizacao.documentos_recebidos
+        importados += sincronizacao.importados
+        duplicados += sincronizacao.duplicados
+        bytes_recebidos += sincronizacao.bytes_recebidos
+        segundos += sincronizacao.tempo_total
+
+    validos = importados + duplicados
+    return {
+        'execucoes': execucoes,
+        'erros': erros,
+        'documentos': documentos,
+        'docs_por_segundo': documentos / segundos if segundos else 0,
+        'taxa_duplicados': duplicados / validos if validos else 0,
+        'megabytes': bytes_recebidos / 1024 / 1024,
+        'duracao_media': segundos / execucoes if execucoes else 0,
+    }
+
+
+def tendencia(certificado, dias: int = 7) -> dict:
+    """
+    Compara os últimos `dias` com o período anterior de mesmo tamanho.
+
+    Args:
+        certificado: CertificadoDigital
+        dias: Tamanho de cada período
+
+    Returns:
+        {'atual': resumir(...), 'anterior': resumir(...), 'variacao_docs_por_segundo': % ou None}
+    """
+    return tendencias([certificado], dias)[certificado.pk]
+
+
+def tendencias(certificados, dias: int = 7) -> dict:
+    """
+    tendencia() de vários certificados com uma única consulta.
+
+    Args:
+        certificados: CertificadoDigital
+        dias: Tamanho de cada período
+
+    Returns:
+        {certificado_id: tendencia}
+    """
+    from financeiro.models import SincronizacaoNFe
+
+    agora = timezone.now()
+    inicio_atual = agora - timedelta(days=dias)
+    inicio_anterior = inicio_atual - timedelta(days=dias)
+
+    campos = (
+        'certificado_id', 'status', 'documentos_recebidos', 'importados', 'duplicados',
+        'bytes_recebidos', 'tempo_total', 'iniciado_em'
+    )
+    ids = [certificado.pk for certificado in certificados]
+    por_certificado = defaultdict(list)
+    for execucao in SincronizacaoNFe.objects.filter(
+        certificado_id__in=ids, iniciado_em__gte=inicio_anterior
+    ).only(*campos).order_by():
+        por_certificado[execucao.certificado_id].append(execucao)
+
+    resultado = {}
+    for certificado_id in ids:
+        execucoes = por_certificado[certificado_id]
+        atual = resumir(s for s in execucoes if s.iniciado_em >= inicio_atual)
+        anterior = resumir(s for s in execucoes if s.iniciado_em < inicio_atual)
+
+        variacao = None
+        if anterior['docs_por_segundo']:
+            variacao = (atual['docs_por_segundo'] / anterior['docs_por_segundo'] - 1) * 100
+
+        resultado[certificado_id] = {'atual': atual, 'anterior': anterior, 'variacao_docs_por_segundo': variacao}
+    return resultado
@@ -0,0 +1,264 @@
+"""
+Trava distribuída por certificado para as sincronizações de NF-e.
+
+A busca automática, a busca histórica, a consulta manual e a sincronização
+de NSU não podem rodar ao mesmo tempo para o mesmo certificado: disputariam
+o `ultimo_nsu` e dobrariam o ritmo de chamadas à SEFAZ.
+
+A trava é um lease no Redis (SET NX PX) com o dono e o horário de início.
+Enquanto o trabalho roda, uma thread renova o prazo a cada terço de
+NFE_TRAVA_TTL; se o processo morrer, a trava expira sozinha. Renovação e
+liberação só acontecem se o valor no Redis ainda for o deste dono.
+
+Uso:
+    try:
+        with travar_certificado(certificado, 'Busca automática') as trava:
+            for lote in ...:
+                trava.verificar()
+                ...
+    except CertificadoOcupadoError as e:
+        print(f"Em uso por {e.dono}")
+"""
+import json
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from typing import Optional
+
+import redis
+from django.conf import settings
+
+
+# Renova / libera somente se a trava ainda pertence a quem a adquiriu
+_SCRIPT_RENOVAR = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_SCRIPT_LIBERAR = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class CertificadoOcupadoError(Exception):
+    """Outra sincronização já detém a trava do certificado."""
+
+    def __init__(self, certificado_id, detentor: dict):
+        self.certificado_id = certificado_id
+        self.detentor = detentor or {}
+        self.dono = self.detentor.get('dono', 'outra execução')
+        super().__init__(f"Certificado em uso por: {self.dono}")
+
+
+class TravaPerdidaError(Exception):
+    """A trava expirou durante o trabalho: outra execução pode já ter assumido o certificado."""
+
+    def __init__(self, certificado_id, dono: str):
+        self.certificado_id = certificado_id
+        self.dono = dono
+        super().__init__(f"Trava do certificado {certificado_id} perdida durante '{dono}'")
+
+
+class TravaCertificado:
+    """Lease de um certificado, renovado em segundo plano enquanto estiver ativo."""
+
+    def __init__(self, gerenciador: 'GerenciadorTravas', certificado_id, dono: str):
+        self.gerenciador = gerenciador
+        self.certificado_id = certificado_id
+        self.dono = dono
+        self.chave = gerenciador.chave(certificado_id)
+        self.valor = json.dumps({
+            'token': uuid.uuid4().hex,
+            'dono': dono,
+            'desde': datetime.now(dt_timezone.utc).isoformat(),
+            'processo': f"{socket.gethostname()}:{os.getpid()}",
+        })
+        self.perdida = False
+        self._parar = threading.Event()
+        self._heartbeat = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo_excecao, excecao, traceback):
+        self.liberar()
+        return False
+
+    def verificar(self):
+        """
+        Chamada entre os lotes: interrompe o trabalho se a trava foi perdida.
+
+        Raises:
+            TravaPerdidaError: Se a renovação encontrou a trava expirada ou com outro dono
+        """
+        if self.perdida:
+            raise TravaPerdidaError(self.certificado_id, self.dono)
+
+    def iniciar_heartbeat(self):
+        self._heartbeat = threading.Thread(
+            target=self._renovar_periodicamente, name=f"trava-nfe-{self.certificado_id}", daemon=True
+        )
+        self._heartbeat.start()
+
+    def _renovar_periodicamente(self):
+        intervalo = self.gerenciador.ttl / 3
+        while not self._parar.wait(intervalo):
+            try:
+                renovada = self.gerenciador.renovar(self)
+            except redis.RedisError as e:
+                # Falha passageira: o prazo ainda cobre as próximas tentativas
+                print(f"[NFe Trava] Redis indisponível, trava não renovada: {e}")
+                continue
+
+            if not renovada:
+                self.perdida = True
+                print(f"[NFe Trava] ⚠️ Trava do certificado {self.certificado_id} expirou durante '{self.dono}'")
+                return
+
+    def liberar(self):
+        self._parar.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join(timeout=5)
+            self._heartbeat = None
+
+        try:
+            self.gerenciador.liberar(self)
+        except redis.RedisError as e:
+            print(f"[NFe Trava] Redis indisponível, trava expira sozinha: {e}")
+
+
+class GerenciadorTravas:
+    """Travas por certificado no Redis."""
+
+    PREFIXO = 'nfe:trava:certificado'
+
+    def __init__(self, redis_url: str, ttl: int):
+        """
+        Args:
+            redis_url: URL do Redis
+            ttl: Prazo da trava em segundos (renovado a cada ttl/3)
+        """
+        self.redis_url = redis_url
+        self.ttl = ttl
+        self._redis = None
+        self._renovar = None
+        self._liberar = None
+
+    def _conexao(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.redis_url, socket_connect_timeout=2, socket_timeout=5)
+            self._renovar = self._redis.register_script(_SCRIPT_RENOVAR)
+            self._liberar = self._redis.register_script(_SCRIPT_LIBERAR)
+        return self._redis
+
+    def chave(self, certificado_id) -> str:
+        return f"{self.PREFIXO}:{certificado_id}"
+
+    def adquirir(self, certificado_id, dono: str) -> TravaCertificado:
+        """
+        Adquire a trava do certificado e inicia a renovação automática.
+
+        Args:
+            certificado_id: ID do CertificadoDigital
+            dono: Descrição de quem segura a trava (exibida na tela de status)
+
+        Returns:
+            TravaCertificado (use como context manager ou chame liberar())
+
+        Raises:
+            CertificadoOcupadoError: Se a trava já estiver com outra execução
+        """
+        trava = TravaCertificado(self, certificado_id, dono)
+
+        try:
+            adquirida = self._conexao().set(trava.chave, trava.valor, nx=True, px=self.ttl * 1000)
+        except redis.RedisError as e:
+            # Como no limitador de consultas: sem Redis o trabalho segue sem trava
+            print(f"[NFe Trava] Redis indisponível, seguindo sem trava: {e}")
+            return trava
+
+        if not adquirida:
+            raise CertificadoOcupadoError(certificado_id, self.detentor(certificado_id))
+
+        trava.iniciar_heartbeat()
+        return trava
+
+    def renovar(self, trava: TravaCertificado) -> bool:
+        self._conexao()
+        return bool(self._renovar(keys=[trava.chave], args=[trava.valor, self.ttl * 1000]))
+
+    def liberar(self, trava: TravaCertificado):
+        self._conexao()
+        self._liberar(keys=[trava.chave], args=[trava.valor])
+
+    def detentor(self, certificado_id) -> Optional[dict]:
+        """
+        Retorna quem segura a trava do certificado, ou None se estiver livre.
+
+        Returns:
+            {'dono', 'desde' (datetime), 'processo', 'expira_em' (segundos)} ou None
+        """
+        return self.detentores([certificado_id])[certificado_id]
+
+    def detentores(self, certificados_ids) -> dict:
+        """
+        detentor() de vários certificados em uma única ida ao Redis (pipeline).
+
+        Returns:
+            {certificado_id: detentor ou None}
+        """
+        certificados_ids = list(certificados_ids)
+        resultado = dict.fromkeys(certificados_ids)
+        if not certificados_ids:
+            return resultado
+
+        try:
+            conexao = self._conexao()
+            with conexao.pipeline() as pipe:
+                for certificado_id in certificados_ids:
+                    chave = self.chave(certificado_id)
+                    pipe.get(chave).pttl(chave)
+                respostas = pipe.execute()
+        except redis.RedisError as e:
+            print(f"[NFe Trava] Redis indisponível, trava não consultada: {e}")
+            return resultado
+
+        for posicao, certificado_id in enumerate(certificados_ids):
+            valor, ttl_ms = respostas[2 * posicao], respostas[2 * posicao + 1]
+            if not valor:
+                continue
+
+            dados = json.loads(valor)
+            dados.pop('token', None)
+            dados['desde'] = datetime.fromisoformat(dados['desde'])
+            dados['expira_em'] = max(ttl_ms, 0) / 1000
+            resultado[certificado_id] = dados
+        return resultado
+
+
+gerenciador_travas = GerenciadorTravas(
+    redis_url=settings.NFE_TRAVA_REDIS_URL,
+    ttl=settings.NFE_TRAVA_TTL,
+)
+
+
+def travar_certificado(certificado, dono: str) -> TravaCertificado:
+    """
+    Atalho para gerenciador_travas.adquirir(certificado.pk, dono).
+
+    Raises:
+        CertificadoOcupadoError: Se o certificado já estiver em sincronização
+    """
+    return gerenciador_travas.adquirir(certificado.pk, dono)
+
+
+def detentores_travas(certificados) -> dict:
+    """Quem segura a trava de cada certificado: {certificado_id: detentor ou None}."""
+    return gerenciador_travas.detentores(certificado.pk for certificado in certificados)
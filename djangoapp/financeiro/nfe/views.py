@@ -2,23 +2,23 @@
 Views para gestão de certificados digitais e notas fiscais eletrônicas.
 """
 import os
-import zipfile
-from datetime import datetime, timedelta
-from io import BytesIO
+from datetime import timedelta
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.http import HttpResponse, JsonResponse
-from django.db import transaction
-from django.db.models import Q
-from django.core.files.base import ContentFile
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
 
 from core.decorators import grupos_necessarios
+from core.downloads import servir_arquivo, servir_conteudo
 from financeiro.models import CertificadoDigital, NotaFiscal, Filial
-from financeiro.crypto import decrypt_password
+from .armazenamento import compactado
+from .exportacao import gerar_zip_xmls
 from .forms import CertificadoDigitalForm, ConsultaNFeForm, FiltroNotasFiscaisForm
+from .paginacao import contar_em_cache, paginar_keyset
 from .sefaz_client import SefazClient
+from .trava import CertificadoOcupadoError, detentores_travas, travar_certificado
 
 
 # ========================================
@@ -120,24 +120,16 @@ def certificado_sincronizar_nsu(request, pk):
 
     if request.method == 'POST':
         try:
-            # Descriptografa a senha
-            senha = decrypt_password(certificado.senha_encrypted)
-
-            # Inicializa cliente SEFAZ
-            client = SefazClient(
-                certificado_path=certificado.arquivo_pfx.path,
-                certificado_senha=senha,
-                cnpj=certificado.filial.cnpj,
-                uf_cod=certificado.uf_codigo
-            )
-
-            # Sincroniza NSU
-            ult_nsu, max_nsu, mensagem = client.sincronizar_nsu()
+            # Não sincroniza enquanto outra busca usa o certificado (disputariam o ultimo_nsu)
+            with travar_certificado(certificado, f'Sincronização de NSU ({request.user})'):
+                # Inicializa cliente SEFAZ e sincroniza NSU
+                with SefazClient.do_certificado(certificado) as client:
+                    ult_nsu, max_nsu, mensagem = client.sincronizar_nsu()
 
-            # Atualiza certificado
-            nsu_anterior = certificado.ultimo_nsu
-            certificado.ultimo_nsu = ult_nsu
-            certificado.save(update_fields=['ultimo_nsu'])
+                # Atualiza certificado
+                nsu_anterior = certificado.ultimo_nsu
+                certificado.ultimo_nsu = ult_nsu
+                certificado.save(update_fields=['ultimo_nsu'])
 
             messages.success(
                 request,
@@ -146,6 +138,12 @@ def certificado_sincronizar_nsu(request, pk):
                 f'(Máximo: {max_nsu})'
             )
 
+        except CertificadoOcupadoError as e:
+            messages.warning(
+                request,
+                f'O certificado está em uso por "{e.dono}". Aguarde a conclusão e tente novamente.'
+            )
+
         except Exception as e:
             import traceback
             messages.error(request, f'Erro ao sincronizar NSU: {str(e)}')
@@ -189,192 +187,38 @@ def nfe_consultar(request):
     if request.method == 'POST':
         form = ConsultaNFeForm(request.POST, empresa=empresa)
         if form.is_valid():
-            try:
-                # Obtém dados do form
-                certificado = form.cleaned_data['certificado']
-                data_inicio = form.cleaned_data['data_inicio']
-                data_fim = form.cleaned_data['data_fim']
-                buscar_novos = form.cleaned_data['buscar_novos']
-
-                # Descriptografa a senha
-                senha = decrypt_password(certificado.senha_encrypted)
-
-                # Inicializa cliente SEFAZ
-                client = SefazClient(
-                    certificado_path=certificado.arquivo_pfx.path,
-                    certificado_senha=senha,
-                    cnpj=certificado.filial.cnpj,
-                    uf_cod=certificado.uf_codigo
-                )
-
-                # Busca documentos
-                nsu_inicial = certificado.ultimo_nsu if buscar_novos else "000000000000000"
-
-                if buscar_novos and nsu_inicial != "000000000000000":
-                    messages.info(request, f'Buscando novos documentos desde NSU {nsu_inicial}...')
-                else:
-                    messages.info(request, 'Iniciando consulta completa na SEFAZ...')
-
-                # Debug: mostra informações da consulta
-                print(f"=== DEBUG CONSULTA SEFAZ ===")
-                print(f"CNPJ: {certificado.filial.cnpj}")
-                print(f"UF: {certificado.uf_codigo} ({certificado.get_uf_codigo_display()})")
-                print(f"NSU Inicial: {nsu_inicial}")
-                print(f"Certificado: {certificado.arquivo_pfx.path}")
-                print(f"URL SEFAZ: {client.url}")
-
-                # Variáveis para armazenar NSUs retornados
-                ult_nsu = None
-                max_nsu = None
-
-                try:
-                    # Faz uma consulta para obter o NSU atual
-                    resposta_xml = client.consultar_dfe(nsu_inicial)
-                    docs_temp, ult_nsu, max_nsu, mensagem = client.extrair_documentos(resposta_xml)
-
-                    # Verifica se é erro de consumo indevido
-                    if "Consumo Indevido" in (mensagem or ""):
-                        # Atualiza o NSU do certificado se retornado
-                        if ult_nsu:
-                            nsu_anterior = certificado.ultimo_nsu
-                            certificado.ultimo_nsu = ult_nsu
-                            certificado.save(update_fields=['ultimo_nsu'])
-
-                            messages.error(
-                                request,
-                                'A SEFAZ bloqueou a consulta por consumo indevido (erro 656). '
-                                'Isso acontece quando você tenta fazer múltiplas consultas em um curto período de tempo.'
-                            )
-                            messages.info(
-                                request,
-                                f'NSU atualizado automaticamente: {nsu_anterior} → {ult_nsu}. '
-                                'Aguarde alguns minutos antes de tentar novamente, ou use a opção "Buscar novos documentos".'
-                            )
-                        else:
-                            messages.error(
-                                request,
-                                'A SEFAZ bloqueou a consulta por consumo indevido. '
-                                'Aguarde 1 hora antes de tentar novamente. '
-                                'Se o problema persistir, use o botão "Sincronizar NSU" na lista de certificados.'
-                            )
-                        return redirect('nfe_consultar')
-
-                    # Busca todos os documentos
-                    documentos = client.buscar_todos_documentos(nsu_inicial)
-
-                except Exception as e:
-                    if "Consumo Indevido" in str(e) or "656" in str(e):
-                        messages.error(
-                            request,
-                            'A SEFAZ bloqueou a consulta por consumo indevido (erro 656). '
-                            'Aguarde alguns minutos antes de tentar novamente.'
-                        )
-                        messages.info(
-                            request,
-                            'Dica: Use o botão "Sincronizar NSU" na lista de certificados para atualizar o NSU sem fazer consultas completas.'
-                        )
-                    else:
-                        raise e
-                    return redirect('nfe_consultar')
-
-                print(f"Total de documentos retornados: {len(documentos)}")
-                print(f"===========================")
-
-                if not documentos:
-                    # Atualiza NSU mesmo sem documentos
-                    if ult_nsu:
-                        certificado.ultimo_nsu = ult_nsu
-                        certificado.save(update_fields=['ultimo_nsu'])
-
-                    if buscar_novos and nsu_inicial != "000000000000000":
-                        messages.warning(request, f'Nenhum documento novo desde o NSU {nsu_inicial}.')
-                    else:
-                        messages.warning(request, 'Nenhum documento encontrado na SEFAZ para este CNPJ no momento.')
-                    return redirect('nfe_consultar')
-
-                # Filtra por período
-                documentos_filtrados = client.filtrar_por_periodo(
-                    documentos,
-                    datetime.combine(data_inicio, datetime.min.time()),
-                    datetime.combine(data_fim, datetime.max.time())
-                )
-
-                if not documentos_filtrados:
-                    messages.warning(request, f'Nenhuma nota encontrada no período {data_inicio} a {data_fim}.')
-                    return redirect('nfe_consultar')
-
-                # Importa documentos para o banco
-                importados = 0
-                duplicados = 0
-
-                with transaction.atomic():
-                    for xml in documentos_filtrados:
-                        # Verifica se é resumo e busca XML completo
-                        xml_final = xml
-                        if client.eh_resumo_nfe(xml):
-                            chave = client.extrair_chave_resumo(xml)
-                            if chave:
-                                print(f"Detectado resumo, buscando XML completo para: {chave}")
-                                xml_completo = client.buscar_xml_completo(chave)
-                                if xml_completo:
-                                    xml_final = xml_completo
-                                    print(f"XML completo obtido para: {chave}")
-                                else:
-                                    print(f"Não foi possível obter XML completo, usando resumo: {chave}")
-
-                        metadados = client.extrair_metadados_nfe(xml_final)
-
-                        # Verifica se já existe
-                        if NotaFiscal.objects.filter(chave_acesso=metadados['chave_acesso']).exists():
-                            duplicados += 1
-                            continue
-
-                        # Cria registro
-                        nota = NotaFiscal(
-                            empresa=empresa,
-                            filial=certificado.filial,
-                            chave_acesso=metadados['chave_acesso'],
-                            numero=metadados['numero'],
-                            serie=metadados['serie'],
-                            data_emissao=metadados['data_emissao'],
-                            emitente_cnpj=metadados['emitente_cnpj'],
-                            emitente_nome=metadados['emitente_nome'],
-                            valor_total=metadados['valor_total'],
-                            valor_desconto=metadados['valor_desconto'],
-                            valor_liquido=metadados['valor_liquido'],
-                            nsu=metadados['nsu'],
-                            importado_por=request.user
-                        )
-
-                        # Salva XML (completo se conseguiu buscar, resumo caso contrário)
-                        xml_bytes = client.xml_to_string(xml_final)
-                        nota.arquivo_xml.save(
-                            f"nfe_{metadados['chave_acesso']}.xml",
-                            ContentFile(xml_bytes),
-                            save=False
-                        )
-
-                        nota.save()
-                        importados += 1
-
-                    # Atualiza último NSU do certificado
-                    # O ultNSU correto já foi retornado pela função extrair_documentos
-                    if ult_nsu:
-                        certificado.ultimo_nsu = ult_nsu
-                        certificado.save(update_fields=['ultimo_nsu'])
-
-                # Mensagem de sucesso
-                msg = f'{importados} nota(s) importada(s) com sucesso!'
-                if duplicados > 0:
-                    msg += f' ({duplicados} já existente(s))'
-                messages.success(request, msg)
-
-                return redirect('nfe_lista')
+            from financeiro.models import ConsultaNFe
+            from financeiro.tasks import consultar_nfe_manual
+
+            certificado = form.cleaned_data['certificado']
+
+            # Uma consulta por certificado de cada vez (ignora consultas presas há mais de 1 hora)
+            em_andamento = ConsultaNFe.objects.filter(
+                certificado=certificado,
+                status__in=['pendente', 'executando'],
+                criado_em__gte=timezone.now() - timedelta(hours=1)
+            ).first()
+            if em_andamento:
+                messages.info(request, 'Já existe uma consulta em andamento para este certificado.')
+                return redirect('nfe_consulta_status', pk=em_andamento.pk)
+
+            consulta = ConsultaNFe.objects.create(
+                certificado=certificado,
+                solicitado_por=request.user,
+                data_inicio=form.cleaned_data['data_inicio'],
+                data_fim=form.cleaned_data['data_fim'],
+                buscar_novos=form.cleaned_data['buscar_novos'],
+            )
 
+            try:
+                # A consulta à SEFAZ roda no worker; a requisição retorna imediatamente
+                consultar_nfe_manual.delay(consulta.pk)
             except Exception as e:
-                import traceback
-                messages.error(request, f'Erro ao consultar SEFAZ: {str(e)}')
-                print(f"ERRO DETALHADO: {traceback.format_exc()}")
+                consulta.finalizar('erro', f'Não foi possível iniciar a consulta: {str(e)}', 'danger')
+                messages.error(request, consulta.mensagem)
+                return redirect('nfe_consultar')
+
+            return redirect('nfe_consulta_status', pk=consulta.pk)
         else:
             # Form inválido - mostra os erros
             messages.error(request, 'Por favor, corrija os erros no formulário.')
@@ -398,79 +242,66 @@ def nfe_consultar(request):
     return render(request, 'financeiro/nfe/nfe_consultar.html', context)
 
 
+@grupos_necessarios("Administrador", "Financeiro")
+def nfe_consulta_status(request, pk):
+    """Acompanha uma consulta manual executada em background"""
+    from financeiro.models import ConsultaNFe
+
+    consulta = get_object_or_404(
+        ConsultaNFe.objects.select_related('certificado__filial'),
+        pk=pk,
+        certificado__empresa=request.user.empresa
+    )
+
+    context = {
+        'consulta': consulta,
+    }
+    return render(request, 'financeiro/nfe/nfe_consulta_status.html', context)
+
+
+@grupos_necessarios("Administrador", "Financeiro")
+def nfe_consulta_progresso(request, pk):
+    """Progresso da consulta manual em JSON (lidos, importados e duplicados)"""
+    from financeiro.models import ConsultaNFe
+
+    consulta = get_object_or_404(ConsultaNFe, pk=pk, certificado__empresa=request.user.empresa)
+    return JsonResponse(consulta.como_dict())
+
+
 # ========================================
 # GESTÃO DE NOTAS FISCAIS IMPORTADAS
 # ========================================
 
 @grupos_necessarios("Administrador", "Financeiro")
 def nfe_lista(request):
-    """Lista notas fiscais importadas"""
+    """Lista notas fiscais importadas (paginação por chave sobre data de emissão + id)"""
     empresa = request.user.empresa
 
     # Filtros
     filtro_form = FiltroNotasFiscaisForm(request.GET or None, empresa=empresa)
 
-    # Query base
-    notas = NotaFiscal.objects.filter(empresa=empresa).select_related('filial', 'conta_pagar')
-
-    # Aplica filtros
-    if filtro_form.is_valid():
-        # Filtro de filial
-        filial = filtro_form.cleaned_data.get('filial')
-        if filial:
-            notas = notas.filter(filial=filial)
-
-        # Filtro de período
-        periodo = filtro_form.cleaned_data.get('periodo')
-        if periodo:
-            hoje = timezone.now().date()
-
-            if periodo == 'hoje':
-                notas = notas.filter(data_emissao__date=hoje)
-            elif periodo == '7dias':
-                data_inicio = hoje - timedelta(days=7)
-                notas = notas.filter(data_emissao__date__gte=data_inicio)
-            elif periodo == '30dias':
-                data_inicio = hoje - timedelta(days=30)
-                notas = notas.filter(data_emissao__date__gte=data_inicio)
-            elif periodo == 'mes_atual':
-                notas = notas.filter(
-                    data_emissao__year=hoje.year,
-                    data_emissao__month=hoje.month
-                )
-            elif periodo == 'mes_anterior':
-                primeiro_dia_mes = hoje.replace(day=1)
-                ultimo_dia_mes_anterior = primeiro_dia_mes - timedelta(days=1)
-                notas = notas.filter(
-                    data_emissao__year=ultimo_dia_mes_anterior.year,
-                    data_emissao__month=ultimo_dia_mes_anterior.month
-                )
-            elif periodo == 'personalizado':
-                data_inicio = filtro_form.cleaned_data.get('data_inicio')
-                data_fim = filtro_form.cleaned_data.get('data_fim')
-                if data_inicio:
-                    notas = notas.filter(data_emissao__date__gte=data_inicio)
-                if data_fim:
-                    notas = notas.filter(data_emissao__date__lte=data_fim)
-
-        # Filtro de status
-        status = filtro_form.cleaned_data.get('status')
-        if status:
-            notas = notas.filter(status=status)
-
-        # Filtro de emitente
-        emitente = filtro_form.cleaned_data.get('emitente')
-        if emitente:
-            notas = notas.filter(
-                Q(emitente_nome__icontains=emitente) |
-                Q(emitente_cnpj__icontains=emitente.replace('.', '').replace('/', '').replace('-', ''))
-            )
+    # Query base + filtros
+    notas = filtro_form.filtrar(NotaFiscal.objects.filter(empresa=empresa))
 
-    # Ordenação
-    notas = notas.order_by('-data_emissao')
+    # Página atual; o total vem do cache e não depende da página
+    pagina = paginar_keyset(
+        notas.select_related('filial', 'conta_pagar'),
+        filtro_form.tamanho_pagina,
+        apos=request.GET.get('apos'),
+        antes=request.GET.get('antes'),
+    )
+    total = contar_em_cache(notas, empresa.pk, filtro_form.filtros_aplicados())
+
+    # Filtros atuais para os links de navegação (sem os cursores)
+    parametros = request.GET.copy()
+    parametros.pop('apos', None)
+    parametros.pop('antes', None)
 
     context = {
-        'notas': notas,
+        'notas': pagina.itens,
+        'pagina': pagina,
+        'total': total,
+        'parametros': parametros.urlencode(),
         'filtro_form': filtro_form,
     }
     return render(request, 'financeiro/nfe/nfe_lista.html', context)
@@ -484,6 +315,7 @@ def nfe_detalhes(request, pk):
 
     context = {
         'nota': nota,
+        'itens': nota.itens.all(),
     }
     return render(request, 'financeiro/nfe/nfe_detalhes.html', context)
 
@@ -502,55 +334,65 @@ def nfe_download_xml(request, pk):
         messages.error(request, 'Arquivo XML não disponível.')
         return redirect('nfe_detalhes', pk=pk)
 
-    # Lê o arquivo
-    xml_content = nota.arquivo_xml.read()
     filename = f"nfe_{nota.chave_acesso}.xml"
 
-    # Retorna como download
-    response = HttpResponse(xml_content, content_type='application/xml')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if not compactado(nota.arquivo_xml.name):
+        # XML gravado sem compressão: pode ser entregue pelo servidor web (DOWNLOAD_MODO)
+        return servir_arquivo(request, nota.arquivo_xml, filename, 'application/xml')
 
-    return response
+    # Em disco está o .gz/.zst: o Django descompacta e envia o XML
+    try:
+        ultima_modificacao = os.path.getmtime(nota.arquivo_xml.path)
+        xml_content = nota.arquivo_xml.read()
+    except OSError:
+        raise Http404("Arquivo não encontrado.")
+    finally:
+        nota.arquivo_xml.close()
+
+    return servir_conteudo(request, xml_content, filename, 'application/xml', ultima_modificacao)
 
 
 @grupos_necessarios("Administrador", "Financeiro")
 def nfe_download_massa(request):
-    """Download em massa de XMLs (ZIP)"""
+    """
+    Download em massa de XMLs (ZIP transmitido em partes).
+    Recebe os IDs selecionados (?notas=...) ou, com ?todas=1, exporta todas as
+    notas que atendem aos filtros da lista (mesmos parâmetros do FiltroNotasFiscaisForm).
+    """
     empresa = request.user.empresa
+    notas = NotaFiscal.objects.filter(empresa=empresa)
 
-    # Obtém IDs das notas selecionadas
-    nota_ids = request.GET.getlist('notas')
+    if request.GET.get('todas'):
+        # Sem filtros, como a lista sem filtros: todas as notas da empresa
+        parametros = request.GET.copy()
+        parametros.pop('todas')
+        filtro_form = FiltroNotasFiscaisForm(parametros or None, empresa=empresa)
 
-    if not nota_ids:
-        messages.error(request, 'Nenhuma nota selecionada.')
-        return redirect('nfe_lista')
+        # Filtro inválido não pode virar "exportar tudo"
+        if filtro_form.is_bound and not filtro_form.is_valid():
+            messages.error(request, 'Filtros inválidos: corrija-os na lista antes de baixar todas as notas.')
+            return redirect(f"{reverse('nfe_lista')}?{parametros.urlencode()}")
 
-    # Busca notas
-    notas = NotaFiscal.objects.filter(id__in=nota_ids, empresa=empresa)
+        notas = filtro_form.filtrar(notas)
+    else:
+        # Obtém IDs das notas selecionadas
+        nota_ids = request.GET.getlist('notas')
+
+        if not nota_ids:
+            messages.error(request, 'Nenhuma nota selecionada.')
+            return redirect('nfe_lista')
+
+        notas = notas.filter(id__in=nota_ids)
 
     if not notas.exists():
         messages.error(request, 'Notas não encontradas.')
         return redirect('nfe_lista')
 
-    # Cria arquivo ZIP em memória
-    zip_buffer = BytesIO()
-
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for nota in notas:
-            if nota.arquivo_xml:
-                # Lê conteúdo do XML
-                xml_content = nota.arquivo_xml.read()
-                filename = f"nfe_{nota.chave_acesso}.xml"
-
-                # Adiciona ao ZIP
-                zip_file.writestr(filename, xml_content)
-
-    # Prepara resposta
-    zip_buffer.seek(0)
     timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
     zip_filename = f"nfe_lote_{timestamp}.zip"
 
-    response = HttpResponse(zip_buffer.read(), content_type='application/zip')
+    # O ZIP é montado enquanto é enviado: um XML em memória por vez
+    response = StreamingHttpResponse(gerar_zip_xmls(notas), content_type='application/zip')
     response['Content-Disposition'] = f'attachment; filename="{zip_filename}"'
 
     return response
@@ -581,14 +423,32 @@ def nfe_deletar(request, pk):
 @grupos_necessarios("Administrador", "Financeiro")
 def nfe_status_importacao(request):
     """Exibe status das importações automáticas"""
-    from financeiro.models import ConfiguracaoNFe
+    from django.db.models import Prefetch
+    from financeiro.models import ConfiguracaoNFe, SincronizacaoNFe
+    from .telemetria import tendencias
 
     empresa = request.user.empresa
 
-    # Busca todas as configurações da empresa
-    configs = ConfiguracaoNFe.objects.filter(
+    # Busca todas as configurações da empresa, já com as 10 últimas execuções de
+    # cada certificado (uma consulta para todos: o Prefetch fatiado usa window function)
+    configs = list(ConfiguracaoNFe.objects.filter(
         certificado__empresa=empresa
-    ).select_related('certificado', 'certificado__filial').order_by('certificado__filial__nome')
+    ).select_related('certificado', 'certificado__filial').prefetch_related(
+        Prefetch(
+            'certificado__sincronizacoes_nfe',
+            queryset=SincronizacaoNFe.objects.order_by('-iniciado_em')[:10],
+            to_attr='ultimas_sincronizacoes',
+        )
+    ).order_by('certificado__filial__nome'))
+
+    # Telemetria (tendência semanal) e travas de todos os certificados de uma vez
+    certificados = [config.certificado for config in configs]
+    tendencia_por_certificado = tendencias(certificados)
+    travas = detentores_travas(certificados)
+    for config in configs:
+        config.sincronizacoes = config.certificado.ultimas_sincronizacoes
+        config.tendencia = tendencia_por_certificado[config.certificado_id]
+        config.trava = travas[config.certificado_id]
 
     context = {
         'configs': configs,
@@ -1,5 +1,5 @@
 # financeiro/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from financeiro.models import CertificadoDigital, ConfiguracaoNFe
 
@@ -12,3 +12,13 @@ def criar_configuracao_nfe(sender, instance, created, **kwargs):
     if created:
         ConfiguracaoNFe.objects.get_or_create(certificado=instance)
         print(f"[Signal] ConfiguracaoNFe criada automaticamente para {instance.filial.nome}")
+
+
+@receiver(post_save, sender=CertificadoDigital)
+@receiver(post_delete, sender=CertificadoDigital)
+def invalidar_cache_certificado(sender, instance, **kwargs):
+    """
+    Descarta o material em cache do certificado (senha, arquivo ou UF podem ter mudado).
+    """
+    from financeiro.nfe.certificado_cache import cache_certificados
+    cache_certificados.invalidar(instance.pk)
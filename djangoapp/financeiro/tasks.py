@@ -1,7 +1,7 @@
 # financeiro/tasks.py
 from celery import shared_task
 from django.utils.timezone import now
-from datetime import timedelta
+from datetime import date, timedelta
 from django.contrib.auth import get_user_model
 from django.db.models import Sum, Count
 from financeiro.models import ContaPagar, RelatorioFaturamentoMensal, Filial
@@ -256,6 +256,10 @@ def gerar_relatorio_faturamento_mensal(mes_ref=None, ano_ref=None):
         ano = mes_anterior.year
         print(f"[Relatório] Modo automático: hoje={hoje}, gerando para {mes:02d}/{ano}")
 
+    # Intervalo de datas do mês (em vez de __month/__year) para usar o índice (empresa, status, data_pagamento)
+    inicio_mes = date(ano, mes, 1)
+    fim_mes = inicio_mes + relativedelta(months=1)
+
     empresas = Empresa.objects.filter(ativo=True)
     print(f"[Relatório] Empresas ativas encontradas: {empresas.count()}")
 
@@ -267,8 +271,8 @@ def gerar_relatorio_faturamento_mensal(mes_ref=None, ano_ref=None):
             contas = ContaPagar.objects.filter(
                 empresa=empresa,
                 status='pago',
-                data_pagamento__month=mes,
-                data_pagamento__year=ano
+                data_pagamento__gte=inicio_mes,
+                data_pagamento__lt=fim_mes
             ).select_related('filial', 'conta_bancaria_pagamento', 'transacao', 'fornecedor')
 
             total_contas = contas.count()
@@ -889,184 +893,371 @@ def gerar_excel_sem_banco(contas, mes, ano):
 @shared_task(name="Buscar notas fiscais automaticamente")
 def buscar_notas_automaticamente():
     """
-    Task que busca novas notas fiscais na SEFAZ de forma automática.
-    Roda a cada 4 horas para todos os certificados com busca automática ativa.
+    Task que dispara a busca automática de novas notas fiscais na SEFAZ.
+    Roda a cada 4 horas e apenas enfileira uma task `sincronizar_certificado_nfe`
+    por configuração ativa, na fila dedicada de NF-e (settings.NFE_SYNC_FILA).
+
+    Cada certificado é sincronizado por um worker diferente: um certificado
+    lento não atrasa os demais e mais workers na fila aumentam a vazão.
     """
-    from financeiro.models import ConfiguracaoNFe, CertificadoDigital, NotaFiscal
-    from financeiro.crypto import decrypt_password
-    from financeiro.nfe.sefaz_client import SefazClient
-    from django.core.files.base import ContentFile
-    from django.db import transaction
+    from financeiro.models import ConfiguracaoNFe
+    from django.conf import settings
     from django.utils import timezone
 
     print(f"[NFe Auto] Iniciando busca automática - {timezone.now()}")
 
     # Busca todas as configurações ativas
-    configs = ConfiguracaoNFe.objects.filter(
-        busca_automatica_ativa=True,
-        certificado__ativo=True
-    ).select_related('certificado', 'certificado__filial', 'certificado__empresa')
+    config_ids = list(
+        ConfiguracaoNFe.objects.filter(
+            busca_automatica_ativa=True,
+            certificado__ativo=True
+        ).values_list('pk', flat=True)
+    )
 
-    total_configs = configs.count()
-    print(f"[NFe Auto] Encontradas {total_configs} configuração(ões) ativa(s)")
+    print(f"[NFe Auto] Encontradas {len(config_ids)} configuração(ões) ativa(s)")
 
-    if total_configs == 0:
+    if not config_ids:
         print("[NFe Auto] Nenhuma configuração ativa. Finalizando.")
         return "Nenhuma configuração ativa"
 
-    resultados = []
+    for config_id in config_ids:
+        sincronizar_certificado_nfe.apply_async(
+            args=[config_id],
+            queue=settings.NFE_SYNC_FILA,
+            # Se ainda estiver na fila no próximo ciclo, é descartada (o ciclo enfileira de novo)
+            expires=settings.NFE_SYNC_EXPIRACAO,
+        )
 
-    for config in configs:
-        certificado = config.certificado
-        empresa = certificado.empresa
-        filial = certificado.filial
+    msg = f"{len(config_ids)} sincronização(ões) enfileirada(s) na fila '{settings.NFE_SYNC_FILA}'"
+    print(f"[NFe Auto] {msg}")
+    return msg
 
-        print(f"\n[NFe Auto] Processando: {filial.nome} (CNPJ: {filial.cnpj})")
 
-        try:
-            # Verifica se certificado está vencido
-            if certificado.esta_vencido:
-                erro = f"Certificado vencido em {certificado.data_validade}"
-                print(f"[NFe Auto] ❌ {erro}")
-                config.registrar_erro(erro)
-                resultados.append(f"❌ {filial.nome}: {erro}")
-                continue
+@shared_task(name="Sincronizar NF-e do certificado")
+def sincronizar_certificado_nfe(config_id):
+    """
+    Busca e importa as notas novas de um certificado (a partir do último NSU).
+    O resultado vai para registrar_execucao_sucesso / registrar_erro da configuração.
+
+    Args:
+        config_id: ID da ConfiguracaoNFe
+    """
+    from financeiro.models import ConfiguracaoNFe
+    from financeiro.nfe.sefaz_client import SefazClient
+    from financeiro.nfe.importacao import ImportadorNFe
+    from financeiro.nfe.telemetria import medir_sincronizacao
+    from financeiro.nfe.trava import CertificadoOcupadoError, TravaPerdidaError, travar_certificado
+
+    try:
+        config = ConfiguracaoNFe.objects.select_related(
+            'certificado', 'certificado__filial', 'certificado__empresa'
+        ).get(pk=config_id)
+    except ConfiguracaoNFe.DoesNotExist:
+        print(f"[NFe Auto] Configuração {config_id} não existe mais. Ignorando.")
+        return f"Configuração {config_id} não encontrada"
+
+    certificado = config.certificado
+    filial = certificado.filial
+
+    # A configuração pode ter mudado desde o enfileiramento
+    if not config.busca_automatica_ativa or not certificado.ativo:
+        print(f"[NFe Auto] {filial.nome}: busca automática desativada. Ignorando.")
+        return f"• {filial.nome}: busca automática desativada"
+
+    print(f"\n[NFe Auto] Processando: {filial.nome} (CNPJ: {filial.cnpj})")
+
+    # Outra sincronização do mesmo certificado em andamento: fica para o próximo ciclo
+    try:
+        trava = travar_certificado(certificado, 'Busca automática')
+    except CertificadoOcupadoError as e:
+        print(f"[NFe Auto] ⏭️ {filial.nome}: certificado em uso por {e.dono}. Ignorando.")
+        return f"⏭️ {filial.nome}: certificado em uso por {e.dono}"
+
+    client = None
+    try:
+        # Verifica se certificado está vencido
+        if certificado.esta_vencido:
+            erro = f"Certificado vencido em {certificado.data_validade}"
+            print(f"[NFe Auto] ❌ {filial.nome}: {erro}")
+            config.registrar_erro(erro)
+            return f"❌ {filial.nome}: {erro}"
+
+        # Inicializa cliente SEFAZ (material do certificado vem do cache do processo)
+        client = SefazClient.do_certificado(certificado)
+        nsu_inicial = certificado.ultimo_nsu
+
+        # Importa cada lote assim que ele chega; o NSU é gravado junto com as notas
+        with medir_sincronizacao(certificado, 'automatica', client, nsu_inicial) as medicao:
+            distribuicao = client.distribuicao(nsu_inicial)
+            importador = medicao.importador = ImportadorNFe(certificado, client)
+            for lote in distribuicao.lotes():
+                # Sem a trava, outra execução pode estar usando o mesmo cursor
+                trava.verificar()
+                importador.importar_lote(list(lote), lote.ult_nsu)
+            medicao.nsu_final = distribuicao.ult_nsu
+            medicao.erro = distribuicao.erro
+
+        if distribuicao.erro:
+            # Os lotes anteriores ao erro já foram gravados
+            print(f"[NFe Auto] ⚠️ Sincronização interrompida: {distribuicao.erro}")
+
+        importados = importador.total.importados
+        duplicados = importador.total.duplicados
+        total_docs = importador.total.total
+        ult_nsu = distribuicao.ult_nsu
+
+        # Verifica erro 656 (Consumo Indevido)
+        if not total_docs and distribuicao.consumo_indevido:
+            erro = "Erro 656 - Consumo Indevido da SEFAZ. Aguardando próximo ciclo."
+            print(f"[NFe Auto] ⚠️ {erro}")
+            # Atualiza NSU se retornado
+            certificado.avancar_nsu(ult_nsu)
+            config.registrar_erro(erro)
+            return f"⚠️ {filial.nome}: {erro}"
+
+        print(f"[NFe Auto] Encontrados {total_docs} documento(s) desde NSU {nsu_inicial}")
+
+        # Os lotes importados já gravaram o NSU; aqui cobre a resposta sem documentos
+        certificado.avancar_nsu(ult_nsu)
+
+        if total_docs == 0:
+            print(f"[NFe Auto] ✓ Nenhum documento novo")
+            config.registrar_execucao_sucesso(0)
+            return f"✓ {filial.nome}: Nenhum documento novo"
+
+        # Registra sucesso
+        config.registrar_execucao_sucesso(importados)
+        msg = f"✅ {filial.nome}: {importados} importada(s)"
+        if duplicados > 0:
+            msg += f" ({duplicados} duplicada(s))"
+        print(f"[NFe Auto] {msg}")
+        return msg
+
+    except TravaPerdidaError:
+        # Os lotes já importados ficam; o restante vem no próximo ciclo
+        print(f"[NFe Auto] ⚠️ {filial.nome}: trava do certificado perdida, sincronização interrompida")
+        return f"⚠️ {filial.nome}: sincronização interrompida (trava perdida)"
+
+    except Exception as e:
+        erro = f"Erro: {str(e)[:200]}"
+        print(f"[NFe Auto] ❌ {filial.nome}: {erro}")
+        import traceback
+        traceback.print_exc()
+        config.registrar_erro(erro)
+        return f"❌ {filial.nome}: {erro}"
+
+    finally:
+        # Encerra a sessão HTTPS mantida pelo cliente
+        if client is not None:
+            client.fechar()
+        trava.liberar()
+
+
+@shared_task(name="Consultar NF-e manualmente")
+def consultar_nfe_manual(consulta_id):
+    """
+    Executa uma consulta manual (tela "Consultar NF-e") em background.
+    Cada lote é filtrado pelo período, importado e contabilizado na
+    ConsultaNFe, que a tela de status acompanha pelo endpoint de progresso.
 
-            # Descriptografa senha
-            senha = decrypt_password(certificado.senha_encrypted)
+    Args:
+        consulta_id: ID da ConsultaNFe
+    """
+    from datetime import datetime
+    from financeiro.models import ConsultaNFe
+    from financeiro.nfe.sefaz_client import SefazClient
+    from financeiro.nfe.importacao import ImportadorNFe
+    from financeiro.nfe.telemetria import medir_sincronizacao
+    from financeiro.nfe.trava import CertificadoOcupadoError, TravaPerdidaError, travar_certificado
+    from django.conf import settings
+    from django.utils import timezone
 
-            # Inicializa cliente SEFAZ
-            client = SefazClient(
-                certificado_path=certificado.arquivo_pfx.path,
-                certificado_senha=senha,
-                cnpj=filial.cnpj,
-                uf_cod=certificado.uf_codigo
+    try:
+        consulta = ConsultaNFe.objects.select_related(
+            'certificado', 'certificado__filial', 'certificado__empresa', 'solicitado_por'
+        ).get(pk=consulta_id)
+    except ConsultaNFe.DoesNotExist:
+        print(f"[NFe Consulta] Consulta {consulta_id} não existe mais. Ignorando.")
+        return f"Consulta {consulta_id} não encontrada"
+
+    certificado = consulta.certificado
+
+    # Certificado em sincronização: a consulta volta para a fila até a trava ser liberada
+    try:
+        trava = travar_certificado(certificado, f'Consulta manual #{consulta.pk} ({consulta.solicitado_por})')
+    except CertificadoOcupadoError as e:
+        if timezone.now() - consulta.criado_em > timedelta(seconds=settings.NFE_TRAVA_ESPERA_MAXIMA):
+            consulta.finalizar(
+                'erro',
+                f'O certificado ficou ocupado por "{e.dono}" por tempo demais. Tente novamente mais tarde.',
+                'danger'
             )
+            return consulta.mensagem
 
-            # Busca novos documentos desde último NSU
-            nsu_inicial = certificado.ultimo_nsu
-            print(f"[NFe Auto] Buscando desde NSU: {nsu_inicial}")
-
-            # Faz consulta inicial
-            resposta_xml = client.consultar_dfe(nsu_inicial)
-            docs_temp, ult_nsu, max_nsu, mensagem = client.extrair_documentos(resposta_xml)
-
-            # Verifica erro 656 (Consumo Indevido)
-            if "Consumo Indevido" in (mensagem or ""):
-                erro = "Erro 656 - Consumo Indevido da SEFAZ. Aguardando próximo ciclo."
-                print(f"[NFe Auto] ⚠️ {erro}")
-                # Atualiza NSU se retornado
-                if ult_nsu:
-                    certificado.ultimo_nsu = ult_nsu
-                    certificado.save(update_fields=['ultimo_nsu'])
-                config.registrar_erro(erro)
-                resultados.append(f"⚠️ {filial.nome}: {erro}")
-                continue
+        print(f"[NFe Consulta] #{consulta.pk} certificado em uso por {e.dono}, reenfileirando")
+        consulta.registrar_progresso(
+            mensagem=f'Aguardando "{e.dono}" terminar para iniciar a consulta...',
+            nivel='info',
+        )
+        consultar_nfe_manual.apply_async(args=[consulta.pk], countdown=settings.NFE_TRAVA_REENFILEIRAR_SEGUNDOS)
+        return f"Consulta {consulta.pk} reenfileirada: certificado em uso por {e.dono}"
 
-            # Busca todos os documentos
-            documentos = client.buscar_todos_documentos(nsu_inicial)
-            total_docs = len(documentos)
-            print(f"[NFe Auto] Encontrados {total_docs} documento(s)")
-
-            if total_docs == 0:
-                print(f"[NFe Auto] ✓ Nenhum documento novo")
-                # Atualiza NSU mesmo sem documentos
-                if ult_nsu:
-                    certificado.ultimo_nsu = ult_nsu
-                    certificado.save(update_fields=['ultimo_nsu'])
-                config.registrar_execucao_sucesso(0)
-                resultados.append(f"✓ {filial.nome}: Nenhum documento novo")
-                continue
+    nsu_inicial = certificado.ultimo_nsu if consulta.buscar_novos else "000000000000000"
+    consulta.registrar_progresso(
+        status='executando', nsu_inicial=nsu_inicial, iniciado_em=timezone.now(), mensagem='', nivel=''
+    )
 
-            # Importa documentos
-            importados = 0
-            duplicados = 0
-
-            with transaction.atomic():
-                for xml in documentos:
-                    # Verifica se é resumo e busca XML completo
-                    xml_final = xml
-                    if client.eh_resumo_nfe(xml):
-                        chave = client.extrair_chave_resumo(xml)
-                        if chave:
-                            print(f"[NFe Auto] Resumo detectado, buscando completo: {chave}")
-                            xml_completo = client.buscar_xml_completo(chave)
-                            if xml_completo:
-                                xml_final = xml_completo
-
-                    metadados = client.extrair_metadados_nfe(xml_final)
-
-                    # Verifica duplicata
-                    if NotaFiscal.objects.filter(chave_acesso=metadados['chave_acesso']).exists():
-                        duplicados += 1
-                        continue
+    print(f"[NFe Consulta] #{consulta.pk} {certificado.filial.nome} - NSU inicial {nsu_inicial}")
 
-                    # Cria registro
-                    nota = NotaFiscal(
-                        empresa=empresa,
-                        filial=filial,
-                        chave_acesso=metadados['chave_acesso'],
-                        numero=metadados['numero'],
-                        serie=metadados['serie'],
-                        data_emissao=metadados['data_emissao'],
-                        emitente_cnpj=metadados['emitente_cnpj'],
-                        emitente_nome=metadados['emitente_nome'],
-                        valor_total=metadados['valor_total'],
-                        valor_desconto=metadados['valor_desconto'],
-                        valor_liquido=metadados['valor_liquido'],
-                        nsu=metadados['nsu'],
-                        importado_por=None  # Importação automática
-                    )
+    client = None
+    try:
+        # Inicializa cliente SEFAZ (material do certificado vem do cache do processo)
+        client = SefazClient.do_certificado(certificado)
 
-                    # Salva XML
-                    xml_bytes = client.xml_to_string(xml_final)
-                    nota.arquivo_xml.save(
-                        f"nfe_{metadados['chave_acesso']}.xml",
-                        ContentFile(xml_bytes),
-                        save=False
+        # Consulta lote a lote: cada lote é filtrado e importado assim
+        # que chega, sem acumular todos os documentos em memória
+        distribuicao = client.distribuicao(nsu_inicial)
+        periodo_inicio = datetime.combine(consulta.data_inicio, datetime.min.time())
+        periodo_fim = datetime.combine(consulta.data_fim, datetime.max.time())
+        importador = ImportadorNFe(certificado, client, importado_por=consulta.solicitado_por)
+        total_docs = 0
+
+        try:
+            with medir_sincronizacao(certificado, 'manual', client, nsu_inicial) as medicao:
+                medicao.importador = importador
+                for lote in distribuicao.lotes():
+                    trava.verificar()
+                    documentos = list(lote)
+                    total_docs += len(documentos)
+
+                    # Filtra por período
+                    documentos_filtrados = client.filtrar_por_periodo(documentos, periodo_inicio, periodo_fim)
+                    if documentos_filtrados:
+                        # Importa o lote e grava o NSU junto com as notas
+                        importador.importar_lote(documentos_filtrados, lote.ult_nsu)
+                    else:
+                        # Nenhum documento do lote no período: o cursor avança mesmo assim
+                        certificado.avancar_nsu(lote.ult_nsu)
+
+                    consulta.registrar_progresso(
+                        lotes=consulta.lotes + 1,
+                        documentos_recebidos=total_docs,
+                        importados=importador.total.importados,
+                        duplicados=importador.total.duplicados,
+                        ult_nsu=lote.ult_nsu or '',
+                        max_nsu=lote.max_nsu or '',
                     )
+                medicao.nsu_final = distribuicao.ult_nsu
+                medicao.erro = distribuicao.erro
+
+        except TravaPerdidaError:
+            raise
+
+        except Exception as e:
+            if "Consumo Indevido" in str(e) or "656" in str(e):
+                consulta.finalizar(
+                    'erro',
+                    'A SEFAZ bloqueou a consulta por consumo indevido (erro 656). '
+                    'Aguarde alguns minutos antes de tentar novamente. '
+                    'Dica: Use o botão "Sincronizar NSU" na lista de certificados para atualizar o NSU '
+                    'sem fazer consultas completas.',
+                    'danger'
+                )
+                return consulta.mensagem
+            raise
+
+        # NSU da última resposta recebida
+        ult_nsu = distribuicao.ult_nsu if distribuicao.ult_nsu != nsu_inicial else None
+
+        # Verifica se é erro de consumo indevido
+        if not total_docs and distribuicao.consumo_indevido:
+            # Atualiza o NSU do certificado se retornado (só para frente)
+            nsu_anterior = certificado.ultimo_nsu
+            if certificado.avancar_nsu(ult_nsu):
+                mensagem = (
+                    'A SEFAZ bloqueou a consulta por consumo indevido (erro 656). '
+                    'Isso acontece quando você tenta fazer múltiplas consultas em um curto período de tempo. '
+                    f'NSU atualizado automaticamente: {nsu_anterior} → {ult_nsu}. '
+                    'Aguarde alguns minutos antes de tentar novamente, ou use a opção "Buscar novos documentos".'
+                )
+            else:
+                mensagem = (
+                    'A SEFAZ bloqueou a consulta por consumo indevido. '
+                    'Aguarde 1 hora antes de tentar novamente. '
+                    'Se o problema persistir, use o botão "Sincronizar NSU" na lista de certificados.'
+                )
+            consulta.finalizar('erro', mensagem, 'danger')
+            return mensagem
 
-                    nota.save()
-                    importados += 1
+        print(f"[NFe Consulta] #{consulta.pk} Total de documentos retornados: {total_docs}")
 
-                # Atualiza último NSU
-                if ult_nsu:
-                    certificado.ultimo_nsu = ult_nsu
-                    certificado.save(update_fields=['ultimo_nsu'])
+        if not total_docs:
+            # Atualiza NSU mesmo sem documentos
+            certificado.avancar_nsu(ult_nsu)
 
-            # Registra sucesso
-            config.registrar_execucao_sucesso(importados)
-            msg = f"✅ {filial.nome}: {importados} importada(s)"
-            if duplicados > 0:
-                msg += f" ({duplicados} duplicada(s))"
-            print(f"[NFe Auto] {msg}")
-            resultados.append(msg)
+            if consulta.buscar_novos and nsu_inicial != "000000000000000":
+                mensagem = f'Nenhum documento novo desde o NSU {nsu_inicial}.'
+            else:
+                mensagem = 'Nenhum documento encontrado na SEFAZ para este CNPJ no momento.'
+            consulta.finalizar('concluida', mensagem, 'warning')
+            return mensagem
 
-        except Exception as e:
-            erro = f"Erro: {str(e)[:200]}"
-            print(f"[NFe Auto] ❌ {filial.nome}: {erro}")
-            import traceback
-            traceback.print_exc()
-            config.registrar_erro(erro)
-            resultados.append(f"❌ {filial.nome}: {erro}")
+        importados = importador.total.importados
+        duplicados = importador.total.duplicados
 
-    print(f"\n[NFe Auto] Finalizado - {timezone.now()}")
-    return "\n".join(resultados)
+        if not importados and not duplicados:
+            mensagem = (
+                f'Nenhuma nota encontrada no período '
+                f'{consulta.data_inicio:%d/%m/%Y} a {consulta.data_fim:%d/%m/%Y}.'
+            )
+            consulta.finalizar('concluida', mensagem, 'warning')
+            return mensagem
+
+        # Mensagem de sucesso
+        mensagem = f'{importados} nota(s) importada(s) com sucesso!'
+        if duplicados > 0:
+            mensagem += f' ({duplicados} já existente(s))'
+        consulta.finalizar('concluida', mensagem, 'success')
+        return mensagem
+
+    except TravaPerdidaError:
+        print(f"[NFe Consulta] #{consulta.pk} trava do certificado perdida, consulta interrompida")
+        consulta.finalizar(
+            'erro',
+            f'A consulta foi interrompida após {consulta.lotes} lote(s): outra sincronização assumiu o certificado. '
+            'As notas já importadas foram mantidas; tente novamente em alguns minutos.',
+            'warning'
+        )
+        return consulta.mensagem
+
+    except Exception as e:
+        import traceback
+        print(f"[NFe Consulta] ERRO DETALHADO: {traceback.format_exc()}")
+        consulta.finalizar('erro', f'Erro ao consultar SEFAZ: {str(e)}', 'danger')
+        return consulta.mensagem
+
+    finally:
+        # Encerra a sessão HTTPS mantida pelo cliente
+        if client is not None:
+            client.fechar()
+        trava.liberar()
 
 
 @shared_task(name="Buscar histórico de notas fiscais")
 def buscar_historico_notas():
     """
     Task que busca histórico completo de notas fiscais de forma incremental.
-    Evita erro 656 fazendo pausas entre as buscas.
+    O ritmo das consultas (e o bloqueio após erro 656) é controlado pelo
+    limitador por CNPJ do SefazClient.
     """
-    from financeiro.models import ConfiguracaoNFe, CertificadoDigital, NotaFiscal
-    from financeiro.crypto import decrypt_password
+    from financeiro.models import ConfiguracaoNFe
     from financeiro.nfe.sefaz_client import SefazClient
-    from django.core.files.base import ContentFile
-    from django.db import transaction
+    from financeiro.nfe.importacao import ImportadorNFe
+    from financeiro.nfe.rate_limit import LimiteSefazExcedidoError, SefazBloqueadaError
+    from financeiro.nfe.telemetria import medir_sincronizacao
+    from financeiro.nfe.trava import CertificadoOcupadoError, TravaPerdidaError, travar_certificado
+    from django.conf import settings
     from django.utils import timezone
-    import time
 
     print(f"[NFe Histórico] Iniciando busca histórica - {timezone.now()}")
 
@@ -1093,6 +1284,15 @@ def buscar_historico_notas():
 
         print(f"\n[NFe Histórico] Processando: {filial.nome}")
 
+        # Outra sincronização do mesmo certificado em andamento: continua na próxima execução
+        try:
+            trava = travar_certificado(certificado, 'Busca histórica')
+        except CertificadoOcupadoError as e:
+            print(f"[NFe Histórico] ⏭️ Certificado em uso por {e.dono}. Ignorando.")
+            resultados.append(f"⏭️ {filial.nome}: certificado em uso por {e.dono}")
+            continue
+
+        client = None
         try:
             # Marca como executando
             config.busca_historica_status = 'executando'
@@ -1108,28 +1308,39 @@ def buscar_historico_notas():
                 resultados.append(f"❌ {filial.nome}: {erro}")
                 continue
 
-            # Descriptografa senha
-            senha = decrypt_password(certificado.senha_encrypted)
-
-            # Inicializa cliente SEFAZ
-            client = SefazClient(
-                certificado_path=certificado.arquivo_pfx.path,
-                certificado_senha=senha,
-                cnpj=filial.cnpj,
-                uf_cod=certificado.uf_codigo
-            )
+            # Inicializa cliente SEFAZ (material do certificado vem do cache do processo)
+            client = SefazClient.do_certificado(certificado)
 
-            # Busca incremental: máximo 50 documentos por execução
-            # Isso evita erro 656 e permite processar gradualmente
-            nsu_inicial = "000000000000000"  # Começa do início
+            # Busca incremental: retoma do cursor próprio da busca histórica,
+            # com no máximo NFE_HISTORICO_LOTES_POR_EXECUCAO lotes por execução
+            nsu_inicial = config.busca_historica_nsu
             print(f"[NFe Histórico] Buscando desde NSU: {nsu_inicial}")
 
-            # Consulta inicial
-            resposta_xml = client.consultar_dfe(nsu_inicial)
-            docs_temp, ult_nsu, max_nsu, mensagem = client.extrair_documentos(resposta_xml)
+            distribuicao = client.distribuicao(nsu_inicial, max_iteracoes=settings.NFE_HISTORICO_LOTES_POR_EXECUCAO)
+
+            # Importa lote a lote: só um lote fica em memória por vez. O cursor
+            # histórico avança junto com as notas de cada lote; o NSU do
+            # certificado (busca automática) não é alterado
+            with medir_sincronizacao(certificado, 'historica', client, nsu_inicial) as medicao:
+                importador = medicao.importador = ImportadorNFe(
+                    certificado, client, avancar_cursor=config.avancar_nsu_historico
+                )
+                for lote in distribuicao.lotes():
+                    trava.verificar()
+                    importador.importar_lote(list(lote), lote.ult_nsu)
+                medicao.nsu_final = distribuicao.ult_nsu
+                medicao.erro = distribuicao.erro
+
+            if distribuicao.erro:
+                # Os lotes anteriores ao erro já foram gravados
+                print(f"[NFe Histórico] ⚠️ Execução interrompida: {distribuicao.erro}")
+
+            importados = importador.total.importados
+            duplicados = importador.total.duplicados
+            total_docs = importador.total.total
 
             # Verifica erro 656
-            if "Consumo Indevido" in (mensagem or ""):
+            if not total_docs and distribuicao.consumo_indevido:
                 erro = "Erro 656 - Aguardando próximo ciclo para continuar."
                 print(f"[NFe Histórico] ⚠️ {erro}")
                 config.registrar_erro(erro)
@@ -1137,33 +1348,17 @@ def buscar_historico_notas():
                 # Mantém status como executando para tentar novamente
                 continue
 
-            # Busca documentos limitados (evita consumo excessivo)
-            documentos = []
-            iteracoes = 0
-            max_iteracoes = 5  # Limita a 5 iterações por execução
-            nsu_atual = nsu_inicial
-
-            while iteracoes < max_iteracoes:
-                iteracoes += 1
-                resposta = client.consultar_dfe(nsu_atual)
-                docs, novo_nsu, max_nsu_resp, msg = client.extrair_documentos(resposta)
+            print(f"[NFe Histórico] Encontrados {total_docs} documento(s) (NSU {config.busca_historica_nsu})")
 
-                if not docs:
-                    break
+            # Cobre a resposta sem documentos (o cursor dos lotes já foi gravado)
+            config.avancar_nsu_historico(distribuicao.ult_nsu)
 
-                documentos.extend(docs)
-                nsu_atual = novo_nsu
-
-                if novo_nsu == max_nsu_resp:
-                    break
-
-                # Pausa entre requisições (evita 656)
-                time.sleep(2)
-
-            total_docs = len(documentos)
-            print(f"[NFe Histórico] Encontrados {total_docs} documento(s)")
+            # Concluída quando o cursor histórico alcança o maxNSU da SEFAZ
+            fim = not distribuicao.erro and (
+                not distribuicao.max_nsu or config.busca_historica_nsu >= distribuicao.max_nsu
+            )
 
-            if total_docs == 0:
+            if fim:
                 print(f"[NFe Histórico] ✓ Busca histórica concluída")
                 config.busca_historica_status = 'concluida'
                 config.busca_historica_progresso = 100
@@ -1171,57 +1366,9 @@ def buscar_historico_notas():
                 resultados.append(f"✓ {filial.nome}: Busca histórica concluída")
                 continue
 
-            # Importa documentos
-            importados = 0
-            duplicados = 0
-
-            with transaction.atomic():
-                for xml in documentos:
-                    # Processa XML (mesmo código da busca automática)
-                    xml_final = xml
-                    if client.eh_resumo_nfe(xml):
-                        chave = client.extrair_chave_resumo(xml)
-                        if chave:
-                            xml_completo = client.buscar_xml_completo(chave)
-                            if xml_completo:
-                                xml_final = xml_completo
-
-                    metadados = client.extrair_metadados_nfe(xml_final)
-
-                    if NotaFiscal.objects.filter(chave_acesso=metadados['chave_acesso']).exists():
-                        duplicados += 1
-                        continue
-
-                    nota = NotaFiscal(
-                        empresa=empresa,
-                        filial=filial,
-                        chave_acesso=metadados['chave_acesso'],
-                        numero=metadados['numero'],
-                        serie=metadados['serie'],
-                        data_emissao=metadados['data_emissao'],
-                        emitente_cnpj=metadados['emitente_cnpj'],
-                        emitente_nome=metadados['emitente_nome'],
-                        valor_total=metadados['valor_total'],
-                        valor_desconto=metadados['valor_desconto'],
-                        valor_liquido=metadados['valor_liquido'],
-                        nsu=metadados['nsu'],
-                        importado_por=None
-                    )
-
-                    xml_bytes = client.xml_to_string(xml_final)
-                    nota.arquivo_xml.save(
-                        f"nfe_{metadados['chave_acesso']}.xml",
-                        ContentFile(xml_bytes),
-                        save=False
-                    )
-
-                    nota.save()
-                    importados += 1
-
-            # Atualiza progresso (estimativa baseada em NSU)
-            if max_nsu and ult_nsu:
-                progresso = (int(ult_nsu) / int(max_nsu)) * 100
-                config.busca_historica_progresso = min(int(progresso), 99)
+            # Atualiza progresso pelo cursor histórico
+            progresso = (int(config.busca_historica_nsu) / int(distribuicao.max_nsu)) * 100
+            config.busca_historica_progresso = min(int(progresso), 99)
 
             config.save()
 
@@ -1231,6 +1378,21 @@ def buscar_historico_notas():
             print(f"[NFe Histórico] {msg}")
             resultados.append(msg)
 
+        except (SefazBloqueadaError, LimiteSefazExcedidoError) as e:
+            # CNPJ bloqueado (656) ou sem token no limitador: não é falha da busca.
+            # Mantém status como executando para continuar no próximo ciclo
+            erro = str(e)[:200]
+            print(f"[NFe Histórico] ⚠️ {filial.nome}: {erro}")
+            config.registrar_erro(erro)
+            resultados.append(f"⚠️ {filial.nome}: {erro}")
+            continue
+
+        except TravaPerdidaError:
+            # O cursor histórico já está no último lote gravado: continua no próximo ciclo
+            print(f"[NFe Histórico] ⚠️ {filial.nome}: trava do certificado perdida, execução interrompida")
+            resultados.append(f"⚠️ {filial.nome}: execução interrompida (trava perdida)")
+            continue
+
         except Exception as e:
             erro = f"Erro: {str(e)[:200]}"
             print(f"[NFe Histórico] ❌ {filial.nome}: {erro}")
@@ -1241,5 +1403,11 @@ def buscar_historico_notas():
             config.save()
             resultados.append(f"❌ {filial.nome}: {erro}")
 
+        finally:
+            # Encerra a sessão HTTPS mantida pelo cliente
+            if client is not None:
+                client.fechar()
+            trava.liberar()
+
     print(f"\n[NFe Histórico] Finalizado - {timezone.now()}")
     return "\n".join(resultados)
@@ -1,3 +1,524 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import ssl
+import tempfile
+import threading
+import tracemalloc
+import unittest
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from lxml import etree
+
+from accounts.models import Empresa
+from financeiro.models import CertificadoDigital, Filial, NotaFiscal, NotaFiscalItem
+from financeiro.nfe.amostras import NS_NFE, gerar_proc_nfe, gerar_res_nfe
+from financeiro.nfe.armazenamento import caminho_xml, xml_storage
+from financeiro.nfe.exportacao import gerar_zip_xmls
+from financeiro.nfe.forms import FiltroNotasFiscaisForm
+from financeiro.nfe.importacao import ImportadorNFe
+from financeiro.nfe.sefaz_client import ConsultaEmTransacaoError, DocumentoDFe, SefazClient
+
+CNPJ_EMITENTE = '11222333000181'
+CNPJ_FILIAL = '12345678000199'
+
+
+def _criar_certificado():
+    empresa = Empresa.objects.create(nome='EMPRESA TESTE', cnpj='00000000000191')
+    filial = Filial.objects.create(empresa=empresa, nome='MATRIZ', cnpj=CNPJ_FILIAL)
+    return CertificadoDigital.objects.create(
+        empresa=empresa, filial=filial, arquivo_pfx='certificados/teste.pfx',
+        senha_encrypted=b'x', uf_codigo='42', data_validade=date(2099, 1, 1),
+    )
+
+
+def _resposta_sefaz(cstat, documentos=(), ult_nsu='000000000000000', max_nsu='000000000000000'):
+    """Resposta distDFe com os documentos compactados em docZip."""
+    lote = ''.join(
+        f'<docZip NSU="{nsu}" schema="{schema}">{base64.b64encode(gzip.compress(conteudo)).decode()}</docZip>'
+        for nsu, schema, conteudo in documentos
+    )
+    corpo = (
+        f'<retDistDFeInt xmlns="{NS_NFE}"><cStat>{cstat}</cStat><xMotivo>teste</xMotivo>'
+        f'<ultNSU>{ult_nsu}</ultNSU><maxNSU>{max_nsu}</maxNSU>'
+        f'<loteDistDFeInt>{lote}</loteDistDFeInt></retDistDFeInt>'
+    )
+    return mock.Mock(status_code=200, content=corpo.encode('utf-8'), text=corpo)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ConsultaForaDeTransacaoTest(TransactionTestCase):
+    """
+    Nenhuma chamada à SEFAZ pode acontecer com uma transação do banco aberta.
+
+    TransactionTestCase: o TestCase envolve cada teste em uma transação, e a
+    consulta seria sempre recusada.
+    """
+
+    def setUp(self):
+        self.certificado = _criar_certificado()
+        self.client_sefaz = SefazClient(
+            'certificados/teste.pfx', None, CNPJ_FILIAL, '42', ssl_context=ssl.create_default_context()
+        )
+
+        # Estado da transação da thread do teste no momento de cada chamada de rede
+        # (o resolvedor de resumos chama a SEFAZ a partir de outras threads)
+        self.conexao = connections['default']
+        self.em_transacao = []
+
+        limitador = mock.patch('financeiro.nfe.sefaz_client.limitador_sefaz.adquirir')
+        limitador.start()
+        self.addCleanup(limitador.stop)
+
+    def _post(self, resposta):
+        def post(sessao, url, data=None, **kwargs):
+            self.em_transacao.append(self.conexao.in_atomic_block)
+            return resposta(data.decode('utf-8'))
+        return mock.patch('requests.Session.post', autospec=True, side_effect=post)
+
+    def test_importacao_dentro_de_transacao_e_recusada(self):
+        resumo = DocumentoDFe(gerar_res_nfe(1, CNPJ_EMITENTE), nsu='000000000000001', schema='resNFe_v1.01.xsd')
+        importador = ImportadorNFe(self.certificado, self.client_sefaz)
+
+        with self._post(lambda envelope: _resposta_sefaz('137')) as post:
+            with self.assertRaises(ConsultaEmTransacaoError):
+                with transaction.atomic():
+                    importador.importar_lote([resumo], '000000000000001')
+
+            with self.assertRaises(ConsultaEmTransacaoError):
+                with transaction.atomic():
+                    self.client_sefaz.consultar_lote('000000000000000')
+
+        post.assert_not_called()
+        self.assertFalse(NotaFiscal.objects.exists())
+
+    def test_sincronizacao_consulta_sefaz_fora_de_transacao(self):
+        resumo = gerar_res_nfe(1, CNPJ_EMITENTE)
+
+        def resposta(envelope):
+            if 'consChNFe' in envelope:
+                # XML completo indisponível: o resumo é importado como veio
+                return _resposta_sefaz('137')
+            return _resposta_sefaz(
+                '138', [('000000000000001', 'resNFe_v1.01.xsd', resumo)],
+                ult_nsu='000000000000001', max_nsu='000000000000001',
+            )
+
+        # Mesma rotina da task automática: distNSU lote a lote + resolução dos resumos
+        importador = ImportadorNFe(self.certificado, self.client_sefaz)
+        with self._post(resposta) as post:
+            for lote in self.client_sefaz.distribuicao(self.certificado.ultimo_nsu).lotes():
+                importador.importar_lote(list(lote), lote.ult_nsu)
+
+        # distNSU + consChNFe do resumo
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(self.em_transacao, [False, False])
+        self.assertEqual(importador.total.importados, 1)
+        self.certificado.refresh_from_db()
+        self.assertEqual(self.certificado.ultimo_nsu, '000000000000001')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TravaPerdidaTest(TransactionTestCase):
+    """Sincronização que perde a trava do certificado para no próximo lote."""
+
+    def setUp(self):
+        self.certificado = _criar_certificado()
+        self.certificado.configuracao_nfe.busca_automatica_ativa = True
+        self.certificado.configuracao_nfe.save()
+
+        limitador = mock.patch('financeiro.nfe.sefaz_client.limitador_sefaz.adquirir')
+        limitador.start()
+        self.addCleanup(limitador.stop)
+
+    def test_sincronizacao_para_quando_a_trava_e_perdida(self):
+        from financeiro.nfe.trava import TravaCertificado
+        from financeiro.tasks import sincronizar_certificado_nfe
+
+        trava = TravaCertificado(mock.Mock(), self.certificado.pk, 'Busca automática')
+        client = SefazClient('certificados/teste.pfx', None, CNPJ_FILIAL, '42', ssl_context=ssl.create_default_context())
+        importar_lote = ImportadorNFe.importar_lote
+
+        def importar_e_perder_a_trava(importador, documentos, ult_nsu=None):
+            resultado = importar_lote(importador, documentos, ult_nsu)
+            # O heartbeat encontrou a trava expirada durante o primeiro lote
+            trava.perdida = True
+            return resultado
+
+        def resposta(sessao, url, data=None, **kwargs):
+            nsu = int(data.decode('utf-8').split('<ultNSU>')[1][:15]) + 1
+            conteudo = gerar_proc_nfe(nsu, CNPJ_EMITENTE, CNPJ_FILIAL, itens=1)
+            return _resposta_sefaz('138', [(f'{nsu:015d}', 'procNFe_v4.00.xsd', conteudo)],
+                                   ult_nsu=f'{nsu:015d}', max_nsu='000000000000003')
+
+        with mock.patch('financeiro.nfe.trava.travar_certificado', return_value=trava), \
+                mock.patch('financeiro.nfe.sefaz_client.SefazClient.do_certificado', return_value=client), \
+                mock.patch('requests.Session.post', autospec=True, side_effect=resposta), \
+                mock.patch.object(ImportadorNFe, 'importar_lote', autospec=True, side_effect=importar_e_perder_a_trava):
+            mensagem = sincronizar_certificado_nfe(self.certificado.configuracao_nfe.pk)
+
+        self.assertIn('trava perdida', mensagem)
+        self.assertEqual(NotaFiscal.objects.count(), 1)
+        self.certificado.refresh_from_db()
+        self.assertEqual(self.certificado.ultimo_nsu, '000000000000001')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class GravacaoXMLImportacaoTest(TestCase):
+    """XMLs gravados após o commit; o cursor não passa de notas sem arquivo."""
+
+    def setUp(self):
+        self.certificado = _criar_certificado()
+        self.documentos = [
+            DocumentoDFe(gerar_proc_nfe(numero, CNPJ_EMITENTE, CNPJ_FILIAL, itens=2), nsu=f'{numero:015d}')
+            for numero in range(1, 4)
+        ]
+
+    def test_falha_na_gravacao_nao_avanca_o_cursor_e_e_retomada(self):
+        with mock.patch.object(xml_storage, '_save', side_effect=OSError('disco cheio')):
+            with self.assertRaises(Exception):
+                with self.captureOnCommitCallbacks(execute=True):
+                    ImportadorNFe(self.certificado).importar_lote(self.documentos, '000000000000003')
+
+        # As notas foram confirmadas antes da gravação, mas ficam sem arquivo e o cursor parado
+        self.assertEqual(NotaFiscal.objects.filter(arquivo_xml='').count(), 3)
+        self.certificado.refresh_from_db()
+        self.assertEqual(self.certificado.ultimo_nsu, '000000000000000')
+
+        # Próxima execução: o mesmo lote completa os arquivos e avança o cursor
+        with self.captureOnCommitCallbacks(execute=True):
+            resultado = ImportadorNFe(self.certificado).importar_lote(self.documentos, '000000000000003')
+        self.assertEqual(resultado.importados, 0)
+        self.assertEqual(resultado.duplicados, 3)
+        for nota in NotaFiscal.objects.all():
+            self.assertTrue(nota.arquivo_xml)
+            self.assertTrue(xml_storage.exists(nota.arquivo_xml.name))
+        self.certificado.refresh_from_db()
+        self.assertEqual(self.certificado.ultimo_nsu, '000000000000003')
+
+    def test_rollback_nao_deixa_arquivos(self):
+        with mock.patch.object(xml_storage, 'save', wraps=xml_storage.save) as save:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with self.assertRaises(RuntimeError):
+                    with transaction.atomic():
+                        ImportadorNFe(self.certificado).importar_lote(self.documentos, '000000000000003')
+                        raise RuntimeError('falha depois da importação')
+
+        self.assertEqual(callbacks, [])
+        save.assert_not_called()
+        self.assertFalse(NotaFiscal.objects.exists())
+
+    def test_nota_gravada_por_outra_importacao_nao_e_contada(self):
+        importador = ImportadorNFe(self.certificado)
+        original = importador._preparar
+
+        def preparar_com_corrida(documentos, resultado):
+            candidatas, sem_arquivo = original(documentos, resultado)
+            # Outra importação grava a primeira chave depois da deduplicação
+            outra = ImportadorNFe(self.certificado)
+            outra._gravar_metadados(outra._montar_notas({chave: candidatas[chave] for chave in list(candidatas)[:1]}))
+            return candidatas, sem_arquivo
+
+        with mock.patch.object(importador, '_preparar', side_effect=preparar_com_corrida):
+            with mock.patch.object(xml_storage, 'save', wraps=xml_storage.save) as save:
+                with self.captureOnCommitCallbacks(execute=True):
+                    resultado = importador.importar_lote(self.documentos, '000000000000003')
+
+        self.assertEqual(resultado.importados, 2)
+        self.assertEqual(resultado.duplicados, 1)
+        self.assertEqual(NotaFiscal.objects.count(), 3)
+        # 1 arquivo da outra importação + 2 desta
+        self.assertEqual(save.call_count, 3)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ItensImportacaoTest(TestCase):
+    """Itens (det/prod) saem da mesma leitura do XML que os metadados."""
+
+    def test_cada_documento_e_lido_uma_vez(self):
+        certificado = _criar_certificado()
+        documentos = [
+            DocumentoDFe(gerar_proc_nfe(numero, CNPJ_EMITENTE, CNPJ_FILIAL, itens=3), nsu=f'{numero:015d}')
+            for numero in range(1, 5)
+        ]
+
+        with mock.patch('financeiro.nfe.sefaz_client.etree.fromstring', wraps=etree.fromstring) as fromstring:
+            resultado = ImportadorNFe(certificado).importar_lote(documentos)
+
+        self.assertEqual(fromstring.call_count, len(documentos))
+        self.assertEqual(resultado.itens, 12)
+        self.assertEqual(NotaFiscalItem.objects.count(), 12)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Trava das chaves só existe no PostgreSQL')
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImportacaoConcorrenteTest(TransactionTestCase):
+    """Duas importações da mesma chave: só a que inseriu a nota conta, grava itens e arquivo."""
+
+    def setUp(self):
+        self.certificado = _criar_certificado()
+
+    def _documentos(self, numeros):
+        return [
+            DocumentoDFe(gerar_proc_nfe(numero, CNPJ_EMITENTE, CNPJ_FILIAL, itens=2), nsu=f'{numero:015d}')
+            for numero in numeros
+        ]
+
+    def test_importacao_espera_a_concorrente_e_nao_conta_a_nota_dela(self):
+        travada = threading.Event()
+        liberar = threading.Event()
+
+        def outra_importacao():
+            try:
+                # Insere a primeira chave e segura a transação aberta
+                with transaction.atomic():
+                    ImportadorNFe(self.certificado).importar_lote(self._documentos([1]))
+                    travada.set()
+                    liberar.wait(10)
+            finally:
+                connection.close()
+
+        with mock.patch.object(xml_storage, 'save', wraps=xml_storage.save) as save:
+            outra = threading.Thread(target=outra_importacao)
+            outra.start()
+            self.assertTrue(travada.wait(10))
+
+            # A deduplicação não enxerga a nota ainda não confirmada; a inserção espera o commit
+            temporizador = threading.Timer(0.5, liberar.set)
+            temporizador.start()
+            resultado = ImportadorNFe(self.certificado).importar_lote(self._documentos([1, 2, 3]))
+            outra.join()
+            temporizador.join()
+
+        self.assertEqual(resultado.importados, 2)
+        self.assertEqual(resultado.duplicados, 1)
+        self.assertEqual(resultado.itens, 4)
+        self.assertEqual(NotaFiscal.objects.count(), 3)
+        self.assertEqual(NotaFiscalItem.objects.count(), 6)
+        # Cada arquivo gravado uma vez, pela importação que inseriu a nota
+        self.assertEqual(
+            sorted(chamada.args[0] for chamada in save.call_args_list),
+            sorted(NotaFiscal.objects.values_list('arquivo_xml', flat=True)),
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ExportacaoZipStreamingTest(TestCase):
+    """O ZIP de um lote grande é gerado sem acumular os XMLs em memória."""
+
+    NOTAS = 600
+    # Pico de memória aceito; o ZIP completo passa de 3x isso
+    LIMITE_BYTES = int(2.5 * 1024 * 1024)
+
+    def setUp(self):
+        certificado = _criar_certificado()
+        notas = []
+        for numero in range(1, self.NOTAS + 1):
+            conteudo = gerar_proc_nfe(numero, CNPJ_EMITENTE, CNPJ_FILIAL, itens=250)
+            chave = f'{numero:044d}'
+            nome = xml_storage.save(caminho_xml(chave), ContentFile(conteudo))
+            notas.append(NotaFiscal(
+                empresa=certificado.empresa, filial=certificado.filial, chave_acesso=chave,
+                numero=str(numero), serie='1', data_emissao=timezone.now(), emitente_cnpj=CNPJ_EMITENTE,
+                emitente_nome='EMITENTE', valor_total=1, valor_liquido=1, arquivo_xml=nome,
+            ))
+        NotaFiscal.objects.bulk_create(notas)
+
+    def test_pico_de_memoria_nao_cresce_com_o_lote(self):
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            inicio, _ = tracemalloc.get_traced_memory()
+
+            # Destino que descarta as partes, como a resposta ao cliente
+            total = 0
+            for parte in gerar_zip_xmls(NotaFiscal.objects.all()):
+                total += len(parte)
+
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertGreater(total, 3 * self.LIMITE_BYTES)
+        self.assertLess(pico - inicio, self.LIMITE_BYTES)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DownloadMassaTest(TestCase):
+    """Download em massa com ?todas=1 (todas as notas do filtro da lista)."""
+
+    def setUp(self):
+        from django.contrib.auth.models import Group
+        from accounts.models import User
+
+        certificado = _criar_certificado()
+        usuario = User.objects.create_user(
+            username='financeiro', email='financeiro@teste.com', password='x', empresa=certificado.empresa
+        )
+        usuario.groups.add(Group.objects.create(name='Financeiro'))
+        self.client.force_login(usuario)
+
+        chave = f'{1:044d}'
+        NotaFiscal.objects.create(
+            empresa=certificado.empresa, filial=certificado.filial, chave_acesso=chave, numero='1', serie='1',
+            data_emissao=timezone.now(), emitente_cnpj=CNPJ_EMITENTE, emitente_nome='EMITENTE',
+            valor_total=1, valor_liquido=1,
+            arquivo_xml=xml_storage.save(caminho_xml(chave), ContentFile(gerar_proc_nfe(1, CNPJ_EMITENTE, CNPJ_FILIAL))),
+        )
+
+    def _get(self, parametros):
+        return self.client.get(reverse('nfe_download_massa'), parametros)
+
+    def test_filtro_invalido_nao_exporta_tudo(self):
+        resposta = self._get({'todas': '1', 'periodo': 'personalizado', 'data_inicio': '31/02/2026'})
+
+        self.assertEqual(resposta.status_code, 302)
+        self.assertTrue(resposta.url.startswith(reverse('nfe_lista') + '?'))
+        self.assertNotIn('todas', resposta.url)
+        self.assertIn('data_inicio', resposta.url)
+
+    def test_sem_filtros_exporta_como_a_lista_sem_filtros(self):
+        resposta = self._get({'todas': '1'})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta['Content-Type'], 'application/zip')
+        self.assertTrue(b''.join(resposta.streaming_content).startswith(b'PK'))
+
+
+class BuscaEmitenteTest(TestCase):
+    """Lookup __busca e filtro de emitente da lista de NF-e."""
+
+    EMITENTES = [
+        ('11222333000181', 'COMERCIO DE ALIMENTOS SILVA LTDA'),
+        ('44555666000172', 'Distribuidora Silveira'),
+        ('77888999000163', 'POSTO 100% BRASIL'),
+        ('12345678000195', 'FERRAGENS_CENTRAL'),
+    ]
+
+    def setUp(self):
+        certificado = _criar_certificado()
+        self.empresa = certificado.empresa
+        NotaFiscal.objects.bulk_create([
+            NotaFiscal(
+                empresa=certificado.empresa, filial=certificado.filial, chave_acesso=f'{numero:044d}',
+                numero=str(numero), serie='1', data_emissao=timezone.now(), emitente_cnpj=cnpj,
+                emitente_nome=nome, valor_total=1, valor_liquido=1, arquivo_xml='',
+            )
+            for numero, (cnpj, nome) in enumerate(self.EMITENTES, start=1)
+        ])
+
+    def test_busca_equivale_a_icontains(self):
+        # Sem acentos nos dados, __busca e __icontains encontram o mesmo (em qualquer banco)
+        for termo in ['silva', 'SILV', 'distribuidora silveira', '100%', '_', 'S_LVA', 'inexistente']:
+            with self.subTest(termo=termo):
+                self.assertQuerysetEqual(
+                    NotaFiscal.objects.filter(emitente_nome__busca=termo).order_by('pk'),
+                    NotaFiscal.objects.filter(emitente_nome__icontains=termo).order_by('pk'),
+                )
+
+    def _filtrar(self, emitente):
+        form = FiltroNotasFiscaisForm({'periodo': 'personalizado', 'emitente': emitente}, empresa=self.empresa)
+        return form.filtrar(NotaFiscal.objects.filter(empresa=self.empresa))
+
+    def test_emitente_por_nome_ou_cnpj(self):
+        self.assertEqual(set(self._filtrar('silv').values_list('emitente_cnpj', flat=True)),
+                         {'11222333000181', '44555666000172'})
+        self.assertEqual(list(self._filtrar('44.555.666/0001').values_list('emitente_cnpj', flat=True)),
+                         ['44555666000172'])
+
+    def test_emitente_so_com_pontuacao_nao_encontra_tudo(self):
+        self.assertFalse(self._filtrar('./-').exists())
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Os índices verificados só existem no PostgreSQL')
+class PlanosConsultaTest(TestCase):
+    """
+    EXPLAIN das consultas que dependem dos índices, sobre a mesma base sintética do
+    comando verificar_planos_consulta (em escala menor). Sem varredura sequencial,
+    a tabela pequena não dispensa os índices.
+    """
+
+    LINHAS = 20000
+    EMPRESAS = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        from financeiro.management.commands.verificar_planos_consulta import Command
+
+        cls.empresa = Command(stdout=io.StringIO())._gerar_dados(cls.LINHAS, cls.EMPRESAS)
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsaIndice(self, queryset, *indices):
+        plano = queryset.explain()
+        self.assertTrue(any(indice in plano for indice in indices), f"Nenhum de {indices} no plano:\n{plano}")
+
+    def test_busca_usa_indices_de_trigramas(self):
+        from financeiro.management.commands.verificar_planos_consulta import TERMO_RARO
+
+        self.assertUsaIndice(NotaFiscal.objects.filter(emitente_nome__busca=TERMO_RARO), 'nfe_emitente_nome_trgm')
+        self.assertUsaIndice(NotaFiscal.objects.filter(emitente_cnpj__contains='98765432'), 'nfe_emitente_cnpj_trgm')
+        # Filtro de emitente da lista: nome OU CNPJ, cada lado no seu índice
+        form = FiltroNotasFiscaisForm({'periodo': 'personalizado', 'emitente': TERMO_RARO})
+        plano = form.filtrar(NotaFiscal.objects.all()).explain()
+        self.assertIn('nfe_emitente_nome_trgm', plano)
+        self.assertIn('nfe_emitente_cnpj_trgm', plano)
+
+    def test_consultas_por_empresa_usam_indices_compostos(self):
+        from financeiro.management.commands.verificar_planos_consulta import Command
+
+        # Casos do comando verificar_planos_consulta (listas, dashboard, tarefas, admin),
+        # exceto as buscas por texto, verificadas acima
+        for descricao, queryset, indices in Command()._consultas(self.empresa):
+            if any(indice.endswith('_trgm') for indice in indices):
+                continue
+            with self.subTest(descricao):
+                self.assertUsaIndice(queryset, *indices)
+
+
+class FiltrosAplicadosTest(SimpleTestCase):
+    """Chave da contagem em cache da lista de NF-e."""
+
+    def _filtros(self, dados, hoje):
+        with mock.patch('financeiro.nfe.forms.timezone.localdate', return_value=hoje):
+            return FiltroNotasFiscaisForm(dados).filtros_aplicados()
+
+    def test_periodo_relativo_muda_com_o_dia(self):
+        ontem = self._filtros({'periodo': '30dias'}, date(2026, 10, 17))
+        hoje = self._filtros({'periodo': '30dias'}, date(2026, 10, 18))
+        self.assertNotEqual(ontem, hoje)
+        self.assertEqual(hoje['intervalo'], (date(2026, 9, 18), None))
+
+    def test_periodo_personalizado_nao_depende_do_dia(self):
+        dados = {'periodo': 'personalizado', 'data_inicio': '2026-01-01', 'data_fim': '2026-01-31'}
+        self.assertEqual(self._filtros(dados, date(2026, 10, 17)), self._filtros(dados, date(2026, 10, 18)))
+
+
+class CompressaoZstdTest(SimpleTestCase):
+    """zstd configurado sem o pacote zstandard: aviso no system check e gzip na gravação."""
+
+    @override_settings(NFE_XML_COMPRESSAO='zstd')
+    def test_sem_zstandard_avisa_no_check_e_grava_gzip(self):
+        from financeiro.nfe import armazenamento
+
+        with mock.patch.object(armazenamento, 'zstandard', None):
+            avisos = armazenamento.verificar_zstandard(None)
+            formato = armazenamento.formato_compressao()
+
+        self.assertEqual([aviso.id for aviso in avisos], ['financeiro.W001'])
+        self.assertEqual(formato, 'gzip')
+
+    @override_settings(NFE_XML_COMPRESSAO='gzip')
+    def test_gzip_nao_avisa(self):
+        from financeiro.nfe import armazenamento
+
+        with mock.patch.object(armazenamento, 'zstandard', None):
+            self.assertEqual(armazenamento.verificar_zstandard(None), [])
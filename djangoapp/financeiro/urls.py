@@ -28,6 +28,8 @@ urlpatterns = [
 
     # Consulta e gestão de NF-e
     path('nfe/consultar/', nfe_views.nfe_consultar, name='nfe_consultar'),
+    path('nfe/consultar/<int:pk>/', nfe_views.nfe_consulta_status, name='nfe_consulta_status'),
+    path('nfe/consultar/<int:pk>/progresso/', nfe_views.nfe_consulta_progresso, name='nfe_consulta_progresso'),
     path('nfe/lista/', nfe_views.nfe_lista, name='nfe_lista'),
     path('nfe/<int:pk>/', nfe_views.nfe_detalhes, name='nfe_detalhes'),
     path('nfe/<int:pk>/deletar/', nfe_views.nfe_deletar, name='nfe_deletar'),
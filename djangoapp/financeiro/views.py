@@ -5,11 +5,12 @@ import os
 from decimal import Decimal
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import FileResponse, Http404
+from django.http import Http404
 from .forms import ContaPagarForm
 from .models import Filial, Transacao, Fornecedor, TipoPagamento, ContaPagar, RelatorioFaturamentoMensal
 from financeiro.contas.incluir_contas import _importar_csv, _importar_xml
 from core.decorators import grupos_necessarios
+from core.downloads import servir_arquivo
 from .forms import ConciliacaoForm, ContaOFXForm
 from .utils import processar_ofx
 from .recorrencia import criar_contas_recorrentes
@@ -108,10 +109,11 @@ def listar_contas_pagar(request):
     # Campos texto
     documento = request.GET.get('documento')
     numero_notas = request.GET.get('numero_notas')
+    # __busca: ignora maiúsculas e acentos e usa os índices de trigramas
     if documento:
-        contas = contas.filter(documento__icontains=documento)
+        contas = contas.filter(documento__busca=documento)
     if numero_notas:
-        contas = contas.filter(numero_notas__icontains=numero_notas)
+        contas = contas.filter(numero_notas__busca=numero_notas)
 
     # Datas
     vencimento_de = request.GET.get('vencimento_de')
@@ -340,7 +342,9 @@ def download_relatorio_faturamento(request, relatorio_id):
     - Requer autenticação (@login_required)
     - Requer grupo Administrador, Financeiro ou Gestor
     - Valida que o relatório pertence à empresa do usuário
-    - Serve arquivo via Django (não expõe caminho direto)
+    - Serve arquivo via Django ou, com DOWNLOAD_MODO, via X-Accel-Redirect /
+      X-Sendfile (nunca expõe caminho direto)
+    - ETag / Last-Modified e Range: downloads interrompidos podem ser retomados
     """
     relatorio = get_object_or_404(
         RelatorioFaturamentoMensal,
@@ -352,11 +356,4 @@ def download_relatorio_faturamento(request, relatorio_id):
         raise Http404("Arquivo não encontrado.")
 
     # Retorna o arquivo para download de forma segura
-    response = FileResponse(relatorio.arquivo_zip.open('rb'), as_attachment=True)
-    response['Content-Disposition'] = f'attachment; filename="{os.path.basename(relatorio.arquivo_zip.name)}"'
-
-    # Headers de segurança adicionais
-    response['X-Content-Type-Options'] = 'nosniff'
-    response['Content-Type'] = 'application/zip'
-
-    return response
+    return servir_arquivo(request, relatorio.arquivo_zip, content_type='application/zip')
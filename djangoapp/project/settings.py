@@ -146,3 +146,67 @@ CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_BACKEND = None  # se não for usar resultados
+
+# Cache (por processo) do material dos certificados digitais da NF-e
+NFE_CERTIFICADO_CACHE_MAX_ENTRADAS = int(os.getenv('NFE_CERTIFICADO_CACHE_MAX_ENTRADAS', 32))
+NFE_CERTIFICADO_CACHE_TTL = int(os.getenv('NFE_CERTIFICADO_CACHE_TTL', 3600))  # segundos
+
+# Fila dedicada das tasks que consultam a SEFAZ (sincronização por certificado e consulta manual)
+# Worker: celery -A project worker -Q nfe --prefetch-multiplier=1 --concurrency=8
+# O --concurrency dos workers desta fila é o limite global de certificados consultando a SEFAZ
+# ao mesmo tempo. Não há limite por UF: o NFeDistribuicaoDFe é atendido pelo Ambiente Nacional
+# para todas as UFs (ver SefazClient.URLS_SEFAZ), e cada CNPJ já passa pelo limitador_sefaz.
+NFE_SYNC_FILA = os.getenv('NFE_SYNC_FILA', 'nfe')
+NFE_SYNC_EXPIRACAO = int(os.getenv('NFE_SYNC_EXPIRACAO', 4 * 3600))  # segundos na fila antes de descartar
+CELERY_TASK_ROUTES = {
+    'Sincronizar NF-e do certificado': {'queue': NFE_SYNC_FILA},
+    'Consultar NF-e manualmente': {'queue': NFE_SYNC_FILA},
+}
+
+# Busca histórica de NF-e: lotes distNSU (até 50 documentos cada) por execução da task de 30 minutos
+NFE_HISTORICO_LOTES_POR_EXECUCAO = int(os.getenv('NFE_HISTORICO_LOTES_POR_EXECUCAO', 20))
+
+# Importação de NF-e: máximo de notas inseridas por transação (transações curtas, sem rede)
+NFE_IMPORTACAO_MAX_POR_TRANSACAO = int(os.getenv('NFE_IMPORTACAO_MAX_POR_TRANSACAO', 200))
+
+# Resolução de resumos (resNFe): consultas simultâneas
+NFE_RESOLVER_MAX_WORKERS = int(os.getenv('NFE_RESOLVER_MAX_WORKERS', 4))
+
+# Limite de consultas à SEFAZ por CNPJ (token bucket no Redis) e bloqueio após 656
+NFE_RATE_LIMIT_REDIS_URL = os.getenv('NFE_RATE_LIMIT_REDIS_URL', CELERY_BROKER_URL)
+NFE_RATE_LIMIT_CAPACIDADE = int(os.getenv('NFE_RATE_LIMIT_CAPACIDADE', 10))
+NFE_RATE_LIMIT_POR_MINUTO = float(os.getenv('NFE_RATE_LIMIT_POR_MINUTO', 20))
+NFE_RATE_LIMIT_ESPERA_MAXIMA = float(os.getenv('NFE_RATE_LIMIT_ESPERA_MAXIMA', 120))  # segundos
+NFE_BLOQUEIO_656_SEGUNDOS = int(os.getenv('NFE_BLOQUEIO_656_SEGUNDOS', 3600))
+
+# Trava por certificado (Redis) que impede sincronizações simultâneas do mesmo certificado.
+# A trava expira em NFE_TRAVA_TTL segundos se o processo morrer; consultas manuais que
+# encontram a trava ocupada voltam para a fila a cada NFE_TRAVA_REENFILEIRAR_SEGUNDOS
+NFE_TRAVA_REDIS_URL = os.getenv('NFE_TRAVA_REDIS_URL', NFE_RATE_LIMIT_REDIS_URL)
+NFE_TRAVA_TTL = int(os.getenv('NFE_TRAVA_TTL', 120))
+NFE_TRAVA_REENFILEIRAR_SEGUNDOS = int(os.getenv('NFE_TRAVA_REENFILEIRAR_SEGUNDOS', 60))
+NFE_TRAVA_ESPERA_MAXIMA = int(os.getenv('NFE_TRAVA_ESPERA_MAXIMA', 3600))  # segundos
+
+# Endpoint alternativo do NFeDistribuicaoDFe (ex.: simulador local: python manage.py simular_sefaz)
+# e CA usada para validar o servidor. Vazio = SEFAZ real da UF
+NFE_SEFAZ_URL = os.getenv('NFE_SEFAZ_URL', '')
+NFE_SEFAZ_CA_BUNDLE = os.getenv('NFE_SEFAZ_CA_BUNDLE', '')
+
+# Armazenamento dos XMLs de NF-e: 'gzip' ou 'zstd' (zstd exige o pacote zstandard)
+NFE_XML_COMPRESSAO = os.getenv('NFE_XML_COMPRESSAO', 'gzip')
+NFE_XML_NIVEL_GZIP = int(os.getenv('NFE_XML_NIVEL_GZIP', 6))
+NFE_XML_NIVEL_ZSTD = int(os.getenv('NFE_XML_NIVEL_ZSTD', 3))
+
+# Threads que gravam os XMLs de NF-e no storage após o commit de cada grupo de notas
+# (o cursor de NSU do lote só avança depois que os XMLs foram gravados)
+NFE_XML_GRAVACAO_WORKERS = int(os.getenv('NFE_XML_GRAVACAO_WORKERS', 4))
+
+# Lista de notas fiscais: notas por página e validade (segundos) do total por filtro em cache
+NFE_LISTA_POR_PAGINA = int(os.getenv('NFE_LISTA_POR_PAGINA', 50))
+NFE_LISTA_CACHE_CONTAGEM = int(os.getenv('NFE_LISTA_CACHE_CONTAGEM', 60))
+
+# Downloads protegidos (relatórios de faturamento, XMLs): 'django' envia pelo próprio Django;
+# 'nginx' responde com X-Accel-Redirect para DOWNLOAD_ACCEL_PREFIXO (location `internal`
+# com alias para o MEDIA_ROOT); 'sendfile' responde com X-Sendfile (Apache/lighttpd)
+DOWNLOAD_MODO = os.getenv('DOWNLOAD_MODO', 'django')
+DOWNLOAD_ACCEL_PREFIXO = os.getenv('DOWNLOAD_ACCEL_PREFIXO', '/protegido/')